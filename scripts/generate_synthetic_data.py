@@ -0,0 +1,216 @@
+# scripts/generate_synthetic_data.py
+"""
+Writes a synthetic Telegram data lake for benchmarks: JSONL partitions shaped like Telethon's
+message.to_dict() (serialized the way the scraper does, json.dumps(default=str)) and JPEG photos,
+laid out as data/raw/{telegram_messages,images}/YYYY-MM-DD/<channel> under the output root.
+
+Output is deterministic for a given seed and scale, so runs can be compared.
+
+    python -m scripts.generate_synthetic_data --messages 1000000 --output data/benchmark
+"""
+import argparse
+import json
+import os
+import random
+import time
+from datetime import date, datetime, timedelta, timezone
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_OUTPUT = os.path.join(PROJECT_ROOT, "data", "benchmark")
+FIRST_CHANNEL_ID = 1_000_000_000
+
+PRODUCTS = [
+    "Paracetamol 500mg", "Amoxicillin 250mg", "Ibuprofen 400mg", "Vitamin C 1000mg", "Omeprazole 20mg",
+    "Metformin 850mg", "Cetirizine 10mg", "Azithromycin 500mg", "Sunscreen SPF 50", "Face cream",
+    "Body lotion", "Hair oil", "Shampoo", "Baby diapers", "Hand sanitizer", "Blood pressure monitor",
+    "Glucometer", "Insulin pen", "Face mask", "Zinc tablets", "Multivitamin syrup", "Cough syrup",
+]
+PHRASES = [
+    "አዲስ እቃ ገብቷል", "available now", "limited stock", "ዋጋ", "free delivery in Addis Ababa",
+    "original product", "call us", "በጅምላ እና በችርቻሮ", "new arrival", "order now", "ለማዘዝ",
+]
+
+def channel_weights(channels: int, rng: random.Random) -> list:
+    """Zipf-like share of messages per channel: a few busy channels and a long tail."""
+    weights = [1 / (rank + 1) for rank in range(channels)]
+    rng.shuffle(weights)
+    total = sum(weights)
+    return [w / total for w in weights]
+
+def split_evenly(total: int, parts: int) -> list:
+    return [total // parts + (1 if i < total % parts else 0) for i in range(parts)]
+
+def message_text(rng: random.Random) -> str:
+    product = rng.choice(PRODUCTS)
+    price = rng.choice([50, 120, 250, 350, 480, 750, 1200, 2500, 4800])
+    parts = [product, rng.choice(PHRASES), f"ዋጋ {price} ብር" if rng.random() < 0.5 else f"Price: {price} ETB"]
+    if rng.random() < 0.4:
+        parts.append(f"📞 09{rng.randint(10, 99)} {rng.randint(100000, 999999)}")
+    if rng.random() < 0.3:
+        parts.append(rng.choice(PHRASES))
+    return "\n".join(parts)
+
+def message_dict(rng: random.Random, message_id: int, channel_id: int, posted_at: datetime, with_photo: bool) -> dict:
+    """A dict with the keys and nesting of telethon.tl.types.Message.to_dict() for a channel post."""
+    media = None
+    if with_photo:
+        photo_id = rng.getrandbits(62)
+        media = {
+            "_": "MessageMediaPhoto",
+            "spoiler": False,
+            "photo": {
+                "_": "Photo",
+                "id": photo_id,
+                "access_hash": rng.getrandbits(62),
+                "file_reference": rng.randbytes(16),
+                "date": posted_at,
+                "sizes": [
+                    {"_": "PhotoStrippedSize", "type": "i", "bytes": rng.randbytes(24)},
+                    {"_": "PhotoSize", "type": "m", "w": 320, "h": 320, "size": rng.randint(15000, 30000)},
+                    {"_": "PhotoSizeProgressive", "type": "y", "w": 1280, "h": 1280,
+                     "sizes": [10000, 40000, 90000, rng.randint(120000, 250000)]},
+                ],
+                "dc_id": 4,
+                "has_stickers": False,
+                "video_sizes": [],
+            },
+            "ttl_seconds": None,
+        }
+    return {
+        "_": "Message",
+        "id": message_id,
+        "peer_id": {"_": "PeerChannel", "channel_id": channel_id},
+        "date": posted_at,
+        "message": message_text(rng),
+        "out": False,
+        "mentioned": False,
+        "media_unread": False,
+        "silent": False,
+        "post": True,
+        "from_scheduled": False,
+        "legacy": False,
+        "edit_hide": False,
+        "pinned": False,
+        "noforwards": False,
+        "invert_media": False,
+        "offline": False,
+        "from_id": None,
+        "fwd_from": None,
+        "via_bot_id": None,
+        "reply_to": None,
+        "media": media,
+        "reply_markup": None,
+        "entities": [],
+        "views": int(rng.paretovariate(1.5) * 200),
+        "forwards": rng.randint(0, 40),
+        "replies": None,
+        "edit_date": None,
+        "post_author": None,
+        "grouped_id": None,
+        "reactions": None,
+        "restriction_reason": [],
+        "ttl_period": None,
+    }
+
+def write_image(path: str, rng: random.Random, size: int):
+    """Draws a random product-shot-like JPEG (background, boxes and circles) with OpenCV."""
+    import cv2
+    import numpy as np
+
+    height = size
+    width = int(size * rng.uniform(0.75, 1.33))
+    image = np.full((height, width, 3), [rng.randint(150, 255) for _ in range(3)], dtype=np.uint8)
+    for _ in range(rng.randint(2, 6)):
+        color = [rng.randint(0, 255) for _ in range(3)]
+        x, y = rng.randint(0, width - 1), rng.randint(0, height - 1)
+        if rng.random() < 0.5:
+            cv2.rectangle(image, (x, y), (x + rng.randint(20, width // 2), y + rng.randint(20, height // 2)), color, -1)
+        else:
+            cv2.circle(image, (x, y), rng.randint(10, size // 4), color, -1)
+    noise = np.frombuffer(rng.randbytes(height * width * 3), dtype=np.uint8).reshape(height, width, 3)
+    image = cv2.addWeighted(image, 0.9, noise, 0.1, 0)
+    cv2.imwrite(path, image, [cv2.IMWRITE_JPEG_QUALITY, 85])
+
+def generate(output_root: str = DEFAULT_OUTPUT, messages: int = 10_000, channels: int = 20, days: int = 30,
+             start_date: date = date(2025, 1, 1), photo_ratio: float = 0.3, max_images: int = 1000,
+             image_size: int = 640, seed: int = 42) -> dict:
+    """
+    Generates `messages` messages spread over `channels` channels and `days` days, one JSONL file per
+    (day, channel), streaming one file at a time. Photos are written for the first `max_images`
+    photo messages (0 = none); the rest keep their media entry without a file. Returns a summary.
+    """
+    rng = random.Random(seed)
+    messages_root = os.path.join(output_root, "raw", "telegram_messages")
+    images_root = os.path.join(output_root, "raw", "images")
+    weights = channel_weights(channels, rng)
+    channel_totals = [round(messages * w) for w in weights]
+    channel_totals[0] += messages - sum(channel_totals)
+    per_day = [split_evenly(total, days) for total in channel_totals]
+    next_ids = [1] * channels
+
+    start_time = time.perf_counter()
+    written = files = images = bytes_written = 0
+    for day_index in range(days):
+        day = start_date + timedelta(days=day_index)
+        day_start = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+        for channel_index in range(channels):
+            count = per_day[channel_index][day_index]
+            if not count:
+                continue
+            channel_name = f"bench_channel_{channel_index:03d}"
+            channel_id = FIRST_CHANNEL_ID + channel_index
+            partition_dir = os.path.join(messages_root, day.isoformat())
+            os.makedirs(partition_dir, exist_ok=True)
+            file_path = os.path.join(partition_dir, f"{channel_name}.jsonl")
+            offsets = sorted(rng.randrange(86400) for _ in range(count))
+            with open(file_path, "w", encoding="utf-8") as f:
+                for offset in offsets:
+                    message_id = next_ids[channel_index]
+                    next_ids[channel_index] += 1
+                    with_photo = rng.random() < photo_ratio
+                    record = message_dict(rng, message_id, channel_id, day_start + timedelta(seconds=offset), with_photo)
+                    f.write(json.dumps(record, default=str) + "\n")
+                    if with_photo and images < max_images:
+                        image_dir = os.path.join(images_root, day.isoformat(), channel_name)
+                        os.makedirs(image_dir, exist_ok=True)
+                        write_image(os.path.join(image_dir, f"{message_id}.jpg"), rng, image_size)
+                        images += 1
+            written += count
+            files += 1
+            bytes_written += os.path.getsize(file_path)
+
+    elapsed = time.perf_counter() - start_time
+    summary = {
+        "output_root": output_root, "messages": written, "files": files, "images": images,
+        "jsonl_bytes": bytes_written, "channels": channels, "days": days, "seed": seed, "seconds": round(elapsed, 2),
+    }
+    print(f"Generated {written} messages in {files} files ({bytes_written / 2**20:.1f} MiB) and {images} images "
+          f"in {elapsed:.1f}s under {output_root}.")
+    return summary
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate a synthetic Telegram data lake for benchmarks.")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="Root folder; data is written under <output>/raw.")
+    parser.add_argument("--messages", type=int, default=10_000, help="Total messages, e.g. 10000, 1000000, 10000000.")
+    parser.add_argument("--channels", type=int, default=20, help="Number of channels.")
+    parser.add_argument("--days", type=int, default=30, help="Number of daily partitions.")
+    parser.add_argument("--start-date", type=date.fromisoformat, default=date(2025, 1, 1), help="First day (YYYY-MM-DD).")
+    parser.add_argument("--photo-ratio", type=float, default=0.3, help="Share of messages with a photo.")
+    parser.add_argument("--max-images", type=int, default=1000, help="Photo files to write (0 = none).")
+    parser.add_argument("--image-size", type=int, default=640, help="Height of generated photos in pixels.")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed; the same seed gives the same data.")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    print(json.dumps(generate(
+        output_root=args.output,
+        messages=args.messages,
+        channels=args.channels,
+        days=args.days,
+        start_date=args.start_date,
+        photo_ratio=args.photo_ratio,
+        max_images=args.max_images,
+        image_size=args.image_size,
+        seed=args.seed,
+    )))
@@ -0,0 +1,468 @@
+# scripts/run_benchmarks.py
+"""
+Benchmarks the pipeline stages and the API on a synthetic data lake (see generate_synthetic_data.py)
+against a local Postgres container, and writes the results as JSON so runs can be compared.
+
+    docker-compose up -d db
+    python -m scripts.generate_synthetic_data --messages 1000000
+    python -m scripts.run_benchmarks run --suites loader,dbt,yolo,api
+    python -m scripts.run_benchmarks compare data/benchmarks/<before>.json data/benchmarks/<after>.json
+
+Everything runs in a separate database (BENCH_POSTGRES_DB, default telegram_bench), which is
+created if needed; the loader suite truncates its raw tables before each variant.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import psycopg2
+from psycopg2 import sql
+from dotenv import load_dotenv
+
+from scripts.generate_synthetic_data import DEFAULT_OUTPUT as DEFAULT_LAKE_ROOT
+from src import instrumentation
+
+load_dotenv()
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+DB_USER = os.getenv("POSTGRES_USER")
+DB_PASSWORD = os.getenv("POSTGRES_PASSWORD")
+ADMIN_DB_NAME = os.getenv("POSTGRES_DB", "postgres")
+BENCH_DB_HOST = os.getenv("BENCH_POSTGRES_HOST", "localhost")
+BENCH_DB_PORT = os.getenv("BENCH_POSTGRES_PORT", "5432")
+BENCH_DB_NAME = os.getenv("BENCH_POSTGRES_DB", "telegram_bench")
+RESULTS_PATH = PROJECT_ROOT / "data" / "benchmarks"
+SUITES = ("loader", "dbt", "yolo", "api")
+
+def connect(dbname: str = BENCH_DB_NAME):
+    return psycopg2.connect(dbname=dbname, user=DB_USER, password=DB_PASSWORD, host=BENCH_DB_HOST, port=BENCH_DB_PORT)
+
+def ensure_database(dbname: str = BENCH_DB_NAME):
+    """Creates the benchmark database on the local server if it does not exist."""
+    conn = connect(ADMIN_DB_NAME)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1 FROM pg_database WHERE datname = %s;", (dbname,))
+            if cur.fetchone() is None:
+                cur.execute(sql.SQL("CREATE DATABASE {};").format(sql.Identifier(dbname)))
+                print(f"Created benchmark database '{dbname}'.")
+    finally:
+        conn.close()
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))]
+
+def result(benchmark: str, variant: str, **metrics) -> dict:
+    record = {"benchmark": benchmark, "variant": variant, **metrics}
+    print(json.dumps(record))
+    return record
+
+# --- Loader ---
+
+def bench_loader(lake_root: Path, modes: list, workers: int, batch_size: int) -> list:
+    """Loads every JSONL file once per mode into an emptied raw_telegram.messages."""
+    from src import load_raw_data
+
+    # Passed explicitly (never through load_raw_data's globals), so spawned workers can't fall
+    # back to the real POSTGRES_DB
+    conn_params = {
+        "dbname": BENCH_DB_NAME, "user": DB_USER, "password": DB_PASSWORD, "host": BENCH_DB_HOST, "port": BENCH_DB_PORT,
+    }
+    data_lake_path = lake_root / "raw" / "telegram_messages"
+    files = sorted(data_lake_path.glob("*/*.jsonl"))
+    total_bytes = sum(f.stat().st_size for f in files)
+
+    results = []
+    for mode in modes:
+        conn = connect()
+        try:
+            load_raw_data.create_raw_table(conn)
+            with conn.cursor() as cur:
+                cur.execute("TRUNCATE raw_telegram.messages, raw_telegram.load_manifest;")
+            conn.commit()
+
+            start_time = time.perf_counter()
+            if mode == "insert":
+                for file_path in files:
+                    load_raw_data.load_jsonl_to_db(conn, file_path)
+            elif mode == "copy":
+                for file_path in files:
+                    load_raw_data.bulk_load_jsonl_to_db(conn, file_path, batch_size=batch_size)
+            else:
+                load_raw_data.load_files_in_parallel(
+                    files, workers, batch_size=batch_size, force=True,
+                    conn_params=conn_params, data_lake_path=data_lake_path,
+                )
+            elapsed = time.perf_counter() - start_time
+
+            with conn.cursor() as cur:
+                cur.execute("SELECT count(*) FROM raw_telegram.messages;")
+                rows = cur.fetchone()[0]
+        finally:
+            conn.close()
+        results.append(result(
+            "loader", mode, files=len(files), rows=rows, seconds=round(elapsed, 3),
+            rows_per_sec=round(instrumentation.rate(rows, elapsed), 1),
+            mib_per_sec=round(instrumentation.rate(total_bytes / 2**20, elapsed), 2),
+            batch_size=batch_size, workers=workers if mode == "parallel" else 1,
+        ))
+    return results
+
+# --- dbt ---
+
+DBT_PROFILE = """
+telegram_analytics:
+  target: bench
+  outputs:
+    bench:
+      type: postgres
+      host: {host}
+      port: {port}
+      user: "{{{{ env_var('POSTGRES_USER') }}}}"
+      password: "{{{{ env_var('POSTGRES_PASSWORD') }}}}"
+      dbname: {dbname}
+      schema: dbt_schema
+      threads: {threads}
+"""
+
+def bench_dbt(threads: int) -> list:
+    """Times a full-refresh build and an incremental run with no new rows, per model."""
+    from src import yolo_enrichment
+
+    conn = connect()
+    try:
+        # fct_image_detections reads this source table even when no detections were loaded
+        yolo_enrichment.create_detections_table(conn)
+    finally:
+        conn.close()
+
+    project_dir = PROJECT_ROOT / "telegram_analytics"
+    results = []
+    with tempfile.TemporaryDirectory() as profiles_dir:
+        with open(os.path.join(profiles_dir, "profiles.yml"), "w", encoding="utf-8") as f:
+            f.write(DBT_PROFILE.format(host=BENCH_DB_HOST, port=BENCH_DB_PORT, dbname=BENCH_DB_NAME, threads=threads))
+        for variant, extra_args in (("full_refresh", ["--full-refresh"]), ("incremental_noop", [])):
+            command = ["dbt", "run", "--profiles-dir", profiles_dir, "--target", "bench", *extra_args]
+            start_time = time.perf_counter()
+            completed = subprocess.run(command, cwd=str(project_dir), capture_output=True, text=True)
+            elapsed = time.perf_counter() - start_time
+            if completed.returncode != 0:
+                print(completed.stdout[-4000:], completed.stderr[-4000:])
+                results.append(result("dbt", variant, error=f"dbt run exited with {completed.returncode}"))
+                continue
+            model_seconds = instrumentation.record_dbt_run_results(str(project_dir / "target" / "run_results.json"))
+            results.append(result(
+                "dbt", variant, seconds=round(elapsed, 3), threads=threads,
+                model_seconds={model: round(seconds, 3) for model, seconds in model_seconds.items()},
+            ))
+    return results
+
+# --- YOLO ---
+
+def _box_iou(a: list, b: list) -> float:
+    width = min(a[2], b[2]) - max(a[0], b[0])
+    height = min(a[3], b[3]) - max(a[1], b[1])
+    if width <= 0 or height <= 0:
+        return 0.0
+    intersection = width * height
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection
+    return intersection / union if union > 0 else 0.0
+
+def match_detections(reference_rows: list, rows: list, iou_threshold: float = 0.5) -> dict:
+    """
+    Scores detection rows against a reference backend's rows for the same images: a row matches
+    an unmatched reference box of the same class in the same image with IoU >= `iou_threshold`
+    (greedily, most confident first). Returns agreement metrics treating the reference as truth.
+    """
+    by_image = {}
+    for row in reference_rows:
+        by_image.setdefault(row[0], []).append(row)
+    matched, ious, confidence_errors = 0, [], []
+    for row in sorted(rows, key=lambda r: -r[5]):
+        candidates = by_image.get(row[0], [])
+        best_index, best_iou = None, iou_threshold
+        for i, reference in enumerate(candidates):
+            if reference[3] == row[3]:
+                iou = _box_iou(reference[6], row[6])
+                if iou >= best_iou:
+                    best_index, best_iou = i, iou
+        if best_index is not None:
+            reference = candidates.pop(best_index)
+            matched += 1
+            ious.append(best_iou)
+            confidence_errors.append(abs(reference[5] - row[5]))
+    return {
+        "precision_vs_torch": round(matched / len(rows), 4) if rows else 1.0,
+        "recall_vs_torch": round(matched / len(reference_rows), 4) if reference_rows else 1.0,
+        "mean_iou_vs_torch": round(sum(ious) / len(ious), 4) if ious else 0.0,
+        "confidence_mae_vs_torch": round(sum(confidence_errors) / len(confidence_errors), 4) if confidence_errors else 0.0,
+    }
+
+def bench_yolo(lake_root: Path, limit: int, batch_size: int, image_size: int, workers: int, loader_threads: int,
+               backends: list) -> list:
+    """
+    Measures in-process latency/throughput on one model and the multi-process run_detection path
+    for each detector backend, and scores every other backend's detections against torch's.
+    """
+    from src import detectors, yolo_enrichment
+
+    image_files = yolo_enrichment.find_image_files(str(lake_root / "raw" / "images"))[:limit]
+    if not image_files:
+        print("No synthetic images found; generate some with --max-images.")
+        return []
+
+    results = []
+    backend_rows = {}
+    for backend in backends:
+        # torch keeps the original variant names, so older results files still compare
+        suffix = "" if backend == "torch" else f"_{backend}"
+        try:
+            # Exporting/quantizing is a one-off cost, so it happens before the load is timed
+            model_path = detectors.resolve_model_path(yolo_enrichment.YOLO_MODEL_PATH, backend)
+            start_time = time.perf_counter()
+            model = yolo_enrichment.load_model(model_path, backend)
+            load_seconds = time.perf_counter() - start_time
+        except ImportError as e:
+            print(f"Skipping the {backend} backend: {e}")
+            continue
+        # Warm-up batch, so model initialization is not counted
+        yolo_enrichment.detect_images(model, image_files[:batch_size], batch_size, image_size, loader_threads)
+
+        start_time = time.perf_counter()
+        rows, latencies, processed = yolo_enrichment.detect_images(model, image_files, batch_size, image_size, loader_threads)
+        elapsed = time.perf_counter() - start_time
+        backend_rows[backend] = rows
+        accuracy = match_detections(backend_rows["torch"], rows) if backend != "torch" and "torch" in backend_rows else {}
+        results.append(result(
+            "yolo", f"in_process{suffix}", images=len(processed), detections=len(rows), seconds=round(elapsed, 3),
+            images_per_sec=round(instrumentation.rate(len(processed), elapsed), 2),
+            p50_ms=round(percentile(latencies, 50) * 1000, 2), p95_ms=round(percentile(latencies, 95) * 1000, 2),
+            load_seconds=round(load_seconds, 3), model_mib=round(os.path.getsize(model_path) / 2**20, 2),
+            batch_size=batch_size, image_size=image_size, **accuracy,
+        ))
+        del model
+
+        start_time = time.perf_counter()
+        processed_count = 0
+        for _, processed in yolo_enrichment.run_detection(
+            image_files, batch_size, image_size, workers, loader_threads, backend=backend
+        ):
+            processed_count += len(processed)
+        elapsed = time.perf_counter() - start_time
+        results.append(result(
+            "yolo", f"process_pool{suffix}", images=processed_count, seconds=round(elapsed, 3),
+            images_per_sec=round(instrumentation.rate(processed_count, elapsed), 2),
+            batch_size=batch_size, image_size=image_size, workers=workers,
+        ))
+    return results
+
+# --- API ---
+
+SEARCH_KEYWORDS = ["paracetamol", "vitamin", "cream", "ዋጋ", "delivery", "insulin", "syrup", "mask"]
+
+def api_requests(channel_names: list) -> dict:
+    """Endpoint name -> function(i) returning (path, params) for the i-th request, varied to spread cache keys."""
+    return {
+        "search_fulltext": lambda i: ("/api/search/messages", {"query": SEARCH_KEYWORDS[i % len(SEARCH_KEYWORDS)], "limit": 50}),
+        "search_prefix": lambda i: ("/api/search/messages", {"query": SEARCH_KEYWORDS[i % len(SEARCH_KEYWORDS)][:4], "mode": "prefix", "limit": 50}),
+        "search_trigram": lambda i: ("/api/search/messages", {"query": SEARCH_KEYWORDS[i % len(SEARCH_KEYWORDS)], "mode": "trigram", "limit": 50}),
+        "channel_activity": lambda i: (f"/api/channels/{channel_names[i % len(channel_names)]}/activity", {"limit": 30 + i % 7}),
+        # One batched request covering what channel_activity needs one request per channel for
+        "multi_channel_activity": lambda i: ("/api/channels/activity", {
+            "channels": ",".join(channel_names[:10]), "granularity": ("day", "week", "month")[i % 3],
+        }),
+        "top_visual_content": lambda i: ("/api/reports/top-visual-content", {"limit": 5 + i % 10}),
+    }
+
+async def _load_endpoint(base_url: str, make_request, requests: int, concurrency: int) -> dict:
+    import httpx
+
+    latencies, statuses = [], {}
+    next_index = iter(range(requests))
+
+    async def client_loop(client):
+        for i in next_index:
+            path, params = make_request(i)
+            start_time = time.perf_counter()
+            try:
+                response = await client.get(path, params=params)
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start_time)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    start_time = time.perf_counter()
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start_time
+    errors = sum(count for status, count in statuses.items() if not status.startswith(("2", "3", "404")))
+    return {
+        "requests": len(latencies), "concurrency": concurrency, "seconds": round(elapsed, 3),
+        "requests_per_sec": round(instrumentation.rate(len(latencies), elapsed), 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2), "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2), "max_ms": round(max(latencies, default=0) * 1000, 2),
+        "errors": errors, "statuses": statuses,
+    }
+
+def bench_api(requests: int, concurrency: int, api_workers: int, port: int, backend: str) -> list:
+    """Starts uvicorn against the benchmark database and loads each endpoint in turn."""
+    import httpx
+
+    channel_names = ["Channel 1000000000"]
+    try:
+        conn = connect()
+        with conn.cursor() as cur:
+            cur.execute("SELECT channel_name FROM dbt_schema.dim_channels ORDER BY channel_name LIMIT 20;")
+            channel_names = [row[0] for row in cur.fetchall()] or channel_names
+        conn.close()
+    except psycopg2.Error:
+        print("dim_channels not found (run the dbt suite first); using a placeholder channel name.")
+
+    env = {
+        **os.environ, "POSTGRES_DB": BENCH_DB_NAME, "POSTGRES_HOST": BENCH_DB_HOST,
+        "POSTGRES_PORT": BENCH_DB_PORT, "API_BACKEND": backend,
+    }
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "src.api.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(api_workers), "--log-level", "warning"],
+        cwd=str(PROJECT_ROOT), env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    results = []
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                httpx.get(f"{base_url}/", timeout=1)
+                break
+            except httpx.HTTPError:
+                if time.monotonic() > deadline or server.poll() is not None:
+                    raise RuntimeError("The API server did not start.") from None
+                time.sleep(0.2)
+
+        for name, make_request in api_requests(channel_names).items():
+            stats = asyncio.run(_load_endpoint(base_url, make_request, requests, concurrency))
+            results.append(result("api", name, backend=backend, api_workers=api_workers, **stats))
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+    return results
+
+# --- Results ---
+
+def git_commit() -> str:
+    completed = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=str(PROJECT_ROOT), capture_output=True, text=True)
+    return completed.stdout.strip() or "unknown"
+
+def dataset_summary(lake_root: Path) -> dict:
+    files = list((lake_root / "raw" / "telegram_messages").glob("*/*.jsonl"))
+    return {
+        "lake_root": str(lake_root),
+        "jsonl_files": len(files),
+        "jsonl_bytes": sum(f.stat().st_size for f in files),
+        "images": sum(1 for _ in (lake_root / "raw" / "images").glob("*/*/*.jpg")),
+    }
+
+def run(args) -> Path:
+    lake_root = Path(args.lake)
+    suites = [s.strip() for s in args.suites.split(",") if s.strip()]
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        raise SystemExit(f"Unknown suites: {', '.join(sorted(unknown))}. Choose from {', '.join(SUITES)}.")
+
+    ensure_database()
+    started_at = datetime.now(timezone.utc)
+    results = []
+    if "loader" in suites:
+        results += bench_loader(lake_root, args.loader_modes.split(","), args.workers, args.batch_size)
+    if "dbt" in suites:
+        results += bench_dbt(args.dbt_threads)
+    if "yolo" in suites:
+        results += bench_yolo(lake_root, args.yolo_limit, args.yolo_batch_size, args.yolo_image_size,
+                              args.yolo_workers, args.yolo_loader_threads, args.yolo_backends.split(","))
+    if "api" in suites:
+        results += bench_api(args.api_requests, args.api_concurrency, args.api_workers, args.api_port, args.api_backend)
+
+    document = {
+        "started_at": started_at.isoformat(),
+        "git_commit": git_commit(),
+        "host": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "dataset": dataset_summary(lake_root),
+        "results": results,
+    }
+    output = Path(args.output) if args.output else RESULTS_PATH / f"{started_at:%Y%m%dT%H%M%SZ}-{document['git_commit']}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(document, indent=2), encoding="utf-8")
+    print(f"Benchmark results written to: {output}")
+    return output
+
+# Metrics where a larger value is an improvement; for everything else (times, latencies) smaller is better
+HIGHER_IS_BETTER = ("rows_per_sec", "mib_per_sec", "images_per_sec", "requests_per_sec")
+
+def compare(before_path: str, after_path: str):
+    """Prints the change of every numeric metric that appears in both result files."""
+    before, after = (json.loads(Path(p).read_text(encoding="utf-8")) for p in (before_path, after_path))
+    baseline = {(r["benchmark"], r["variant"]): r for r in before["results"]}
+    print(f"{'benchmark/variant':<32} {'metric':<18} {'before':>12} {'after':>12} {'change':>9}")
+    for record in after["results"]:
+        key = (record["benchmark"], record["variant"])
+        previous = baseline.get(key)
+        if previous is None:
+            continue
+        for metric, value in record.items():
+            old = previous.get(metric)
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or not old:
+                continue
+            change = (value - old) / old * 100
+            better = change > 0 if metric in HIGHER_IS_BETTER else change < 0
+            marker = "+" if better and abs(change) >= 5 else ("-" if abs(change) >= 5 else " ")
+            print(f"{'/'.join(key):<32} {metric:<18} {old:>12.2f} {value:>12.2f} {change:>+8.1f}% {marker}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline and API on synthetic data.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run benchmark suites and write a results file.")
+    run_parser.add_argument("--suites", default=",".join(SUITES), help=f"Comma-separated suites: {', '.join(SUITES)}.")
+    run_parser.add_argument("--lake", default=DEFAULT_LAKE_ROOT, help="Root of the synthetic data lake.")
+    run_parser.add_argument("--output", help="Results file (default: data/benchmarks/<timestamp>-<commit>.json).")
+    run_parser.add_argument("--loader-modes", default="copy,parallel", help="Loader variants: insert, copy, parallel.")
+    run_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes for the parallel loader.")
+    run_parser.add_argument("--batch-size", type=int, default=5000, help="Lines per COPY chunk.")
+    run_parser.add_argument("--dbt-threads", type=int, default=4, help="dbt threads.")
+    run_parser.add_argument("--yolo-limit", type=int, default=500, help="Images used for the YOLO suite.")
+    run_parser.add_argument("--yolo-batch-size", type=int, default=16, help="YOLO inference batch size.")
+    run_parser.add_argument("--yolo-image-size", type=int, default=640, help="YOLO inference image size.")
+    run_parser.add_argument("--yolo-workers", type=int, default=max(1, (os.cpu_count() or 1) // 2), help="YOLO worker processes.")
+    run_parser.add_argument("--yolo-loader-threads", type=int, default=4, help="Image decode threads per YOLO worker.")
+    run_parser.add_argument("--yolo-backends", default="torch,onnx,onnx-int8",
+                            help="Detector backends to compare; accuracy is scored against torch when it runs first.")
+    run_parser.add_argument("--api-requests", type=int, default=2000, help="Requests per endpoint.")
+    run_parser.add_argument("--api-concurrency", type=int, default=32, help="Concurrent clients per endpoint.")
+    run_parser.add_argument("--api-workers", type=int, default=1, help="uvicorn worker processes.")
+    run_parser.add_argument("--api-port", type=int, default=8765, help="Port for the benchmarked API server.")
+    run_parser.add_argument("--api-backend", choices=["postgres", "duckdb"], default="postgres", help="API query backend.")
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two results files.")
+    compare_parser.add_argument("before", help="Baseline results file.")
+    compare_parser.add_argument("after", help="New results file.")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == "compare":
+        compare(args.before, args.after)
+    else:
+        run(args)
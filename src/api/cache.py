@@ -0,0 +1,121 @@
+# src/api/cache.py
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict, defaultdict
+from typing import NamedTuple, Optional
+
+from sqlalchemy import text
+
+# Cache settings from .env file
+CACHE_MAX_ENTRIES = int(os.getenv("API_CACHE_MAX_ENTRIES", "1024"))
+CACHE_DEFAULT_TTL = int(os.getenv("API_CACHE_DEFAULT_TTL", "300"))  # seconds
+# How often (seconds) the data-version table is polled to detect a finished pipeline run
+CACHE_VERSION_CHECK_INTERVAL = float(os.getenv("API_CACHE_VERSION_CHECK_INTERVAL", "5"))
+
+# Bumped by the `bump_data_version` dbt macro at the end of every `dbt run`
+DATA_VERSION_QUERY = text("SELECT version FROM pipeline_meta.data_version WHERE id = 1")
+
+
+class CacheEntry(NamedTuple):
+    body: bytes
+    etag: str
+    expires_at: float
+
+
+class ResponseCache:
+    """
+    Bounded LRU cache of serialized JSON responses with a per-endpoint TTL.
+    Everything is dropped when the pipeline's data version changes.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttls: Optional[dict] = None,
+                 default_ttl: int = CACHE_DEFAULT_TTL, version_check_interval: float = CACHE_VERSION_CHECK_INTERVAL):
+        self.max_entries = max_entries
+        self.ttls = ttls or {}
+        self.default_ttl = default_ttl
+        self.version_check_interval = version_check_interval
+        self._entries = OrderedDict()
+        self._data_version = None
+        self._version_checked_at = 0.0
+        self.hits = defaultdict(int)
+        self.misses = defaultdict(int)
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(endpoint: str, params: dict) -> str:
+        """Builds a key from the endpoint and its query parameters, ignoring order and unset values."""
+        normalized = {
+            name: value.strip() if isinstance(value, str) else str(value)
+            for name, value in params.items() if value is not None
+        }
+        return f"{endpoint}?{json.dumps(normalized, sort_keys=True)}"
+
+    def ttl_for(self, endpoint: str) -> int:
+        return self.ttls.get(endpoint, self.default_ttl)
+
+    def get(self, endpoint: str, key: str) -> Optional[CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is None or entry.expires_at < time.monotonic():
+            self._entries.pop(key, None)
+            self.misses[endpoint] += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits[endpoint] += 1
+        return entry
+
+    def set(self, endpoint: str, key: str, body: bytes) -> CacheEntry:
+        etag = f'"{self._data_version}-{hashlib.sha1(body).hexdigest()[:16]}"'
+        entry = CacheEntry(body, etag, time.monotonic() + self.ttl_for(endpoint))
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        self._entries.clear()
+        self.invalidations += 1
+
+    async def ensure_fresh(self, engine):
+        """
+        Drops every cached response if the data version changed since the last check.
+        The check is one primary-key lookup and runs at most once per `version_check_interval`.
+        """
+        now = time.monotonic()
+        if now - self._version_checked_at < self.version_check_interval:
+            return
+        self._version_checked_at = now
+        try:
+            # Separate connection, so a missing table can't poison a request's session
+            async with engine.connect() as conn:
+                version = (await conn.execute(DATA_VERSION_QUERY)).scalar()
+        except Exception:
+            # Table not created yet (no dbt run so far): keep relying on TTLs
+            version = None
+        if version != self._data_version:
+            if self._data_version is not None or self._entries:
+                self.clear()
+            self._data_version = version
+
+    def stats(self) -> dict:
+        endpoints = sorted(set(self.hits) | set(self.misses))
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "data_version": self._data_version,
+            "invalidations": self.invalidations,
+            "endpoints": {
+                endpoint: {"hits": self.hits[endpoint], "misses": self.misses[endpoint], "ttl": self.ttl_for(endpoint)}
+                for endpoint in endpoints
+            },
+        }
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """True if an If-None-Match header value matches `etag` (handles lists, weak tags and '*')."""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
@@ -1,55 +1,339 @@
-from sqlalchemy.orm import Session
+import base64
+import math
+import re
+
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
 
+from .database import async_engine
+from .schemas import Granularity, SearchMode
+
+# Minimum pg_trgm word similarity for a fuzzy match in trigram mode
+TRIGRAM_SIMILARITY_THRESHOLD = 0.4
+# Matches a dim_channels row (aliased c) to a channel reference: its id, Telegram username or channel_name
+CHANNEL_MATCH_SQL = "(c.channel_id::text = {ref} OR lower(c.channel_username) = lower({ref}) OR c.channel_name = {ref})"
+
+
+def encode_cursor(*values) -> str:
+    """Packs the sort key of the last row on a page into an opaque, URL-safe cursor."""
+    return base64.urlsafe_b64encode(":".join(str(v) for v in values).encode()).decode()
+
+
+def decode_cursor(cursor: str, *types) -> tuple:
+    """
+    Reverses encode_cursor, converting each value with the matching entry of `types`.
+    Raises ValueError for anything that isn't a cursor we issued.
+    """
+    try:
+        parts = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+        if len(parts) != len(types):
+            raise ValueError("wrong number of fields")
+        values = tuple(convert(part) for convert, part in zip(types, parts))
+    except (ValueError, TypeError, UnicodeError) as e:
+        raise ValueError("Invalid cursor") from e
+    # Ranks are finite; a NaN would make every keyset comparison false
+    if any(isinstance(value, float) and not math.isfinite(value) for value in values):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def _prefix_tsquery(keyword: str) -> str:
+    """Turns 'para amox' into 'para:* & amox:*'. \\w is Unicode-aware, so Amharic words are kept."""
+    return " & ".join(f"{token}:*" for token in re.findall(r"\w+", keyword))
 
-def search_messages_by_keyword(db: Session, keyword: str, limit: int = 100):
+
+async def search_messages_by_keyword(db: AsyncSession, keyword: str, mode: SearchMode = SearchMode.fulltext,
+                               limit: int = 100, cursor: str = None):
     """
-    Searches for messages containing a specific keyword.
-    NOTE: We join with the staging table to get the message_text.
+    Searches for messages matching a keyword, best matches first.
+    - fulltext: stemmed English + unstemmed 'simple' full-text search (GIN on search_vector)
+    - prefix:   every word in the keyword matches the start of a word in the message
+    - trigram:  substring or fuzzy (pg_trgm word similarity) match, e.g. misspelled drug names
+    Results are keyset-paginated on (rank, channel_id, message_id). Returns (rows, next_cursor);
+    next_cursor is None on the last page.
+    NOTE: Reads the message_search_index mart, which carries the text, views and search indexes.
     """
+    if mode == SearchMode.trigram:
+        # Transaction-local threshold for the <% operator
+        await db.execute(text("SELECT set_config('pg_trgm.word_similarity_threshold', :threshold, true)"),
+                   {"threshold": str(TRIGRAM_SIMILARITY_THRESHOLD)})
+        ranked = """
+            SELECT
+                channel_id,
+                message_id,
+                message_text,
+                view_count,
+                word_similarity(:keyword, message_text)::double precision AS rank
+            FROM dbt_schema.message_search_index
+            WHERE message_text ILIKE :pattern OR :keyword <% message_text
+        """
+        params = {"keyword": keyword, "pattern": f"%{keyword}%"}
+    else:
+        if mode == SearchMode.prefix:
+            tsquery = "to_tsquery('simple', :tsquery)"
+            params = {"tsquery": _prefix_tsquery(keyword)}
+            if not params["tsquery"]:
+                return [], None
+        else:
+            tsquery = "websearch_to_tsquery('english', :keyword) || websearch_to_tsquery('simple', :keyword)"
+            params = {"keyword": keyword}
+        # Rank is cast to double so it survives the round trip through the cursor exactly
+        ranked = f"""
+            SELECT
+                channel_id,
+                message_id,
+                message_text,
+                view_count,
+                ts_rank_cd(search_vector, tsq.q)::double precision AS rank
+            FROM dbt_schema.message_search_index
+            CROSS JOIN LATERAL (SELECT {tsquery} AS q) AS tsq
+            WHERE search_vector @@ tsq.q
+        """
+
+    after = ""
+    if cursor is not None:
+        rank, channel_id, message_id = decode_cursor(cursor, float, int, int)
+        after = "WHERE (rank, channel_id, message_id) < (:after_rank, :after_channel_id, :after_message_id)"
+        params.update(after_rank=rank, after_channel_id=channel_id, after_message_id=message_id)
+
+    # Fetch one extra row to find out whether there is a next page
     query = text(f"""
-        SELECT 
-            fm.message_id, 
-            stg.message_text,
-            fm.view_count
-        FROM dbt_schema.fct_messages AS fm
-        JOIN dbt_schema.stg_telegram_messages AS stg ON fm.message_id = stg.message_id
-        WHERE stg.message_text ILIKE :keyword
+        SELECT * FROM ({ranked}) AS ranked
+        {after}
+        ORDER BY rank DESC, channel_id DESC, message_id DESC
         LIMIT :limit
     """)
-    result = db.execute(query, {"keyword": f"%{keyword}%", "limit": limit}).fetchall()
-    return result
+    result = (await db.execute(query, {**params, "limit": limit + 1})).fetchall()
+    if len(result) <= limit:
+        return result, None
+    last = result[limit - 1]
+    return result[:limit], encode_cursor(repr(last.rank), last.channel_id, last.message_id)
 
-def get_channel_activity(db: Session, channel_name: str):
+async def get_channel_activity(db: AsyncSession, channel_name: str, limit: int = 100, before_date=None):
     """
-    Gets the daily posting activity for a specific channel.
+    Gets the daily posting activity for a specific channel, newest day first. `channel_name` may
+    be the channel's id, username or dim_channels.channel_name.
+    Keyset-paginated on post_date: pass the previous page's next cursor as `before_date`.
+    Returns (rows, next_before_date); next_before_date is None on the last page.
+    NOTE: Reads the pre-aggregated agg_channel_daily_activity mart (indexed on channel_id, post_date).
     """
+    before = "AND post_date < CAST(:before_date AS date)" if before_date is not None else ""
+    # ORDER BY names the table column explicitly; the bare alias would sort the formatted string
     query = text(f"""
         SELECT 
-            TO_CHAR(stg.post_date, 'YYYY-MM-DD') as post_date,
-            COUNT(fm.message_id) as message_count
-        FROM dbt_schema.fct_messages AS fm
-        JOIN dbt_schema.dim_channels AS dc ON fm.channel_id = dc.channel_id
-        JOIN dbt_schema.stg_telegram_messages AS stg ON fm.message_id = stg.message_id
-        WHERE dc.channel_name = :channel_name
-        GROUP BY 1
-        ORDER BY 1 DESC;
+            TO_CHAR(post_date, 'YYYY-MM-DD') as post_date,
+            message_count
+        FROM dbt_schema.agg_channel_daily_activity
+        WHERE channel_id = (
+            SELECT c.channel_id FROM dbt_schema.dim_channels c
+            WHERE {CHANNEL_MATCH_SQL.format(ref=":channel_name")}
+            LIMIT 1
+        )
+        {before}
+        ORDER BY agg_channel_daily_activity.post_date DESC
+        LIMIT :limit;
+    """)
+    result = (await db.execute(
+        query, {"channel_name": channel_name, "before_date": before_date, "limit": limit + 1}
+    )).fetchall()
+    if len(result) <= limit:
+        return result, None
+    return result[:limit], result[limit - 1].post_date
+
+async def get_multi_channel_activity(db: AsyncSession, channels: list, granularity: Granularity = Granularity.day,
+                                     start_date=None, end_date=None):
+    """
+    Gets message counts and view totals per day, week or month for several channels in one query.
+    `channels` are ids, usernames or channel names. Returns one row per (reference, period), in
+    the order the channels were requested and oldest period first; channel_id is null for a
+    reference that matched no channel and period_start is null for a channel with no activity.
+    NOTE: Reads the pre-aggregated agg_channel_daily_activity mart (indexed on channel_id, post_date).
+    """
+    conditions, params = _date_range_conditions("a.post_date", start_date, end_date)
+    date_filter = "".join(f" AND {condition}" for condition in conditions)
+    query = text(f"""
+        WITH requested AS (
+            SELECT ref, ord FROM unnest(CAST(:channels AS text[])) WITH ORDINALITY AS r(ref, ord)
+        ),
+        resolved AS (
+            SELECT DISTINCT ON (r.ord) r.ref, r.ord, c.channel_id, c.channel_name, c.channel_username
+            FROM requested r
+            LEFT JOIN dbt_schema.dim_channels c ON {CHANNEL_MATCH_SQL.format(ref="r.ref")}
+            ORDER BY r.ord, c.channel_id
+        ),
+        series AS (
+            SELECT
+                a.channel_id,
+                date_trunc(CAST(:granularity AS text), a.post_date::timestamp)::date AS period_start,
+                SUM(a.message_count) AS message_count,
+                SUM(a.total_views) AS total_views
+            FROM dbt_schema.agg_channel_daily_activity a
+            WHERE a.channel_id IN (SELECT channel_id FROM resolved){date_filter}
+            GROUP BY 1, 2
+        )
+        SELECT
+            res.ref,
+            res.channel_id,
+            res.channel_name,
+            res.channel_username,
+            TO_CHAR(s.period_start, 'YYYY-MM-DD') AS period_start,
+            s.message_count,
+            s.total_views
+        FROM resolved res
+        LEFT JOIN series s ON s.channel_id = res.channel_id
+        ORDER BY res.ord, s.period_start;
     """)
-    result = db.execute(query, {"channel_name": channel_name}).fetchall()
+    result = (await db.execute(
+        query, {**params, "channels": list(channels), "granularity": granularity.value}
+    )).fetchall()
     return result
 
-def get_top_detected_objects(db: Session, limit: int = 10):
+async def get_top_detected_objects(db: AsyncSession, limit: int = 10):
     """
     Gets the top N most frequently detected objects from images.
+    NOTE: Reads the pre-aggregated agg_object_counts mart instead of grouping fct_image_detections.
     """
     query = text(f"""
         SELECT
             detected_object_name,
-            COUNT(*) as mention_count
-        FROM dbt_schema.fct_image_detections
-        GROUP BY 1
-        ORDER BY 2 DESC
+            mention_count
+        FROM dbt_schema.agg_object_counts
+        ORDER BY mention_count DESC
+        LIMIT :limit;
+    """)
+    result = (await db.execute(query, {"limit": limit})).fetchall()
+    return result
+
+async def get_top_products(db: AsyncSession, limit: int = 10, start_date=None, end_date=None):
+    """
+    Gets the top N most mentioned products, optionally within an inclusive post date range,
+    with the average price quoted for them.
+    NOTE: Reads the pre-aggregated agg_product_daily mart instead of grouping fct_product_mentions.
+    """
+    conditions, params = _date_range_conditions("post_date", start_date, end_date)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    query = text(f"""
+        SELECT
+            product_name,
+            SUM(mention_count) AS mention_count,
+            ROUND(SUM(price_sum) / NULLIF(SUM(priced_mention_count), 0), 2)::double precision AS avg_price_etb
+        FROM dbt_schema.agg_product_daily
+        {where}
+        GROUP BY product_name
+        ORDER BY mention_count DESC, product_name
         LIMIT :limit;
     """)
-    result = db.execute(query, {"limit": limit}).fetchall()
-    return result
\ No newline at end of file
+    result = (await db.execute(query, {**params, "limit": limit})).fetchall()
+    return result
+
+async def get_price_trends(db: AsyncSession, product: str, granularity: Granularity = Granularity.day,
+                           start_date=None, end_date=None):
+    """
+    Gets the prices quoted for one product (its canonical name, case-insensitive) per day, week or
+    month, oldest period first. Periods with mentions but no quoted price have null prices.
+    NOTE: Rolls up the daily agg_product_daily mart; price_sum keeps the averages exact.
+    """
+    conditions, params = _date_range_conditions("post_date", start_date, end_date)
+    conditions.insert(0, "lower(product_name) = lower(:product)")
+    query = text(f"""
+        SELECT
+            TO_CHAR(date_trunc(CAST(:granularity AS text), post_date::timestamp), 'YYYY-MM-DD') AS period_start,
+            SUM(mention_count) AS mention_count,
+            SUM(priced_mention_count) AS priced_mention_count,
+            MIN(min_price_etb)::double precision AS min_price_etb,
+            ROUND(SUM(price_sum) / NULLIF(SUM(priced_mention_count), 0), 2)::double precision AS avg_price_etb,
+            MAX(max_price_etb)::double precision AS max_price_etb
+        FROM dbt_schema.agg_product_daily
+        WHERE {' AND '.join(conditions)}
+        GROUP BY 1
+        ORDER BY 1;
+    """)
+    result = (await db.execute(query, {**params, "product": product, "granularity": granularity.value})).fetchall()
+    return result
+
+
+def _date_range_conditions(column: str, start, end, to_param=lambda d: d) -> tuple:
+    """SQL conditions and params for an inclusive [start, end] range on `column`; None leaves a side open."""
+    conditions, params = [], {}
+    if start is not None:
+        conditions.append(f"{column} >= :start_date")
+        params["start_date"] = to_param(start)
+    if end is not None:
+        conditions.append(f"{column} <= :end_date")
+        params["end_date"] = to_param(end)
+    return conditions, params
+
+
+async def _stream_rows(query: str, params: dict, chunk_rows: int):
+    """
+    Yields lists of row tuples from a server-side cursor, `chunk_rows` at a time.
+    Opens its own connection because a streamed response outlives the request's session.
+    """
+    async with async_engine.connect() as conn:
+        result = await conn.stream(text(query), params)
+        async for rows in result.partitions(chunk_rows):
+            yield [tuple(row) for row in rows]
+
+
+def stream_messages(channel_name: str = None, start_date=None, end_date=None, chunk_rows: int = 5000):
+    """
+    Streams fct_messages joined with the channel name and message text, for one channel
+    (its id, username or dim_channels.channel_name) and/or an inclusive post date range, in no particular order.
+    Columns follow export.MESSAGE_EXPORT_SCHEMA.
+    """
+    # date_dim_id is YYYYMMDD, so the range is checked on the indexed key instead of the timestamp
+    conditions, params = _date_range_conditions(
+        "fct.date_dim_id", start_date, end_date, lambda d: int(d.strftime("%Y%m%d"))
+    )
+    if channel_name is not None:
+        conditions.append(
+            "fct.channel_id IN (SELECT c.channel_id FROM dbt_schema.dim_channels c "
+            f"WHERE {CHANNEL_MATCH_SQL.format(ref=':channel_name')})"
+        )
+        params["channel_name"] = channel_name
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return _stream_rows(f"""
+        SELECT
+            fct.channel_id,
+            chans.channel_name,
+            fct.message_id,
+            stg.post_date,
+            stg.message_text,
+            fct.view_count,
+            fct.message_length,
+            fct.has_image
+        FROM dbt_schema.fct_messages fct
+        JOIN dbt_schema.dim_channels chans ON chans.channel_id = fct.channel_id
+        LEFT JOIN dbt_schema.stg_telegram_messages stg
+            ON stg.channel_id = fct.channel_id AND stg.message_id = fct.message_id
+        {where}
+    """, params, chunk_rows)
+
+
+def stream_detections(channel_username: str = None, start_date=None, end_date=None, chunk_rows: int = 5000):
+    """
+    Streams fct_image_detections for one channel (the scraped username, as in the image folders)
+    and/or an inclusive post date range, in no particular order.
+    Columns follow export.DETECTION_EXPORT_SCHEMA.
+    """
+    conditions, params = _date_range_conditions("post_date", start_date, end_date)
+    if channel_username is not None:
+        conditions.append("channel_username = :channel_username")
+        params["channel_username"] = channel_username
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return _stream_rows(f"""
+        SELECT
+            message_id,
+            channel_username,
+            post_date,
+            detected_object_class_id,
+            detected_object_name,
+            confidence_score,
+            box_x1,
+            box_y1,
+            box_x2,
+            box_y2,
+            detected_at
+        FROM dbt_schema.fct_image_detections
+        {where}
+    """, params, chunk_rows)
@@ -0,0 +1,463 @@
+# src/api/duckdb_backend.py
+"""
+DuckDB query backend for the API, selected with API_BACKEND=duckdb.
+
+Runs the same queries as crud.py with the same signatures and result shapes, but against an
+embedded DuckDB file instead of Postgres. Messages are a view over the Parquet data lake
+(see src/parquet_lake.py) and detections are copied from the YOLO detection index, so the API
+can run without a database server. Product mentions are extracted from the lake's message text
+with src/text_enrichment.py when the file is built. Build or refresh the file with:
+
+    python -m src.api.duckdb_backend
+"""
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import time
+from collections import namedtuple
+from pathlib import Path
+
+import duckdb
+import pyarrow as pa
+
+from src import parquet_lake, text_enrichment
+from .crud import decode_cursor, encode_cursor
+from .metrics import observe_db_query
+from .schemas import Granularity, SearchMode
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+DUCKDB_PATH = os.getenv("DUCKDB_PATH", str(PROJECT_ROOT / "data" / "analytics.duckdb"))
+PARQUET_LAKE_PATH = os.getenv("PARQUET_LAKE_PATH", str(PROJECT_ROOT / "data" / "parquet" / "telegram_messages"))
+CHANNEL_INFO_PATH = os.getenv("TELEGRAM_CHANNEL_INFO_PATH", str(PROJECT_ROOT / "data" / "raw" / "channels"))
+DETECTION_INDEX_PATH = os.getenv(
+    "YOLO_DETECTION_INDEX_PATH", str(PROJECT_ROOT / "data" / "enrichment" / "yolo_detection_index.sqlite")
+)
+# Minimum Jaro-Winkler similarity between the keyword and a word of the message in trigram mode
+FUZZY_SIMILARITY_THRESHOLD = 0.85
+# Matches a channel (aliased c) to a channel reference: its id, Telegram username or channel_name
+CHANNEL_MATCH_SQL = "(CAST(c.channel_id AS VARCHAR) = {ref} OR lower(c.channel_username) = lower({ref}) OR c.channel_name = {ref})"
+
+_connection = None
+
+# Columns of the lake as read_parquet sees them: the message columns plus the hive partition keys
+LAKE_SCHEMA = parquet_lake.MESSAGE_SCHEMA.append(pa.field("post_date", pa.string())).append(pa.field("channel", pa.string()))
+
+# Columns of the product_mentions table, in text_enrichment.extract_batch's mention row order
+PRODUCT_MENTION_SCHEMA = pa.schema([
+    ("channel_id", pa.int64()),
+    ("message_id", pa.int64()),
+    ("mention_index", pa.int16()),
+    ("product_name", pa.string()),
+    ("matched_text", pa.string()),
+    ("price_etb", pa.decimal128(12, 2)),
+    ("post_date", pa.timestamp("us", tz="UTC")),
+])
+
+
+def build_duckdb(db_path: str = DUCKDB_PATH, lake_path: str = PARQUET_LAKE_PATH,
+                 detection_index_path: str = DETECTION_INDEX_PATH, channel_info_path: str = CHANNEL_INFO_PATH):
+    """
+    (Re)creates the DuckDB file: a channels table from the scraper's channel files, a messages
+    view over the Parquet lake and a detections table.
+    """
+    con = duckdb.connect(db_path)
+    try:
+        channel_rows = []
+        for file_path in sorted(Path(channel_info_path).glob("*.json")):
+            record = json.loads(file_path.read_text(encoding="utf-8"))
+            channel_rows.append((int(record["channel_id"]), record.get("username"), record.get("title")))
+        con.execute("CREATE OR REPLACE TABLE channels (channel_id BIGINT PRIMARY KEY, username VARCHAR, title VARCHAR)")
+        if channel_rows:
+            con.executemany("INSERT OR REPLACE INTO channels VALUES (?, ?, ?)", channel_rows)
+
+        if any(Path(lake_path).glob("**/*.parquet")):
+            lake_glob = os.path.join(lake_path, "**", "*.parquet").replace("'", "''")
+            lake_source = (f"read_parquet('{lake_glob}', hive_partitioning = true, "
+                           f"hive_types = {{'post_date': VARCHAR, 'channel': VARCHAR}})")
+        else:
+            # read_parquet fails on a glob with no matches, so serve an empty table of the same shape
+            print(f"No Parquet files under {lake_path}; messages will be empty until the lake is compacted "
+                  "and this file is rebuilt.")
+            con.register("empty_lake_rows", LAKE_SCHEMA.empty_table())
+            con.execute("CREATE OR REPLACE TABLE empty_lake AS SELECT * FROM empty_lake_rows")
+            con.unregister("empty_lake_rows")
+            lake_source = "empty_lake"
+        # A re-scraped message can appear twice in a partition; views only grow, so keep the highest.
+        # Channels without a channel file keep the 'Channel <id>' placeholder name, as in dim_channels.
+        con.execute(f"""
+            CREATE OR REPLACE VIEW messages AS
+            SELECT
+                m.*,
+                COALESCE(c.username, 'Channel ' || CAST(m.channel_id AS VARCHAR)) AS channel_name,
+                c.username AS channel_username
+            FROM (
+                SELECT *
+                FROM {lake_source}
+                QUALIFY row_number() OVER (PARTITION BY channel_id, message_id ORDER BY views DESC NULLS LAST) = 1
+            ) AS m
+            LEFT JOIN channels AS c ON c.channel_id = m.channel_id
+        """)
+        if lake_source != "empty_lake":
+            con.execute("DROP TABLE IF EXISTS empty_lake")
+
+        index = sqlite3.connect(detection_index_path)
+        try:
+            # Image paths start with the post date folder: YYYY-MM-DD/<channel>/<message_id>.jpg
+            rows = index.execute("""
+                SELECT
+                    CAST(d.message_id AS INTEGER), d.channel_id, substr(d.image_path, 1, 10),
+                    d.detected_object_class_id, d.detected_object_name, d.confidence_score,
+                    json_extract(d.bounding_box_xyxy, '$[0]'), json_extract(d.bounding_box_xyxy, '$[1]'),
+                    json_extract(d.bounding_box_xyxy, '$[2]'), json_extract(d.bounding_box_xyxy, '$[3]'),
+                    i.processed_at
+                FROM detections d
+                JOIN images i ON i.image_path = d.image_path
+            """).fetchall()
+        finally:
+            index.close()
+        con.execute("""
+            CREATE OR REPLACE TABLE image_detections (
+                message_id BIGINT,
+                channel_username VARCHAR,
+                post_date DATE,
+                detected_object_class_id INTEGER,
+                detected_object_name VARCHAR,
+                confidence_score DOUBLE,
+                box_x1 DOUBLE,
+                box_y1 DOUBLE,
+                box_x2 DOUBLE,
+                box_y2 DOUBLE,
+                detected_at TIMESTAMPTZ
+            )
+        """)
+        if rows:
+            con.executemany("INSERT INTO image_detections VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        mentions = _build_product_mentions(con)
+        print(f"DuckDB database ready at {db_path} ({len(channel_rows)} named channels, {len(rows)} detections, "
+              f"{mentions} product mentions).")
+    finally:
+        con.close()
+
+
+def _build_product_mentions(con, workers: int = text_enrichment.TEXT_WORKERS) -> int:
+    """Runs text extraction over every message in the lake into a product_mentions table. Returns the row count."""
+    con.execute("""
+        CREATE OR REPLACE TABLE product_mentions (
+            channel_id BIGINT,
+            message_id BIGINT,
+            mention_index SMALLINT,
+            product_name VARCHAR,
+            matched_text VARCHAR,
+            price_etb DECIMAL(12, 2),
+            post_date TIMESTAMPTZ
+        )
+    """)
+    # Messages are read on one cursor while each extracted batch is inserted on the connection
+    source = con.cursor()
+    try:
+        source.execute("SELECT channel_id, message_id, text, date, NULL FROM messages WHERE text IS NOT NULL")
+        batches = iter(lambda: source.fetchmany(text_enrichment.TEXT_BATCH_SIZE), [])
+        total = 0
+        for _, mention_rows, _ in text_enrichment.run_extraction(batches, workers=workers):
+            if not mention_rows:
+                continue
+            mention_batch = pa.Table.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(zip(*mention_rows), PRODUCT_MENTION_SCHEMA)],
+                schema=PRODUCT_MENTION_SCHEMA,
+            )
+            con.register("mention_batch", mention_batch)
+            con.execute("INSERT INTO product_mentions SELECT * FROM mention_batch")
+            con.unregister("mention_batch")
+            total += len(mention_rows)
+    finally:
+        source.close()
+    return total
+
+
+def _shared_connection():
+    global _connection
+    if _connection is None:
+        _connection = duckdb.connect(DUCKDB_PATH, read_only=True)
+    return _connection
+
+
+def get_connection():
+    """FastAPI dependency: a cursor on the shared read-only DuckDB connection."""
+    cursor = _shared_connection().cursor()
+    try:
+        yield cursor
+    finally:
+        cursor.close()
+
+
+def _fetch(con, query: str, params: list) -> list:
+    """Runs a query and returns rows that support attribute access, like SQLAlchemy rows."""
+    result = con.execute(query, params)
+    Row = namedtuple("Row", [column[0] for column in result.description])
+    return [Row(*values) for values in result.fetchall()]
+
+
+async def _fetch_async(con, query: str, params: list) -> list:
+    # DuckDB's Python API is blocking; run it off the event loop
+    start_time = time.perf_counter()
+    try:
+        return await asyncio.to_thread(_fetch, con, query, params)
+    finally:
+        observe_db_query(time.perf_counter() - start_time, "duckdb")
+
+
+async def search_messages_by_keyword(con, keyword: str, mode: SearchMode = SearchMode.fulltext,
+                                     limit: int = 100, cursor: str = None):
+    """
+    Same contract as crud.search_messages_by_keyword, using DuckDB string functions:
+    - fulltext: every word occurs in the message; rank is the number of occurrences
+    - prefix:   every word matches the start of a word in the message
+    - trigram:  substring match, or a message word within Jaro-Winkler distance of the keyword
+    """
+    words = [word.lower() for word in re.findall(r"\w+", keyword)]
+    if not words:
+        return [], None
+
+    # \pL / \pN instead of \b, which only knows ASCII letters and would miss Amharic words
+    word_start = r"(^|[^\pL\pN])"
+    if mode == SearchMode.trigram:
+        rank = """greatest(
+            CASE WHEN lower(text) LIKE ? THEN 1.0 ELSE 0.0 END,
+            list_max(list_transform(string_split_regex(lower(text), '[^\\pL\\pN]+'),
+                                    w -> jaro_winkler_similarity(w, ?)))
+        )"""
+        rank_params = [f"%{keyword.lower()}%", " ".join(words)]
+        condition = f"{rank} >= {FUZZY_SIMILARITY_THRESHOLD}"
+        condition_params = rank_params
+    elif mode == SearchMode.prefix:
+        rank = " + ".join(["len(regexp_extract_all(lower(text), ?))"] * len(words))
+        rank_params = [word_start + re.escape(word) for word in words]
+        condition = " AND ".join(["regexp_matches(lower(text), ?)"] * len(words))
+        condition_params = rank_params
+    else:
+        rank = " + ".join(["len(regexp_extract_all(lower(text), ?))"] * len(words))
+        rank_params = [re.escape(word) for word in words]
+        condition = " AND ".join(["contains(lower(text), ?)"] * len(words))
+        condition_params = words
+
+    after = ""
+    after_params = []
+    if cursor is not None:
+        after = "WHERE (rank, channel_id, message_id) < (?, ?, ?)"
+        after_params = list(decode_cursor(cursor, float, int, int))
+
+    query = f"""
+        SELECT * FROM (
+            SELECT
+                channel_id,
+                message_id,
+                text AS message_text,
+                views AS view_count,
+                CAST({rank} AS DOUBLE) AS rank
+            FROM messages
+            WHERE text IS NOT NULL AND {condition}
+        ) AS ranked
+        {after}
+        ORDER BY rank DESC, channel_id DESC, message_id DESC
+        LIMIT ?
+    """
+    result = await _fetch_async(con, query, rank_params + condition_params + after_params + [limit + 1])
+    if len(result) <= limit:
+        return result, None
+    last = result[limit - 1]
+    return result[:limit], encode_cursor(repr(last.rank), last.channel_id, last.message_id)
+
+
+async def get_channel_activity(con, channel_name: str, limit: int = 100, before_date=None):
+    """Same contract as crud.get_channel_activity, grouped straight from the Parquet post_date partitions."""
+    before = "AND post_date < ?" if before_date is not None else ""
+    params = [channel_name] * 3 + ([str(before_date)] if before_date is not None else []) + [limit + 1]
+    result = await _fetch_async(con, f"""
+        SELECT
+            post_date,
+            COUNT(message_id) AS message_count
+        FROM messages AS c
+        WHERE {CHANNEL_MATCH_SQL.format(ref="?")}
+        {before}
+        GROUP BY post_date
+        ORDER BY post_date DESC
+        LIMIT ?
+    """, params)
+    if len(result) <= limit:
+        return result, None
+    return result[:limit], result[limit - 1].post_date
+
+
+async def get_multi_channel_activity(con, channels: list, granularity: Granularity = Granularity.day,
+                                     start_date=None, end_date=None):
+    """Same contract as crud.get_multi_channel_activity, in one query over the messages view."""
+    conditions, params = _date_range_conditions("post_date", start_date, end_date)
+    date_filter = "".join(f" AND {condition}" for condition in conditions)
+    requested = ", ".join(["(?, ?)"] * len(channels))
+    requested_params = [value for position, ref in enumerate(channels) for value in (ref, position)]
+    return await _fetch_async(con, f"""
+        WITH requested(ref, ord) AS (VALUES {requested}),
+        known AS (
+            SELECT DISTINCT channel_id, channel_name, channel_username FROM messages
+        ),
+        resolved AS (
+            SELECT r.ref, r.ord, c.channel_id, c.channel_name, c.channel_username
+            FROM requested r
+            LEFT JOIN known c ON {CHANNEL_MATCH_SQL.format(ref="r.ref")}
+            QUALIFY row_number() OVER (PARTITION BY r.ord ORDER BY c.channel_id) = 1
+        ),
+        series AS (
+            SELECT
+                channel_id,
+                date_trunc(?, CAST(post_date AS DATE)) AS period_start,
+                COUNT(message_id) AS message_count,
+                COALESCE(SUM(views), 0) AS total_views
+            FROM messages
+            WHERE channel_id IN (SELECT channel_id FROM resolved){date_filter}
+            GROUP BY 1, 2
+        )
+        SELECT
+            res.ref,
+            res.channel_id,
+            res.channel_name,
+            res.channel_username,
+            strftime(s.period_start, '%Y-%m-%d') AS period_start,
+            s.message_count,
+            s.total_views
+        FROM resolved res
+        LEFT JOIN series s ON s.channel_id = res.channel_id
+        ORDER BY res.ord, s.period_start
+    """, requested_params + [granularity.value] + params)
+
+
+async def get_top_detected_objects(con, limit: int = 10):
+    """Same contract as crud.get_top_detected_objects."""
+    return await _fetch_async(con, """
+        SELECT
+            detected_object_name,
+            COUNT(*) AS mention_count
+        FROM image_detections
+        GROUP BY detected_object_name
+        ORDER BY mention_count DESC
+        LIMIT ?
+    """, [limit])
+
+
+async def get_top_products(con, limit: int = 10, start_date=None, end_date=None):
+    """Same contract as crud.get_top_products, grouped straight from product_mentions."""
+    conditions, params = _date_range_conditions("CAST(post_date AS DATE)", start_date, end_date)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return await _fetch_async(con, f"""
+        SELECT
+            product_name,
+            COUNT(*) AS mention_count,
+            CAST(round(avg(price_etb), 2) AS DOUBLE) AS avg_price_etb
+        FROM product_mentions
+        {where}
+        GROUP BY product_name
+        ORDER BY mention_count DESC, product_name
+        LIMIT ?
+    """, params + [limit])
+
+
+async def get_price_trends(con, product: str, granularity: Granularity = Granularity.day,
+                           start_date=None, end_date=None):
+    """Same contract as crud.get_price_trends."""
+    conditions, params = _date_range_conditions("CAST(post_date AS DATE)", start_date, end_date)
+    conditions.insert(0, "lower(product_name) = lower(?)")
+    return await _fetch_async(con, f"""
+        SELECT
+            strftime(date_trunc(?, CAST(post_date AS DATE)), '%Y-%m-%d') AS period_start,
+            COUNT(*) AS mention_count,
+            COUNT(price_etb) AS priced_mention_count,
+            CAST(min(price_etb) AS DOUBLE) AS min_price_etb,
+            CAST(round(avg(price_etb), 2) AS DOUBLE) AS avg_price_etb,
+            CAST(max(price_etb) AS DOUBLE) AS max_price_etb
+        FROM product_mentions
+        WHERE {' AND '.join(conditions)}
+        GROUP BY 1
+        ORDER BY 1
+    """, [granularity.value, product] + params)
+
+
+def _date_range_conditions(column: str, start, end) -> tuple:
+    conditions, params = [], []
+    if start is not None:
+        conditions.append(f"{column} >= ?")
+        params.append(str(start))
+    if end is not None:
+        conditions.append(f"{column} <= ?")
+        params.append(str(end))
+    return conditions, params
+
+
+async def _stream_rows(query: str, params: list, chunk_rows: int):
+    """Yields lists of row tuples from a streaming DuckDB result, fetching off the event loop."""
+    # A cursor of its own, since a streamed response outlives the request's dependency
+    cursor = _shared_connection().cursor()
+    try:
+        start_time = time.perf_counter()
+        try:
+            await asyncio.to_thread(cursor.execute, query, params)
+        finally:
+            observe_db_query(time.perf_counter() - start_time, "duckdb")
+        while True:
+            rows = await asyncio.to_thread(cursor.fetchmany, chunk_rows)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cursor.close()
+
+
+def stream_messages(channel_name: str = None, start_date=None, end_date=None, chunk_rows: int = 5000):
+    """Same contract as crud.stream_messages; date filters prune the lake's post_date partitions."""
+    conditions, params = _date_range_conditions("post_date", start_date, end_date)
+    if channel_name is not None:
+        conditions.append(CHANNEL_MATCH_SQL.format(ref="?"))
+        params.extend([channel_name] * 3)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return _stream_rows(f"""
+        SELECT
+            channel_id,
+            channel_name,
+            message_id,
+            date AS post_date,
+            text AS message_text,
+            views AS view_count,
+            length(text) AS message_length,
+            has_photo AS has_image
+        FROM messages AS c
+        {where}
+    """, params, chunk_rows)
+
+
+def stream_detections(channel_username: str = None, start_date=None, end_date=None, chunk_rows: int = 5000):
+    """Same contract as crud.stream_detections."""
+    conditions, params = _date_range_conditions("post_date", start_date, end_date)
+    if channel_username is not None:
+        conditions.append("channel_username = ?")
+        params.append(channel_username)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return _stream_rows(f"""
+        SELECT
+            message_id,
+            channel_username,
+            post_date,
+            detected_object_class_id,
+            detected_object_name,
+            confidence_score,
+            box_x1,
+            box_y1,
+            box_x2,
+            box_y2,
+            detected_at
+        FROM image_detections
+        {where}
+    """, params, chunk_rows)
+
+
+if __name__ == "__main__":
+    build_duckdb()
@@ -1,49 +1,295 @@
 # src/api/main.py
-from fastapi import FastAPI, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+import json
+import os
+from datetime import date
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import PlainTextResponse
+from fastapi.encoders import jsonable_encoder
+from typing import List, Optional
 
-from . import crud, schemas
-from .database import get_db
+from src import instrumentation
+from . import crud, export, schemas
+from .cache import ResponseCache, etag_matches
+from .database import API_BACKEND, async_engine, get_async_db
+from .metrics import instrument_engine, timing_middleware
+
+# Pick the query backend once at startup; both expose the same query functions
+if API_BACKEND == "duckdb":
+    from . import duckdb_backend as queries
+    get_db = queries.get_connection
+else:
+    queries = crud
+    get_db = get_async_db
+    instrument_engine(async_engine)
+
+# Page sizes for list endpoints; `limit` above MAX_PAGE_LIMIT is rejected with a 422
+DEFAULT_PAGE_LIMIT = 100
+MAX_PAGE_LIMIT = 1000
+# Channels accepted by one /api/channels/activity request
+MAX_BATCH_CHANNELS = int(os.getenv("API_MAX_BATCH_CHANNELS", "100"))
+
+# Report endpoints only change when telegram_analytics_job finishes, so they are cached in-process
+response_cache = ResponseCache(ttls={
+    "channel_activity": int(os.getenv("API_CACHE_TTL_CHANNEL_ACTIVITY", "600")),
+    "multi_channel_activity": int(os.getenv("API_CACHE_TTL_CHANNEL_ACTIVITY", "600")),
+    "top_visual_content": int(os.getenv("API_CACHE_TTL_TOP_VISUAL_CONTENT", "3600")),
+    "top_products": int(os.getenv("API_CACHE_TTL_TOP_PRODUCTS", "3600")),
+    "price_trends": int(os.getenv("API_CACHE_TTL_PRICE_TRENDS", "3600")),
+})
+
+async def cached_json_response(endpoint: str, params: dict, if_none_match: Optional[str], produce):
+    """
+    Serves `endpoint` from the response cache, calling `produce()` (which returns a
+    JSON-serializable object) on a miss. Answers 304 when the client's ETag is current.
+    """
+    if API_BACKEND == "postgres":
+        await response_cache.ensure_fresh(async_engine)
+    key = response_cache.make_key(endpoint, params)
+    entry = response_cache.get(endpoint, key)
+    if entry is None:
+        body = json.dumps(jsonable_encoder(await produce())).encode("utf-8")
+        entry = response_cache.set(endpoint, key, body)
+
+    headers = {"ETag": entry.etag, "Cache-Control": f"max-age={response_cache.ttl_for(endpoint)}"}
+    if etag_matches(if_none_match, entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
 
 app = FastAPI(
     title="Kara Solutions - Telegram Analytics API",
     description="An API to get insights from Ethiopian medical business Telegram channels.",
     version="1.0.0"
 )
+app.middleware("http")(timing_middleware)
 
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "Welcome to the Telegram Analytics API!"}
 
-@app.get("/api/search/messages", response_model=List[schemas.Message])
-def search_messages(query: str, db: Session = Depends(get_db)):
+@app.get("/api/search/messages", response_model=schemas.MessagePage)
+async def search_messages(
+    query: str,
+    mode: schemas.SearchMode = schemas.SearchMode.fulltext,
+    limit: int = Query(DEFAULT_PAGE_LIMIT, ge=1, le=MAX_PAGE_LIMIT),
+    cursor: Optional[str] = None,
+    db=Depends(get_db),
+):
     """
-    Searches for messages containing a specific keyword.
-    Example: `/api/search/messages?query=paracetamol`
+    Searches for messages matching a keyword, ranked by relevance.
+    `mode` is `fulltext` (default), `prefix` (word starts) or `trigram` (substring / fuzzy match).
+    Pass `next_cursor` from a response as `cursor` to get the next page.
+    Example: `/api/search/messages?query=paracetamol&mode=trigram&limit=50`
     """
-    messages = crud.search_messages_by_keyword(db, keyword=query)
-    if not messages:
+    try:
+        messages, next_cursor = await queries.search_messages_by_keyword(db, keyword=query, mode=mode, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not messages and cursor is None:
         raise HTTPException(status_code=404, detail="No messages found for this keyword.")
-    return messages
+    return {"items": messages, "next_cursor": next_cursor}
+
+def check_date_range(start_date: Optional[date], end_date: Optional[date]):
+    if start_date is not None and end_date is not None and start_date > end_date:
+        raise HTTPException(status_code=400, detail="start_date must be on or before end_date.")
 
-@app.get("/api/channels/{channel_name}/activity", response_model=List[schemas.ChannelActivity])
-def get_channel_activity(channel_name: str, db: Session = Depends(get_db)):
+def group_channel_series(rows) -> tuple:
     """
-    Returns the daily posting activity for a specific channel.
-    Example: `/api/channels/Channel 123456789/activity`
-    (Replace with a real channel name from your dim_channels table)
+    Folds get_multi_channel_activity rows into one series per channel, in request order.
+    Returns (channels, unknown_channels).
     """
-    activity = crud.get_channel_activity(db, channel_name=channel_name)
-    if not activity:
-        raise HTTPException(status_code=404, detail="Channel not found or no activity.")
-    return activity
+    channels, unknown_channels = {}, []
+    for row in rows:
+        if row.channel_id is None:
+            unknown_channels.append(row.ref)
+            continue
+        # The same channel may be requested by id and by username; it is listed once
+        channel = channels.setdefault(row.channel_id, {
+            "channel_id": row.channel_id,
+            "channel_name": row.channel_name,
+            "channel_username": row.channel_username,
+            "message_count": 0,
+            "total_views": 0,
+            "series": {},
+        })
+        if row.period_start is not None and row.period_start not in channel["series"]:
+            channel["series"][row.period_start] = {
+                "period_start": row.period_start, "message_count": row.message_count, "total_views": row.total_views,
+            }
+            channel["message_count"] += row.message_count
+            channel["total_views"] += row.total_views
+    for channel in channels.values():
+        channel["series"] = list(channel["series"].values())
+    return list(channels.values()), unknown_channels
+
+@app.get("/api/channels/activity", response_model=schemas.MultiChannelActivity)
+async def get_multi_channel_activity(
+    channels: List[str] = Query(..., description="Channel ids or usernames; repeat the parameter or separate with commas."),
+    granularity: schemas.Granularity = schemas.Granularity.day,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    if_none_match: Optional[str] = Header(None),
+    db=Depends(get_db),
+):
+    """
+    Returns message counts and view totals per day, week or month for several channels at once,
+    so a dashboard needs one request (and the database one query) instead of one per channel.
+    Example: `/api/channels/activity?channels=tikvahpharma,lobelia4cosmetics&granularity=week&start_date=2025-07-01`
+    """
+    check_date_range(start_date, end_date)
+    refs = []
+    for value in channels:
+        for ref in value.split(","):
+            ref = ref.strip().lstrip("@")
+            if ref and ref not in refs:
+                refs.append(ref)
+    if not refs:
+        raise HTTPException(status_code=400, detail="At least one channel is required.")
+    if len(refs) > MAX_BATCH_CHANNELS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_CHANNELS} channels can be requested at once.")
+
+    async def produce():
+        rows = await queries.get_multi_channel_activity(
+            db, channels=refs, granularity=granularity, start_date=start_date, end_date=end_date
+        )
+        series, unknown_channels = group_channel_series(rows)
+        return schemas.MultiChannelActivity(granularity=granularity, channels=series, unknown_channels=unknown_channels)
+
+    params = {"channels": ",".join(refs), "granularity": granularity.value, "start_date": start_date, "end_date": end_date}
+    return await cached_json_response("multi_channel_activity", params, if_none_match, produce)
+
+@app.get("/api/channels/{channel_name}/activity", response_model=schemas.ChannelActivityPage)
+async def get_channel_activity(
+    channel_name: str,
+    limit: int = Query(DEFAULT_PAGE_LIMIT, ge=1, le=MAX_PAGE_LIMIT),
+    before_date: Optional[date] = None,
+    if_none_match: Optional[str] = Header(None),
+    db=Depends(get_db),
+):
+    """
+    Returns the daily posting activity for a specific channel (its id or username), newest day first.
+    Pass `next_before_date` from a response as `before_date` to get the next (older) page.
+    Example: `/api/channels/tikvahpharma/activity?limit=30`
+    For several channels, use /api/channels/activity instead.
+    """
+    async def produce():
+        activity, next_before_date = await queries.get_channel_activity(db, channel_name=channel_name, limit=limit, before_date=before_date)
+        if not activity and before_date is None:
+            raise HTTPException(status_code=404, detail="Channel not found or no activity.")
+        return schemas.ChannelActivityPage(items=activity, next_before_date=next_before_date)
+
+    params = {"channel_name": channel_name, "limit": limit, "before_date": before_date}
+    return await cached_json_response("channel_activity", params, if_none_match, produce)
+
+@app.get("/api/reports/top-products", response_model=List[schemas.TopProduct])
+async def get_top_products(
+    limit: int = Query(10, ge=1, le=MAX_PAGE_LIMIT),
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    if_none_match: Optional[str] = Header(None),
+    db=Depends(get_db),
+):
+    """
+    Returns the most frequently mentioned products across all channels, with the average price
+    quoted for them, optionally within an inclusive post date range.
+    Products are matched against the dictionary in config/products.txt.
+    Example: `/api/reports/top-products?limit=10&start_date=2025-07-01`
+    """
+    check_date_range(start_date, end_date)
+
+    async def produce():
+        top_products = await queries.get_top_products(db, limit=limit, start_date=start_date, end_date=end_date)
+        return [schemas.TopProduct.from_orm(row) for row in top_products]
+
+    params = {"limit": limit, "start_date": start_date, "end_date": end_date}
+    return await cached_json_response("top_products", params, if_none_match, produce)
+
+@app.get("/api/reports/price-trends", response_model=List[schemas.PriceTrend])
+async def get_price_trends(
+    product: str,
+    granularity: schemas.Granularity = schemas.Granularity.week,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    if_none_match: Optional[str] = Header(None),
+    db=Depends(get_db),
+):
+    """
+    Returns the minimum, average and maximum price quoted for a product per day, week or month.
+    `product` is the canonical name from config/products.txt (case-insensitive).
+    Example: `/api/reports/price-trends?product=Paracetamol&granularity=month`
+    """
+    check_date_range(start_date, end_date)
+
+    async def produce():
+        trends = await queries.get_price_trends(
+            db, product=product, granularity=granularity, start_date=start_date, end_date=end_date
+        )
+        if not trends:
+            raise HTTPException(status_code=404, detail="No mentions found for this product.")
+        return [schemas.PriceTrend.from_orm(row) for row in trends]
+
+    params = {"product": product, "granularity": granularity.value, "start_date": start_date, "end_date": end_date}
+    return await cached_json_response("price_trends", params, if_none_match, produce)
 
 @app.get("/api/reports/top-visual-content", response_model=List[schemas.TopObject])
-def get_top_visual_content(limit: int = 10, db: Session = Depends(get_db)):
+async def get_top_visual_content(
+    limit: int = Query(10, ge=1, le=MAX_PAGE_LIMIT),
+    if_none_match: Optional[str] = Header(None),
+    db=Depends(get_db),
+):
     """
     Returns the most frequently detected objects in images across all channels.
     This helps answer: "Which channels have the most visual content (e.g., images of pills vs. creams)?"
     """
-    top_objects = crud.get_top_detected_objects(db, limit=limit)
-    return top_objects
+    async def produce():
+        top_objects = await queries.get_top_detected_objects(db, limit=limit)
+        return [schemas.TopObject.from_orm(row) for row in top_objects]
+
+    return await cached_json_response("top_visual_content", {"limit": limit}, if_none_match, produce)
+
+
+@app.get("/api/export/messages")
+async def export_messages(
+    format: schemas.ExportFormat = schemas.ExportFormat.csv,
+    channel_name: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+):
+    """
+    Downloads messages (fct_messages with channel name and text) as CSV, NDJSON or Parquet,
+    optionally for one channel and an inclusive post date range. Rows are streamed from a
+    server-side cursor, so there is no row limit.
+    Example: `/api/export/messages?format=parquet&channel_name=Channel 123456789&start_date=2025-07-01`
+    """
+    check_date_range(start_date, end_date)
+    chunks = queries.stream_messages(
+        channel_name=channel_name, start_date=start_date, end_date=end_date, chunk_rows=export.EXPORT_CHUNK_ROWS
+    )
+    return export.streaming_export(chunks, export.MESSAGE_EXPORT_SCHEMA, format, "messages")
+
+@app.get("/api/export/detections")
+async def export_detections(
+    format: schemas.ExportFormat = schemas.ExportFormat.csv,
+    channel: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+):
+    """
+    Downloads image detections (fct_image_detections) as CSV, NDJSON or Parquet, optionally for
+    one channel (its Telegram username, e.g. `lobelia4cosmetics`) and an inclusive post date range.
+    Example: `/api/export/detections?format=ndjson&channel=lobelia4cosmetics&end_date=2025-07-31`
+    """
+    check_date_range(start_date, end_date)
+    chunks = queries.stream_detections(
+        channel_username=channel, start_date=start_date, end_date=end_date, chunk_rows=export.EXPORT_CHUNK_ROWS
+    )
+    return export.streaming_export(chunks, export.DETECTION_EXPORT_SCHEMA, format, "detections")
+
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    """Returns response cache size, data version and hit/miss counters per endpoint."""
+    return response_cache.stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Request, database and cache metrics in the Prometheus text format."""
+    return PlainTextResponse(instrumentation.render_prometheus(), media_type="text/plain; version=0.0.4")
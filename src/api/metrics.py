@@ -0,0 +1,65 @@
+# src/api/metrics.py
+"""
+Per-request API timing: total request time and the time each request spends in database
+queries, recorded in the shared registry (src/instrumentation.py) and served at /metrics.
+"""
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+from src import instrumentation
+
+REQUEST_SECONDS = instrumentation.histogram(
+    "api_request_seconds", "Time to serve an API request.", ("route", "method", "status")
+)
+REQUEST_DB_SECONDS = instrumentation.histogram(
+    "api_request_db_seconds", "Total time one API request spent in database queries.", ("route",)
+)
+DB_QUERY_SECONDS = instrumentation.histogram(
+    "api_db_query_seconds", "Time of a single database query issued by the API.", ("backend",)
+)
+
+# [seconds, query_count] of the request being served; the list is shared with the
+# tasks and greenlets the request spawns, which copy the context but not the list
+_request_db_time: ContextVar = ContextVar("request_db_time", default=None)
+
+def observe_db_query(seconds: float, backend: str):
+    DB_QUERY_SECONDS.observe(seconds, backend=backend)
+    totals = _request_db_time.get()
+    if totals is not None:
+        totals[0] += seconds
+        totals[1] += 1
+
+def instrument_engine(engine, backend: str = "postgres"):
+    """Times every statement run through a (sync or async) SQLAlchemy engine."""
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_times", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        observe_db_query(time.perf_counter() - conn.info["query_start_times"].pop(), backend)
+
+async def timing_middleware(request, call_next):
+    """
+    Records request and database time per route template (e.g. /api/channels/{channel_name}/activity)
+    and reports the split to the client in a Server-Timing header.
+    """
+    totals = [0.0, 0]
+    token = _request_db_time.set(totals)
+    start_time = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        _request_db_time.reset(token)
+    elapsed = time.perf_counter() - start_time
+
+    route = request.scope.get("route")
+    route_path = getattr(route, "path", "unmatched")
+    REQUEST_SECONDS.observe(elapsed, route=route_path, method=request.method, status=response.status_code)
+    REQUEST_DB_SECONDS.observe(totals[0], route=route_path)
+    response.headers["Server-Timing"] = f"db;dur={totals[0] * 1000:.1f};desc=\"{totals[1]} queries\", total;dur={elapsed * 1000:.1f}"
+    return response
@@ -24,6 +24,12 @@ class ImageDetection(Base):
 
     image_detection_id = Column(String, primary_key=True, index=True)
     message_id = Column(BigInteger)
+    detected_object_class_id = Column(Integer)
     detected_object_name = Column(String)
     confidence_score = Column(Float)
-    bounding_box_xyxy = Column(String)
\ No newline at end of file
+    # Bounding box corners in pixels (previously a single 'bounding_box_xyxy' string)
+    box_x1 = Column(Float)
+    box_y1 = Column(Float)
+    box_x2 = Column(Float)
+    box_y2 = Column(Float)
+    detected_at = Column(DateTime)
\ No newline at end of file
@@ -1,16 +1,41 @@
 # src/api/schemas.py
+from enum import Enum
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
+
+# Search strategies accepted by /api/search/messages
+class SearchMode(str, Enum):
+    fulltext = "fulltext"
+    prefix = "prefix"
+    trigram = "trigram"
+
+# File formats accepted by the /api/export endpoints
+class ExportFormat(str, Enum):
+    csv = "csv"
+    ndjson = "ndjson"
+    parquet = "parquet"
+
+# Period lengths accepted by time-series reports
+class Granularity(str, Enum):
+    day = "day"
+    week = "week"
+    month = "month"
 
 # Schema for a single message search result
 class Message(BaseModel):
     message_id: int
     message_text: str
     view_count: int
+    rank: Optional[float] = None
 
     class Config:
         orm_mode = True
 
+# A page of search results; pass next_cursor back as `cursor` for the next page
+class MessagePage(BaseModel):
+    items: List[Message]
+    next_cursor: Optional[str] = None
+
 # Schema for channel activity
 class ChannelActivity(BaseModel):
     post_date: str
@@ -19,6 +44,32 @@ class ChannelActivity(BaseModel):
     class Config:
         orm_mode = True
 
+# A page of channel activity; pass next_before_date back as `before_date` for the next page
+class ChannelActivityPage(BaseModel):
+    items: List[ChannelActivity]
+    next_before_date: Optional[str] = None
+
+# One period of a channel's activity in /api/channels/activity
+class ChannelActivityPoint(BaseModel):
+    period_start: str
+    message_count: int
+    total_views: int
+
+# A channel's activity series over the requested range, with totals
+class ChannelActivitySeries(BaseModel):
+    channel_id: int
+    channel_name: str
+    channel_username: Optional[str] = None
+    message_count: int
+    total_views: int
+    series: List[ChannelActivityPoint]
+
+# Batched activity for several channels; unknown_channels lists references that matched no channel
+class MultiChannelActivity(BaseModel):
+    granularity: Granularity
+    channels: List[ChannelActivitySeries]
+    unknown_channels: List[str]
+
 # Schema for top detected objects
 class TopObject(BaseModel):
     detected_object_name: str
@@ -26,3 +77,24 @@ class TopObject(BaseModel):
 
     class Config:
         orm_mode = True
+
+# Schema for top mentioned products
+class TopProduct(BaseModel):
+    product_name: str
+    mention_count: int
+    avg_price_etb: Optional[float] = None
+
+    class Config:
+        orm_mode = True
+
+# Quoted prices of one product in one period (day, or the Monday / 1st of a week / month)
+class PriceTrend(BaseModel):
+    period_start: str
+    mention_count: int
+    priced_mention_count: int
+    min_price_etb: Optional[float] = None
+    avg_price_etb: Optional[float] = None
+    max_price_etb: Optional[float] = None
+
+    class Config:
+        orm_mode = True
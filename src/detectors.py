@@ -0,0 +1,212 @@
+# src/detectors.py
+"""
+Detector backends for yolo_enrichment.py. Every backend takes a batch of BGR images and returns,
+per image, (class_ids, confidences, boxes) with [x1, y1, x2, y2] boxes in that image's pixels.
+
+- torch: ultralytics YOLO in PyTorch eager mode (the original path).
+- onnx: the same weights exported once to ONNX and run with onnxruntime on the CPU, with
+  letterboxing and NMS done in NumPy, so neither torch nor ultralytics is imported at inference.
+- onnx-int8: the ONNX export with INT8 dynamic quantization of its weights (smaller and usually
+  faster on CPU, at some accuracy cost; compare with `scripts/run_benchmarks.py --suites yolo`).
+
+Exports are cached under ONNX_CACHE_DIR and rebuilt when the source weights are newer.
+"""
+import ast
+import os
+import shutil
+from pathlib import Path
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ONNX_CACHE_DIR = os.getenv("YOLO_ONNX_CACHE_DIR", os.path.join(PROJECT_ROOT, "data", "models"))
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+# ultralytics' predict() defaults, so every backend filters boxes the same way
+CONF_THRESHOLD = 0.25
+IOU_THRESHOLD = 0.7
+MAX_DETECTIONS = 300
+MAX_NMS_CANDIDATES = 30000
+# Per-class box offset for class-aware NMS in one pass (larger than any letterboxed coordinate)
+_CLASS_OFFSET = 7680
+_PAD_VALUE = 114
+# Input sides must be multiples of the largest feature-map stride
+_STRIDE = 32
+
+def _is_fresh(path: str, source_path: str) -> bool:
+    if not os.path.exists(path):
+        return False
+    return not os.path.exists(source_path) or os.path.getmtime(path) >= os.path.getmtime(source_path)
+
+def export_onnx(model_path: str, quantize: bool = False, cache_dir: str = ONNX_CACHE_DIR) -> str:
+    """
+    Returns the path of the cached ONNX export of `model_path` (INT8-quantized if `quantize`),
+    exporting it first if it is missing or older than the weights. Files are written under a
+    temporary name and renamed, so a concurrent reader never sees a partial model.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    stem = Path(model_path).stem
+    fp32_path = os.path.join(cache_dir, f"{stem}.onnx")
+    int8_path = os.path.join(cache_dir, f"{stem}-int8.onnx")
+    target_path = int8_path if quantize else fp32_path
+    if _is_fresh(target_path, model_path) and (not quantize or _is_fresh(int8_path, fp32_path)):
+        return target_path
+
+    if not _is_fresh(fp32_path, model_path):
+        from ultralytics import YOLO
+
+        print(f"Exporting {model_path} to ONNX...")
+        # Dynamic axes, so the last (smaller) batch and any --image-size run on the same file
+        exported_path = YOLO(model_path).export(format="onnx", dynamic=True, simplify=True, verbose=False)
+        shutil.move(exported_path, fp32_path + ".tmp")
+        os.replace(fp32_path + ".tmp", fp32_path)
+        print(f"ONNX model saved to: {fp32_path}")
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        print(f"Quantizing {fp32_path} to INT8...")
+        # The CPU provider's ConvInteger kernel takes unsigned 8-bit weights
+        quantize_dynamic(fp32_path, int8_path + ".tmp", weight_type=QuantType.QUInt8)
+        os.replace(int8_path + ".tmp", int8_path)
+        print(f"INT8 model saved to: {int8_path}")
+    return target_path
+
+def resolve_model_path(model_path: str, backend: str) -> str:
+    """Returns the file `backend` loads for `model_path`, exporting it to ONNX if needed."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown detector backend '{backend}'. Choose from {', '.join(BACKENDS)}.")
+    if backend == "torch" or model_path.endswith(".onnx"):
+        return model_path
+    return export_onnx(model_path, quantize=backend == "onnx-int8")
+
+def load_detector(model_path: str, backend: str = "torch", threads: int = 0):
+    """Loads `model_path` on `backend`; `threads` caps the intra-op threads (0 = library default)."""
+    path = resolve_model_path(model_path, backend)
+    if backend == "torch":
+        return TorchDetector(path, threads)
+    return OnnxDetector(path, threads)
+
+class TorchDetector:
+    """ultralytics YOLO in PyTorch (ultralytics is imported lazily so this module imports without it)."""
+
+    def __init__(self, model_path: str, threads: int = 0):
+        from ultralytics import YOLO
+
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        self.model = YOLO(model_path)
+        self.names = self.model.names
+
+    def detect(self, images: list, image_size: int) -> list:
+        results = self.model(
+            images, imgsz=image_size, conf=CONF_THRESHOLD, iou=IOU_THRESHOLD, max_det=MAX_DETECTIONS, verbose=False
+        )
+        detections = []
+        for result in results:
+            if result.boxes is None or len(result.boxes) == 0:
+                detections.append(([], [], []))
+                continue
+            # Pull every box off the tensor in one go instead of one box at a time
+            detections.append((
+                result.boxes.cls.int().tolist(), result.boxes.conf.tolist(), result.boxes.xyxy.tolist()
+            ))
+        return detections
+
+class OnnxDetector:
+    """A YOLOv8 ONNX export on onnxruntime's CPU provider."""
+
+    def __init__(self, model_path: str, threads: int = 0):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        # ultralytics stores the class names as a dict literal in the model metadata
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.names = ast.literal_eval(metadata["names"]) if "names" in metadata else {}
+
+    def detect(self, images: list, image_size: int) -> list:
+        batch, gains, pads = letterbox_batch(images, image_size)
+        predictions = self.session.run(None, {self.input_name: batch})[0]
+        detections = []
+        for prediction, gain, pad, image in zip(predictions, gains, pads, images):
+            class_ids, confidences, boxes = non_max_suppression(prediction, CONF_THRESHOLD, IOU_THRESHOLD, MAX_DETECTIONS)
+            # Undo the letterbox: remove the padding, scale back and clip to the image
+            boxes = (boxes - [pad[0], pad[1], pad[0], pad[1]]) / gain
+            height, width = image.shape[:2]
+            boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, width)
+            boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, height)
+            detections.append((class_ids.tolist(), confidences.tolist(), boxes.tolist()))
+        return detections
+
+def letterbox_batch(images: list, image_size: int):
+    """
+    Resizes each BGR image to fit an `image_size` square (keeping its aspect ratio), pads it with
+    gray and stacks the batch into one NCHW float32 RGB array in [0, 1]. The batch is only padded
+    to the largest image rounded up to the model stride, so mostly-landscape (or portrait) batches
+    skip the full square. Returns (batch, gains, pads), where pads are each image's (left, top).
+    """
+    import cv2
+    import numpy as np
+
+    sizes = []
+    for image in images:
+        height, width = image.shape[:2]
+        gain = min(image_size / height, image_size / width)
+        sizes.append((gain, round(width * gain), round(height * gain)))
+    canvas_height = -(-max(h for _, _, h in sizes) // _STRIDE) * _STRIDE
+    canvas_width = -(-max(w for _, w, _ in sizes) // _STRIDE) * _STRIDE
+
+    canvas = np.full((len(images), canvas_height, canvas_width, 3), _PAD_VALUE, dtype=np.uint8)
+    gains, pads = [], []
+    for i, (image, (gain, new_width, new_height)) in enumerate(zip(images, sizes)):
+        if (new_width, new_height) != image.shape[1::-1]:
+            image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+        left, top = (canvas_width - new_width) // 2, (canvas_height - new_height) // 2
+        canvas[i, top:top + new_height, left:left + new_width] = image
+        gains.append(gain)
+        pads.append((left, top))
+    # BGR -> RGB, NHWC -> NCHW and scaling for the whole batch at once
+    batch = np.ascontiguousarray(canvas[..., ::-1].transpose(0, 3, 1, 2), dtype=np.float32)
+    batch /= 255.0
+    return batch, gains, pads
+
+def non_max_suppression(prediction, conf_threshold: float = CONF_THRESHOLD, iou_threshold: float = IOU_THRESHOLD,
+                        max_detections: int = MAX_DETECTIONS):
+    """
+    Class-aware NMS over one image's raw YOLOv8 output of shape (4 + classes, anchors), where the
+    first four rows are box centre x/y, width and height. Returns (class_ids, confidences, boxes).
+    """
+    import numpy as np
+
+    scores = prediction[4:]
+    class_ids = scores.argmax(axis=0)
+    confidences = scores.max(axis=0)
+    candidates = np.flatnonzero(confidences > conf_threshold)
+    candidates = candidates[np.argsort(-confidences[candidates], kind="stable")][:MAX_NMS_CANDIDATES]
+    class_ids, confidences = class_ids[candidates], confidences[candidates]
+
+    cx, cy, w, h = prediction[:4, candidates]
+    boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+    # Shifting each class to its own region lets one pass suppress only boxes of the same class
+    shifted = boxes + (class_ids * _CLASS_OFFSET)[:, None]
+    areas = (shifted[:, 2] - shifted[:, 0]) * (shifted[:, 3] - shifted[:, 1])
+
+    keep = []
+    order = np.arange(len(candidates))
+    while order.size and len(keep) < max_detections:
+        best, rest = order[0], order[1:]
+        keep.append(best)
+        x1 = np.maximum(shifted[best, 0], shifted[rest, 0])
+        y1 = np.maximum(shifted[best, 1], shifted[rest, 1])
+        x2 = np.minimum(shifted[best, 2], shifted[rest, 2])
+        y2 = np.minimum(shifted[best, 3], shifted[rest, 3])
+        intersection = (x2 - x1).clip(0) * (y2 - y1).clip(0)
+        iou = intersection / (areas[best] + areas[rest] - intersection + 1e-9)
+        order = rest[iou <= iou_threshold]
+    keep = np.asarray(keep, dtype=np.int64)
+    return class_ids[keep], confidences[keep], boxes[keep]
@@ -0,0 +1,105 @@
+# src/image_dedup.py
+"""
+Perceptual hashing and near-duplicate lookup for scraped images.
+
+Channels repost the same product photos many times (often re-encoded or resized), so
+yolo_enrichment.py hashes every new image with a 64-bit difference hash (dHash) and looks it
+up in a BK-tree of already-inferred images by Hamming distance. Near-duplicates reuse the
+detections of the image they match instead of running inference again.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+HASH_BITS = 64
+_UNSIGNED_MASK = (1 << HASH_BITS) - 1
+
+def dhash(image_path: str):
+    """
+    Returns (hash, width, height) for an image, or None if it can't be decoded.
+    The image is shrunk to 9x8 grayscale and each bit records whether a pixel is
+    brighter than its right-hand neighbour, which survives re-encoding and resizing.
+    """
+    import cv2
+
+    image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        return None
+    height, width = image.shape[:2]
+    small = cv2.resize(image, (9, 8), interpolation=cv2.INTER_AREA)
+    value = 0
+    for bit in (small[:, 1:] > small[:, :-1]).flatten():
+        value = (value << 1) | int(bit)
+    return value, width, height
+
+def compute_hashes(image_paths: list, threads: int = 4) -> dict:
+    """Hashes images on a thread pool (OpenCV releases the GIL). Returns {path: (hash, width, height)}."""
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return {
+            path: info
+            for path, info in zip(image_paths, pool.map(dhash, image_paths))
+            if info is not None
+        }
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+def to_signed(value: int) -> int:
+    """Maps an unsigned 64-bit hash into SQLite's signed INTEGER range."""
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+def to_unsigned(value: int) -> int:
+    return value & _UNSIGNED_MASK
+
+def scale_box(box: list, source_size: tuple, target_size: tuple) -> list:
+    """Maps [x1, y1, x2, y2] from an image of (width, height) `source_size` to one of `target_size`."""
+    sx = target_size[0] / source_size[0] if source_size[0] else 1.0
+    sy = target_size[1] / source_size[1] if source_size[1] else 1.0
+    x1, y1, x2, y2 = box
+    return [x1 * sx, y1 * sy, x2 * sx, y2 * sy]
+
+class BKTree:
+    """
+    A Burkhard-Keller tree over Hamming distance. Children are keyed by their distance to the
+    parent, so by the triangle inequality a search within `max_distance` only descends into
+    children whose key is within `max_distance` of the query's distance to the node.
+    """
+
+    def __init__(self):
+        self._root = None  # [hash, item, {distance: child}]
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, value: int, item):
+        node = [value, item, {}]
+        self._size += 1
+        if self._root is None:
+            self._root = node
+            return
+        current = self._root
+        while True:
+            distance = hamming_distance(value, current[0])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def nearest(self, value: int, max_distance: int):
+        """Returns (distance, item) of the closest entry within `max_distance`, or None."""
+        if self._root is None:
+            return None
+        best = None
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(value, node[0])
+            if distance <= max_distance and (best is None or distance < best[0]):
+                best = (distance, node[1])
+                if distance == 0:
+                    break
+            limit = best[0] if best is not None else max_distance
+            for child_distance, child in node[2].items():
+                if distance - limit <= child_distance <= distance + limit:
+                    stack.append(child)
+        return best
@@ -0,0 +1,240 @@
+# src/instrumentation.py
+"""
+Process-local timers, counters, gauges and histograms shared by the pipeline stages and the API.
+
+Metrics live in a module-level registry and can be rendered in the Prometheus text format
+(served by the API at /metrics) or flattened into a dict (attached to Dagster asset metadata).
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Directory for node_exporter textfile-collector output from the CLI scripts (unset = don't write)
+METRICS_TEXTFILE_DIR = os.getenv("METRICS_TEXTFILE_DIR")
+
+# Latency buckets in seconds, from sub-millisecond queries to multi-minute dbt models
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+def _escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labelnames: tuple, labelvalues: tuple, extra: dict = None) -> str:
+    pairs = list(zip(labelnames, labelvalues)) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in pairs) + "}"
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+class Counter(_Metric):
+    """A value that only goes up (messages scraped, bytes downloaded, ...)."""
+    type_name = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, {}, value) for key, value in self._values.items()]
+
+class Gauge(Counter):
+    """A value that is set (e.g. the duration of the last dbt run of a model)."""
+    type_name = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets, with their sum and count."""
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            state["counts"][bisect_left(self.buckets, value)] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the wall time of the `with` block."""
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start_time, **labels)
+
+    def count(self, **labels) -> int:
+        state = self._values.get(self._key(labels))
+        return state["count"] if state else 0
+
+    def sum(self, **labels) -> float:
+        state = self._values.get(self._key(labels))
+        return state["sum"] if state else 0.0
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, state in self._values.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), state["counts"]):
+                    cumulative += bucket_count
+                    samples.append((f"{self.name}_bucket", key, {"le": _format_value(bound)}, cumulative))
+                samples.append((f"{self.name}_sum", key, {}, state["sum"]))
+                samples.append((f"{self.name}_count", key, {}, state["count"]))
+        return samples
+
+class Registry:
+    """Holds metrics by name; asking for an existing name returns the registered metric."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _get_or_create(self, cls, name: str, documentation: str, labelnames: tuple, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric {name} is already registered with a different type or labels")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple = (),
+                  buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render_prometheus(self) -> str:
+        """Renders every metric in the Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in sorted(self._metrics.values(), key=lambda m: m.name):
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            for sample_name, key, extra, value in metric.samples():
+                lines.append(f"{sample_name}{_format_labels(metric.labelnames, key, extra)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self, prefix: str = "") -> dict:
+        """
+        Flattens counters and gauges to {'name{labels}': value}, and histograms to their
+        count and sum, e.g. for Dagster asset metadata. Only metrics starting with `prefix`.
+        """
+        flat = {}
+        for metric in self._metrics.values():
+            if not metric.name.startswith(prefix):
+                continue
+            for sample_name, key, extra, value in metric.samples():
+                if extra:  # histogram buckets
+                    continue
+                flat[f"{sample_name}{_format_labels(metric.labelnames, key)}"] = value
+        return flat
+
+    def clear(self):
+        for metric in self._metrics.values():
+            metric.clear()
+
+REGISTRY = Registry()
+
+def counter(name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+    return REGISTRY.counter(name, documentation, labelnames)
+
+def gauge(name: str, documentation: str, labelnames: tuple = ()) -> Gauge:
+    return REGISTRY.gauge(name, documentation, labelnames)
+
+def histogram(name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.histogram(name, documentation, labelnames, buckets)
+
+def render_prometheus() -> str:
+    return REGISTRY.render_prometheus()
+
+def snapshot(prefix: str = "") -> dict:
+    return REGISTRY.snapshot(prefix)
+
+def write_textfile(job: str, textfile_dir: str = METRICS_TEXTFILE_DIR):
+    """
+    Writes the registry to <textfile_dir>/<job>.prom (temp file + rename, so the collector never
+    reads a partial file). Lets short-lived CLI runs be scraped by Prometheus' node_exporter.
+    """
+    if not textfile_dir:
+        return
+    os.makedirs(textfile_dir, exist_ok=True)
+    path = os.path.join(textfile_dir, f"{job}.prom")
+    with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+        f.write(render_prometheus())
+    os.replace(f"{path}.tmp", path)
+
+def rate(amount: float, seconds: float) -> float:
+    """Per-second throughput, 0 when no time has passed."""
+    return amount / seconds if seconds > 0 else 0.0
+
+# --- dbt ---
+
+DBT_MODEL_SECONDS = gauge(
+    "dbt_model_execution_seconds", "Execution time of each dbt node in the last run.", ("node", "status")
+)
+DBT_RUN_SECONDS = gauge("dbt_run_elapsed_seconds", "Total elapsed time of the last dbt invocation.", ("command",))
+
+def record_dbt_run_results(run_results_path: str, command: str = "run") -> dict:
+    """
+    Reads dbt's target/run_results.json and records per-node execution times.
+    Returns {node_name: seconds}, slowest first; empty if the file does not exist.
+    """
+    if not os.path.exists(run_results_path):
+        return {}
+    with open(run_results_path, 'r', encoding='utf-8') as f:
+        run_results = json.load(f)
+
+    timings = {}
+    for result in run_results.get("results", []):
+        node = result["unique_id"].split(".")[-1]
+        seconds = float(result.get("execution_time") or 0.0)
+        DBT_MODEL_SECONDS.set(seconds, node=node, status=result.get("status", "unknown"))
+        timings[node] = seconds
+    DBT_RUN_SECONDS.set(float(run_results.get("elapsed_time") or 0.0), command=command)
+    return dict(sorted(timings.items(), key=lambda item: item[1], reverse=True))
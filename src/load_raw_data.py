@@ -1,10 +1,20 @@
 # src/load_raw_data.py
 import os
+import io
+import sys
 import json
+import hashlib
+import time
+import argparse
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 import psycopg2
+from psycopg2 import pool
 from dotenv import load_dotenv
 
+from src import instrumentation
+
 load_dotenv()
 # Database connection details from .env file
 DB_NAME = os.getenv("POSTGRES_DB")
@@ -13,6 +23,53 @@ DB_PASSWORD = os.getenv("POSTGRES_PASSWORD")
 DB_HOST = "localhost"  # 'localhost' Or "db"if running this script inside a Docker container
 DB_PORT = "5432"
 
+# Bulk loading defaults (can be overridden from the command line)
+LOAD_BATCH_SIZE = int(os.getenv("LOAD_BATCH_SIZE", "5000"))
+LOAD_WORKERS = int(os.getenv("LOAD_WORKERS", str(os.cpu_count() or 1)))
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+DATA_LAKE_PATH = PROJECT_ROOT / "data" / "raw" / "telegram_messages"
+REJECTS_PATH = PROJECT_ROOT / "data" / "rejects" / "telegram_messages"
+# Channel id/username/title files written by the scraper (see telegram_scraper.save_channel_info)
+CHANNEL_INFO_PATH = Path(os.getenv("TELEGRAM_CHANNEL_INFO_PATH", str(PROJECT_ROOT / "data" / "raw" / "channels")))
+
+# Metrics (see src/instrumentation.py)
+ROWS_LOADED = instrumentation.counter("loader_rows_loaded_total", "Rows loaded into raw_telegram.messages.", ("mode",))
+ROWS_REJECTED = instrumentation.counter("loader_rows_rejected_total", "Malformed JSONL lines written to the rejects folder.")
+FILES_SKIPPED = instrumentation.counter("loader_files_skipped_total", "Files skipped because the manifest says they are unchanged.")
+FILE_LOAD_SECONDS = instrumentation.histogram("loader_file_seconds", "Time to load one JSONL file.", ("mode",))
+
+# Chunks are copied into a session-local staging table and then upserted, so
+# re-scraped messages (e.g. with new view counts) update in place.
+COPY_STAGE_SQL = "COPY messages_stage (raw_message_data) FROM STDIN"
+UPSERT_FROM_STAGE_SQL = """
+    INSERT INTO raw_telegram.messages (raw_message_data)
+    SELECT raw_message_data
+    FROM (
+        -- A file can contain the same message twice; keep the last occurrence
+        SELECT DISTINCT ON (channel_id, message_id) raw_message_data
+        FROM (
+            SELECT
+                raw_message_data,
+                (raw_message_data -> 'peer_id' ->> 'channel_id')::bigint AS channel_id,
+                (raw_message_data ->> 'id')::bigint AS message_id,
+                seq
+            FROM messages_stage
+        ) AS staged
+        ORDER BY channel_id, message_id, seq DESC
+    ) AS deduped
+    ON CONFLICT (channel_id, message_id) DO UPDATE
+        SET raw_message_data = EXCLUDED.raw_message_data,
+            loaded_at = timezone('utc', now())
+        WHERE raw_telegram.messages.raw_message_data IS DISTINCT FROM EXCLUDED.raw_message_data;
+"""
+UPSERT_MESSAGE_SQL = """
+    INSERT INTO raw_telegram.messages (raw_message_data) VALUES (%s)
+    ON CONFLICT (channel_id, message_id) DO UPDATE
+        SET raw_message_data = EXCLUDED.raw_message_data,
+            loaded_at = timezone('utc', now())
+        WHERE raw_telegram.messages.raw_message_data IS DISTINCT FROM EXCLUDED.raw_message_data;
+"""
+
 def create_raw_table(conn):
     """Creates the schema and table for raw data if they don't exist."""
     with conn.cursor() as cur:
@@ -23,50 +80,443 @@ def create_raw_table(conn):
                 loaded_at TIMESTAMP WITH TIME ZONE DEFAULT timezone('utc', now())
             );
         """)
-        print("Schema 'raw_telegram' and table 'messages' are ready.")
+        # Stored key columns derived from the JSON so messages can be deduplicated.
+        # ALTER TABLE takes an exclusive lock even when the columns exist, so only run it when needed
+        # (partitioned Dagster runs call this while other partitions are loading).
+        cur.execute("""
+            SELECT count(*) FROM information_schema.columns
+            WHERE table_schema = 'raw_telegram' AND table_name = 'messages'
+              AND column_name IN ('channel_id', 'message_id');
+        """)
+        if cur.fetchone()[0] < 2:
+            cur.execute("""
+                ALTER TABLE raw_telegram.messages
+                    ADD COLUMN IF NOT EXISTS channel_id BIGINT
+                        GENERATED ALWAYS AS ((raw_message_data -> 'peer_id' ->> 'channel_id')::bigint) STORED,
+                    ADD COLUMN IF NOT EXISTS message_id BIGINT
+                        GENERATED ALWAYS AS ((raw_message_data ->> 'id')::bigint) STORED;
+            """)
+        cur.execute("SELECT to_regclass('raw_telegram.messages_channel_message_uidx') IS NULL;")
+        if cur.fetchone()[0]:
+            # Tables loaded before the key existed contain duplicates; keep the latest copy
+            cur.execute("""
+                DELETE FROM raw_telegram.messages AS older
+                USING raw_telegram.messages AS newer
+                WHERE older.channel_id = newer.channel_id
+                  AND older.message_id = newer.message_id
+                  AND (older.loaded_at, older.ctid) < (newer.loaded_at, newer.ctid);
+            """)
+            if cur.rowcount:
+                print(f"Removed {cur.rowcount} duplicate messages from raw_telegram.messages.")
+            cur.execute("""
+                CREATE UNIQUE INDEX messages_channel_message_uidx
+                    ON raw_telegram.messages (channel_id, message_id);
+            """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS raw_telegram.load_manifest (
+                file_path TEXT PRIMARY KEY,
+                file_size BIGINT NOT NULL,
+                file_mtime TIMESTAMP WITH TIME ZONE NOT NULL,
+                content_hash TEXT NOT NULL,
+                rows_loaded INTEGER NOT NULL,
+                loaded_at TIMESTAMP WITH TIME ZONE DEFAULT timezone('utc', now())
+            );
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS raw_telegram.channels (
+                channel_id BIGINT PRIMARY KEY,
+                username TEXT,
+                title TEXT,
+                scraped_at TIMESTAMP WITH TIME ZONE,
+                loaded_at TIMESTAMP WITH TIME ZONE DEFAULT timezone('utc', now())
+            );
+        """)
+        print("Schema 'raw_telegram' and tables 'messages', 'load_manifest', 'channels' are ready.")
     conn.commit()
 
+def file_content_hash(file_path: Path) -> str:
+    """Returns the SHA-256 hex digest of a file, read in 1 MiB blocks."""
+    digest = hashlib.sha256()
+    with file_path.open('rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def manifest_key(file_path: Path, data_lake_path: Path) -> str:
+    """Manifest entries use the path relative to the data lake, e.g. '2025-07-05/tikvahpharma.jsonl'."""
+    return file_path.relative_to(data_lake_path).as_posix()
+
+def check_manifest(conn, file_path: Path, data_lake_path: Path):
+    """
+    Decides whether a file needs loading.
+    Returns (needs_load, content_hash). Size and mtime are compared first so unchanged
+    files are skipped without being read; the content hash is only computed when they differ.
+    """
+    stat = file_path.stat()
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT file_size, EXTRACT(EPOCH FROM file_mtime), content_hash
+            FROM raw_telegram.load_manifest WHERE file_path = %s;
+            """,
+            (manifest_key(file_path, data_lake_path),)
+        )
+        row = cur.fetchone()
+
+    if row is not None and row[0] == stat.st_size and abs(float(row[1]) - stat.st_mtime) < 1e-3:
+        return False, row[2]
+
+    content_hash = file_content_hash(file_path)
+    if row is not None and row[2] == content_hash:
+        # Touched but not changed: refresh the stat info so the next run skips it cheaply
+        record_manifest(conn, file_path, data_lake_path, content_hash, rows_loaded=None)
+        return False, content_hash
+    return True, content_hash
+
+def record_manifest(conn, file_path: Path, data_lake_path: Path, content_hash: str, rows_loaded, commit: bool = True):
+    """Upserts the manifest entry for a file. `rows_loaded=None` keeps the previously recorded count."""
+    stat = file_path.stat()
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO raw_telegram.load_manifest (file_path, file_size, file_mtime, content_hash, rows_loaded)
+            VALUES (%s, %s, to_timestamp(%s), %s, COALESCE(%s, 0))
+            ON CONFLICT (file_path) DO UPDATE
+                SET file_size = EXCLUDED.file_size,
+                    file_mtime = EXCLUDED.file_mtime,
+                    content_hash = EXCLUDED.content_hash,
+                    rows_loaded = COALESCE(%s, raw_telegram.load_manifest.rows_loaded),
+                    loaded_at = timezone('utc', now());
+            """,
+            (manifest_key(file_path, data_lake_path), stat.st_size, stat.st_mtime, content_hash, rows_loaded, rows_loaded)
+        )
+    if commit:
+        conn.commit()
+
+def load_channel_info(conn, channel_info_path: Path = CHANNEL_INFO_PATH) -> int:
+    """
+    Upserts the scraper's channel files into raw_telegram.channels. loaded_at only moves when a
+    channel's username or title changed, so dim_channels rebuilds just those. Returns the number
+    of channels added or changed.
+    """
+    records = []
+    for file_path in sorted(channel_info_path.glob("*.json")):
+        try:
+            record = json.loads(file_path.read_text(encoding='utf-8'))
+            records.append((int(record["channel_id"]), record.get("username"), record.get("title"), record.get("scraped_at")))
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"Skipping malformed channel file {file_path.name}. Error: {e}")
+    # Sorted by key, so concurrent partition loads lock the rows in the same order
+    records.sort(key=lambda r: r[0])
+    changed = 0
+    with conn.cursor() as cur:
+        for record in records:
+            cur.execute(
+                """
+                INSERT INTO raw_telegram.channels (channel_id, username, title, scraped_at)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (channel_id) DO UPDATE
+                    SET username = EXCLUDED.username,
+                        title = EXCLUDED.title,
+                        scraped_at = EXCLUDED.scraped_at,
+                        loaded_at = timezone('utc', now())
+                    WHERE (raw_telegram.channels.username, raw_telegram.channels.title)
+                        IS DISTINCT FROM (EXCLUDED.username, EXCLUDED.title);
+                """,
+                record
+            )
+            changed += cur.rowcount
+    conn.commit()
+    return changed
+
 def load_jsonl_to_db(conn, file_path: Path):
-    """Loads a single JSONL file into the raw_telegram.messages table."""
+    """Loads a single JSONL file into the raw_telegram.messages table. Returns the number of rows loaded."""
     print(f"Processing file: {file_path.name}")
-    with file_path.open('r', encoding='utf-8') as f:
-        with conn.cursor() as cur:
+    rows_loaded = 0
+    with FILE_LOAD_SECONDS.time(mode="insert"):
+        with file_path.open('r', encoding='utf-8') as f:
+            with conn.cursor() as cur:
+                for line in f:
+                    try:
+                        data = json.loads(line)
+                        cur.execute(UPSERT_MESSAGE_SQL, (json.dumps(data),))
+                        rows_loaded += 1
+                    except json.JSONDecodeError:
+                        print(f"Skipping malformed line in {file_path.name}: {line}")
+        conn.commit()
+    ROWS_LOADED.inc(rows_loaded, mode="insert")
+    return rows_loaded
+
+def validate_jsonl_line(line: str) -> bool:
+    """
+    Checks that a line is a JSON object Postgres will accept as JSONB.
+    The line itself is what gets loaded, so it is never re-serialized.
+    """
+    try:
+        data = json.loads(line)
+    except json.JSONDecodeError:
+        return False
+    if not isinstance(data, dict):
+        return False
+    # JSONB cannot store the NUL character, and one bad row would abort the whole COPY chunk.
+    # The raw text only rules it out cheaply: "\\u0000" may be an escaped backslash followed by "u0000".
+    return "\\u0000" not in line or not _contains_nul(data)
+
+def _contains_nul(value) -> bool:
+    """True when any decoded string (or object key) in a JSON value contains NUL."""
+    if isinstance(value, str):
+        return "\x00" in value
+    if isinstance(value, dict):
+        return any("\x00" in key or _contains_nul(item) for key, item in value.items())
+    if isinstance(value, list):
+        return any(_contains_nul(item) for item in value)
+    return False
+
+_COPY_TEXT_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\r": "\\r", "\n": "\\n"})
+
+def _copy_chunk(conn, chunk: list, commit: bool = True):
+    """Streams a chunk of already-validated JSON lines through COPY, upserts it and (optionally) commits."""
+    # COPY text format treats backslash as an escape character and tabs/newlines as delimiters.
+    # JSON allows raw tabs (and carriage returns) as whitespace between tokens, so those are escaped too.
+    buffer = io.StringIO("\n".join(line.translate(_COPY_TEXT_ESCAPES) for line in chunk) + "\n")
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS messages_stage (
+                raw_message_data JSONB,
+                seq BIGSERIAL
+            ) ON COMMIT DELETE ROWS;
+        """)
+        cur.copy_expert(COPY_STAGE_SQL, buffer)
+        cur.execute(UPSERT_FROM_STAGE_SQL)
+        # Chunks of one file may share a transaction, so clear the stage explicitly
+        cur.execute("TRUNCATE messages_stage;")
+    if commit:
+        conn.commit()
+
+def bulk_load_jsonl_to_db(conn, file_path: Path, batch_size: int = LOAD_BATCH_SIZE, rejects_path: Path = REJECTS_PATH,
+                          commit_per_chunk: bool = True):
+    """
+    Loads a single JSONL file into raw_telegram.messages using COPY ... FROM STDIN.
+    Lines are sent in chunks of `batch_size` with a commit after each chunk. With
+    `commit_per_chunk=False` nothing is committed, so the caller can make the whole file one transaction.
+    Malformed lines are written to a reject file under `rejects_path` instead of being loaded;
+    it is replaced on every load of the file, so it only lists the latest load's rejects.
+    Returns the number of rows loaded.
+    """
+    print(f"Processing file: {file_path.name}")
+    start_time = time.perf_counter()
+    rows_loaded = 0
+    rows_rejected = 0
+    reject_file = None
+    reject_file_path = rejects_path / file_path.parent.name / file_path.name
+    if reject_file_path.exists():
+        reject_file_path.unlink()
+    chunk = []
+
+    try:
+        with file_path.open('r', encoding='utf-8') as f:
             for line in f:
-                try:
-                    data = json.loads(line)
-                    cur.execute(
-                        "INSERT INTO raw_telegram.messages (raw_message_data) VALUES (%s);",
-                        (json.dumps(data),)
-                    )
-                except json.JSONDecodeError:
-                    print(f"Skipping malformed line in {file_path.name}: {line}")
-    conn.commit()
+                line = line.rstrip("\r\n")
+                if not line.strip():
+                    continue
+                if not validate_jsonl_line(line):
+                    if reject_file is None:
+                        reject_file_path.parent.mkdir(parents=True, exist_ok=True)
+                        reject_file = reject_file_path.open('w', encoding='utf-8')
+                    reject_file.write(line + "\n")
+                    rows_rejected += 1
+                    continue
+
+                chunk.append(line)
+                if len(chunk) >= batch_size:
+                    _copy_chunk(conn, chunk, commit=commit_per_chunk)
+                    rows_loaded += len(chunk)
+                    chunk = []
+
+            if chunk:
+                _copy_chunk(conn, chunk, commit=commit_per_chunk)
+                rows_loaded += len(chunk)
+    finally:
+        if reject_file is not None:
+            reject_file.close()
+
+    elapsed = time.perf_counter() - start_time
+    ROWS_LOADED.inc(rows_loaded, mode="copy")
+    ROWS_REJECTED.inc(rows_rejected)
+    FILE_LOAD_SECONDS.observe(elapsed, mode="copy")
+    print(f"Loaded {rows_loaded} rows from {file_path.name} in {elapsed:.2f}s "
+          f"({instrumentation.rate(rows_loaded, elapsed):,.0f} rows/sec).")
+    if rows_rejected:
+        print(f"Rejected {rows_rejected} malformed lines from {file_path.name}. See: {reject_file_path}")
+    return rows_loaded
+
+# --- Parallel loading ---
 
-def main():
-    """Main function to orchestrate the loading process."""
+# One connection pool per worker process, created by the pool initializer.
+# psycopg2 connections cannot cross process boundaries, so each worker owns its own.
+_worker_pool = None
+
+def connection_params() -> dict:
+    """psycopg2.connect() keyword arguments for the database configured in .env."""
+    return {"dbname": DB_NAME, "user": DB_USER, "password": DB_PASSWORD, "host": DB_HOST, "port": DB_PORT}
+
+def _init_worker(conn_params: dict):
+    # The parameters are passed in rather than read from this module's globals: spawned and
+    # forkserver workers re-import the module, so anything a caller changed there is lost.
+    global _worker_pool
+    _worker_pool = pool.SimpleConnectionPool(1, 1, **conn_params)
+
+def load_file_atomically(conn, file_path: Path, batch_size: int = LOAD_BATCH_SIZE, force: bool = False,
+                         data_lake_path: Path = DATA_LAKE_PATH):
+    """
+    Loads one file as a single transaction: the rows and the manifest entry are
+    committed together or not at all. Returns (rows_loaded, skipped).
+    """
+    try:
+        needs_load, content_hash = check_manifest(conn, file_path, data_lake_path)
+        if not needs_load and not force:
+            FILES_SKIPPED.inc()
+            return 0, True
+
+        rows_loaded = bulk_load_jsonl_to_db(conn, file_path, batch_size=batch_size, commit_per_chunk=False)
+        record_manifest(conn, file_path, data_lake_path, content_hash, rows_loaded, commit=False)
+        conn.commit()
+        return rows_loaded, False
+    except Exception:
+        conn.rollback()
+        raise
+
+def _load_file_in_worker(file_path: str, batch_size: int, force: bool, data_lake_path: str):
+    """Loads one file on the worker's pooled connection (see load_file_atomically)."""
+    file_path = Path(file_path)
+    conn = _worker_pool.getconn()
+    try:
+        start_time = time.perf_counter()
+        rows_loaded, skipped = load_file_atomically(
+            conn, file_path, batch_size=batch_size, force=force, data_lake_path=Path(data_lake_path)
+        )
+        return os.getpid(), file_path.name, rows_loaded, time.perf_counter() - start_time, skipped
+    finally:
+        _worker_pool.putconn(conn)
+
+def load_files_in_parallel(files: list, workers: int, batch_size: int = LOAD_BATCH_SIZE, force: bool = False,
+                          conn_params: dict = None, data_lake_path: Path = DATA_LAKE_PATH):
+    """
+    Spreads files across `workers` processes and prints a per-worker throughput summary.
+    Workers connect with `conn_params` (default: connection_params()).
+    Returns (rows_loaded, files_failed); failed files were rolled back and can be retried.
+    """
+    conn_params = conn_params or connection_params()
+    # Largest files first so the slowest ones don't end up last on a single worker
+    files = sorted(files, key=lambda f: f.stat().st_size, reverse=True)
+    stats = defaultdict(lambda: {"files": 0, "rows": 0, "seconds": 0.0})
+    files_skipped = 0
+    files_failed = 0
+    start_time = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(conn_params,)) as executor:
+        futures = {
+            executor.submit(_load_file_in_worker, str(f), batch_size, force, str(data_lake_path)): f for f in files
+        }
+        for future in as_completed(futures):
+            try:
+                pid, file_name, rows_loaded, elapsed, skipped = future.result()
+            except Exception as e:
+                files_failed += 1
+                print(f"Failed to load {futures[future]}; its transaction was rolled back. Error: {e}")
+                continue
+            if skipped:
+                files_skipped += 1
+                FILES_SKIPPED.inc()
+                continue
+            # Workers record metrics in their own processes; mirror them in this one
+            ROWS_LOADED.inc(rows_loaded, mode="copy")
+            FILE_LOAD_SECONDS.observe(elapsed, mode="copy")
+            stats[pid]["files"] += 1
+            stats[pid]["rows"] += rows_loaded
+            stats[pid]["seconds"] += elapsed
+
+    wall_time = time.perf_counter() - start_time
+    total_rows = sum(s["rows"] for s in stats.values())
+    print(f"--- Parallel load summary ({workers} workers) ---")
+    for pid, s in sorted(stats.items()):
+        rows_per_sec = s["rows"] / s["seconds"] if s["seconds"] > 0 else 0.0
+        print(f"Worker {pid}: {s['files']} files, {s['rows']} rows, {s['seconds']:.2f}s busy ({rows_per_sec:,.0f} rows/sec)")
+    overall = total_rows / wall_time if wall_time > 0 else 0.0
+    print(f"Total: {total_rows} rows in {wall_time:.2f}s ({overall:,.0f} rows/sec). "
+          f"Skipped {files_skipped} unchanged files, {files_failed} failed.")
+    return total_rows, files_failed
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load raw Telegram JSONL files into PostgreSQL.")
+    parser.add_argument(
+        "--mode", choices=["copy", "insert"], default="copy",
+        help="'copy' streams files through COPY in batches (default), 'insert' runs one INSERT per line."
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=LOAD_BATCH_SIZE,
+        help="Number of lines sent per COPY chunk. A commit is issued after each chunk."
+    )
+    parser.add_argument(
+        "--workers", type=int, default=LOAD_WORKERS,
+        help="Number of worker processes for parallel COPY loading (default: CPU count). 1 loads sequentially."
+    )
+    parser.add_argument(
+        "--force", action="store_true",
+        help="Reload every file, ignoring the load manifest."
+    )
+    return parser.parse_args()
+
+def main() -> int:
+    """Main function to orchestrate the loading process. Returns the process exit code."""
+    args = parse_args()
     try:
-        with psycopg2.connect(
-            dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD, host=DB_HOST, port=DB_PORT
-        ) as conn:
+        with psycopg2.connect(**connection_params()) as conn:
             print("Successfully connected to PostgreSQL.")
             create_raw_table(conn)
+            channels_changed = load_channel_info(conn)
+            print(f"Channel names: {channels_changed} added or changed.")
 
             # Define the path to your data lake
-            project_root = Path(__file__).resolve().parent.parent
-            data_lake_path = project_root / "data" / "raw" / "telegram_messages"
+            data_lake_path = DATA_LAKE_PATH
+
+            if args.mode == "copy" and args.workers > 1:
+                files = sorted(data_lake_path.glob("*/*.jsonl"))
+                _, files_failed = load_files_in_parallel(files, args.workers, batch_size=args.batch_size, force=args.force)
+                if files_failed:
+                    print(f"{files_failed} of {len(files)} files failed to load; rerun to retry them.")
+                    return 1
+                print("All files processed successfully.")
+                return 0
 
             # Iterate through all date folders and jsonl files
+            files_skipped = 0
             for date_folder in data_lake_path.iterdir():
                 if date_folder.is_dir():
                     for json_file in date_folder.glob("*.jsonl"):
-                        load_jsonl_to_db(conn, json_file)
+                        needs_load, content_hash = check_manifest(conn, json_file, data_lake_path)
+                        if not needs_load and not args.force:
+                            files_skipped += 1
+                            FILES_SKIPPED.inc()
+                            continue
+
+                        if args.mode == "copy":
+                            rows_loaded = bulk_load_jsonl_to_db(conn, json_file, batch_size=args.batch_size)
+                        else:
+                            rows_loaded = load_jsonl_to_db(conn, json_file)
+                        record_manifest(conn, json_file, data_lake_path, content_hash, rows_loaded)
 
-            print("All files processed successfully.")
+            print(f"All files processed successfully. Skipped {files_skipped} unchanged files.")
+            return 0
 
     except psycopg2.OperationalError as e:
         print(f"Could not connect to the database. Is it running? Error: {e}")
+        return 1
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
+        return 1
+    finally:
+        instrumentation.write_textfile("load_raw_data")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
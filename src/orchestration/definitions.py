@@ -1,6 +1,3 @@
-from dagster import Definitions
-from src.orchestration.pipeline import telegram_analytics_job
+from src.orchestration.pipeline import defs
 
-defs = Definitions(
-    jobs=[telegram_analytics_job]
-)
+__all__ = ["defs"]
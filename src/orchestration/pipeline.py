@@ -1,102 +1,264 @@
 # src/orchestration/pipeline.py
+import asyncio
+import os
 import subprocess
-import sys
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta, timezone
 from pathlib import Path
-from dagster import job, op
-from dagster import ScheduleDefinition, Definitions
+from typing import Optional
+
+from dagster import (
+    AssetSelection,
+    Config,
+    ConfigurableResource,
+    DailyPartitionsDefinition,
+    Definitions,
+    InitResourceContext,
+    MaterializeResult,
+    MetadataValue,
+    MultiPartitionKey,
+    MultiPartitionsDefinition,
+    RunRequest,
+    ScheduleDefinition,
+    StaticPartitionsDefinition,
+    asset,
+    define_asset_job,
+    schedule,
+)
+from psycopg2 import pool
+from pydantic import PrivateAttr
+
+from src import instrumentation, load_raw_data, telegram_scraper, text_enrichment, yolo_enrichment
 
 def get_project_root() -> Path:
     return Path(__file__).resolve().parent.parent.parent
 
-@op
-def scrape_telegram_data_op():
-    project_root = get_project_root()
-    script_path = project_root / "src" / "telegram_scraper.py"
-    
-    print(f"Executing script: {script_path}")
-    result = subprocess.run([sys.executable, str(script_path)], capture_output=True, text=True)
-    
-    if result.returncode != 0:
-        print("Error output:", result.stderr)
-        raise Exception(f"Telegram scraping script failed with return code {result.returncode}")
-    
-    print("Script output:", result.stdout)
-    print("Telegram scraping completed successfully.")
-    
-    # Return a dummy value to pass to dependent ops
-    return "scraped"
-
-@op
-def load_raw_to_postgres_op(_trigger):
-    project_root = get_project_root()
-    script_path = project_root / "src" / "load_raw_data.py"
-    
-    print(f"Executing script: {script_path}")
-    result = subprocess.run([sys.executable, str(script_path)], capture_output=True, text=True)
-    
-    if result.returncode != 0:
-        print("Error output:", result.stderr)
-        raise Exception(f"Loading raw data script failed with return code {result.returncode}")
-        
-    print("Script output:", result.stdout)
-    print("Loading raw data to PostgreSQL completed successfully.")
-    return "loaded"
-
-@op
-def run_dbt_transformations_op(_trigger):
-    project_root = get_project_root()
-    dbt_project_dir = project_root / "telegram_analytics"
-    
-    print("Running dbt transformations...")
-    dbt_run_result = subprocess.run(["dbt", "run"], cwd=str(dbt_project_dir), capture_output=True, text=True)
+# --- Partitions ---
+
+# Every raw asset is partitioned by post date and channel, so one day of one channel
+# can be re-scraped, reloaded or re-enriched on its own (e.g. a backfill from the UI).
+PARTITIONS_START_DATE = os.getenv("DAGSTER_PARTITIONS_START_DATE", "2024-01-01")
+channel_partitions = StaticPartitionsDefinition(
+    [telegram_scraper.get_channel_identifier(c) for c in telegram_scraper.load_channels()]
+)
+date_channel_partitions = MultiPartitionsDefinition({
+    "date": DailyPartitionsDefinition(start_date=PARTITIONS_START_DATE),
+    "channel": channel_partitions,
+})
+
+def partition_date_and_channel(context):
+    keys = context.partition_key.keys_by_dimension
+    return keys["date"], keys["channel"]
+
+# --- Resources ---
+
+class PostgresResource(ConfigurableResource):
+    """A psycopg2 connection pool shared by every asset in a run's step process."""
+
+    dbname: Optional[str] = load_raw_data.DB_NAME
+    user: Optional[str] = load_raw_data.DB_USER
+    password: Optional[str] = load_raw_data.DB_PASSWORD
+    host: str = load_raw_data.DB_HOST
+    port: str = load_raw_data.DB_PORT
+    max_connections: int = 4
+
+    _pool = PrivateAttr(default=None)
+
+    def setup_for_execution(self, context: InitResourceContext) -> None:
+        self._pool = pool.ThreadedConnectionPool(
+            1, self.max_connections,
+            dbname=self.dbname, user=self.user, password=self.password, host=self.host, port=self.port
+        )
+
+    def teardown_after_execution(self, context: InitResourceContext) -> None:
+        if self._pool is not None:
+            self._pool.closeall()
+
+    @contextmanager
+    def get_connection(self):
+        conn = self._pool.getconn()
+        try:
+            yield conn
+        finally:
+            self._pool.putconn(conn)
+
+class YoloModelResource(ConfigurableResource):
+    """Loads the YOLO model once per step process and shares it between assets."""
+
+    model_path: str = yolo_enrichment.YOLO_MODEL_PATH
+    backend: str = yolo_enrichment.YOLO_BACKEND
+    batch_size: int = yolo_enrichment.YOLO_BATCH_SIZE
+    image_size: int = yolo_enrichment.YOLO_IMAGE_SIZE
+    loader_threads: int = yolo_enrichment.YOLO_LOADER_THREADS
+    dedup_distance: int = yolo_enrichment.YOLO_DEDUP_DISTANCE
+
+    _model = PrivateAttr(default=None)
+
+    def get_model(self):
+        if self._model is None:
+            self._model = yolo_enrichment.load_model(self.model_path, self.backend)
+        return self._model
+
+# --- Assets ---
+
+class ScrapeConfig(Config):
+    chunk_size: int = telegram_scraper.CHUNK_SIZE
+    download_workers: int = telegram_scraper.DOWNLOAD_WORKERS
+    thumbnail_only: bool = False
+    # Fetch the whole day and replace its file, instead of only messages the incremental scraper hasn't saved
+    full_rescrape: bool = False
+
+# All scrape steps share one Telethon session file, so they run in the telegram_session pool,
+# which dagster.yaml limits to one step at a time
+@asset(
+    partitions_def=date_channel_partitions,
+    pool="telegram_session",
+    group_name="raw",
+)
+def raw_telegram_files(context, config: ScrapeConfig) -> MaterializeResult:
+    """Messages (data/raw/telegram_messages) and photos (data/raw/images) of one channel for one day."""
+    date_str, channel = partition_date_and_channel(context)
+    metrics = asyncio.run(telegram_scraper.scrape_partition(
+        channel, date.fromisoformat(date_str), chunk_size=config.chunk_size,
+        download_workers=config.download_workers, thumbnail_only=config.thumbnail_only,
+        full_rescrape=config.full_rescrape,
+    ))
+    return MaterializeResult(metadata={**metrics, **instrumentation.snapshot("telegram_")})
+
+class LoadConfig(Config):
+    batch_size: int = load_raw_data.LOAD_BATCH_SIZE
+    force: bool = False
+
+@asset(partitions_def=date_channel_partitions, deps=[raw_telegram_files], group_name="raw")
+def raw_telegram_messages(context, config: LoadConfig, postgres: PostgresResource) -> MaterializeResult:
+    """raw_telegram.messages rows loaded from the partition's JSONL file in one transaction."""
+    date_str, channel = partition_date_and_channel(context)
+    file_path = load_raw_data.DATA_LAKE_PATH / date_str / f"{channel}.jsonl"
+    if not file_path.exists():
+        context.log.info(f"No messages file for {date_str}/{channel}; nothing to load.")
+        return MaterializeResult(metadata={"rows_loaded": 0, "skipped": True})
+
+    with postgres.get_connection() as conn:
+        load_raw_data.create_raw_table(conn)
+        channels_changed = load_raw_data.load_channel_info(conn)
+        start_time = time.perf_counter()
+        rows_loaded, skipped = load_raw_data.load_file_atomically(
+            conn, file_path, batch_size=config.batch_size, force=config.force
+        )
+        elapsed = time.perf_counter() - start_time
+    return MaterializeResult(metadata={
+        "rows_loaded": rows_loaded,
+        "skipped": skipped,
+        "channels_changed": channels_changed,
+        "rows_per_sec": instrumentation.rate(rows_loaded, elapsed),
+        **instrumentation.snapshot("loader_"),
+    })
+
+@asset(partitions_def=date_channel_partitions, deps=[raw_telegram_files], group_name="raw")
+def raw_image_detections(context, postgres: PostgresResource, yolo: YoloModelResource) -> MaterializeResult:
+    """raw_enrichment.image_detections rows for the partition's photos."""
+    date_str, channel = partition_date_and_channel(context)
+    with postgres.get_connection() as conn:
+        counts = yolo_enrichment.enrich_partition(
+            yolo.get_model(), conn, date_str, channel, batch_size=yolo.batch_size,
+            image_size=yolo.image_size, loader_threads=yolo.loader_threads, dedup_distance=yolo.dedup_distance,
+        )
+    return MaterializeResult(metadata={**counts, **instrumentation.snapshot("yolo_")})
+
+class TextEnrichmentConfig(Config):
+    batch_size: int = text_enrichment.TEXT_BATCH_SIZE
+    workers: int = text_enrichment.TEXT_WORKERS
+    # Clear earlier extractions and process every message again (e.g. after editing the product dictionary)
+    full_refresh: bool = False
+
+@asset(deps=[raw_telegram_messages], group_name="raw")
+def raw_product_mentions(context, config: TextEnrichmentConfig, postgres: PostgresResource) -> MaterializeResult:
+    """
+    raw_enrichment.product_mentions and message_phone_numbers for every message loaded or
+    re-loaded since the last run. Unpartitioned: one run covers all new partitions.
+    """
+    # One connection streams the source messages while the other commits each batch
+    with postgres.get_connection() as pg_conn, postgres.get_connection() as source_conn:
+        counts = text_enrichment.enrich_text(
+            pg_conn, source_conn, batch_size=config.batch_size, workers=config.workers,
+            full_refresh=config.full_refresh,
+        )
+    return MaterializeResult(metadata={**counts, **instrumentation.snapshot("text_")})
+
+class DbtConfig(Config):
+    # Rebuild the incremental models from all raw data instead of only newly loaded rows
+    full_refresh: bool = False
+
+@asset(deps=[raw_telegram_messages, raw_image_detections, raw_product_mentions], group_name="marts")
+def dbt_models(context, config: DbtConfig) -> MaterializeResult:
+    """The telegram_analytics dbt project, built and tested after the raw partitions."""
+    dbt_project_dir = get_project_root() / "telegram_analytics"
+
+    dbt_run_command = ["dbt", "run"]
+    if config.full_refresh:
+        dbt_run_command.append("--full-refresh")
+
+    context.log.info(f"Running dbt transformations: {' '.join(dbt_run_command)}")
+    dbt_run_result = subprocess.run(dbt_run_command, cwd=str(dbt_project_dir), capture_output=True, text=True)
     if dbt_run_result.returncode != 0:
-        print("dbt run error:", dbt_run_result.stderr)
+        context.log.error(f"dbt run error: {dbt_run_result.stdout}{dbt_run_result.stderr}")
         raise Exception("dbt run failed.")
-    print("dbt run output:", dbt_run_result.stdout)
-    
+    context.log.info(f"dbt run output: {dbt_run_result.stdout}")
+    # Read before `dbt test`, which overwrites run_results.json
+    model_seconds = instrumentation.record_dbt_run_results(str(dbt_project_dir / "target" / "run_results.json"))
+
     dbt_test_result = subprocess.run(["dbt", "test"], cwd=str(dbt_project_dir), capture_output=True, text=True)
     if dbt_test_result.returncode != 0:
-        print("dbt test error:", dbt_test_result.stderr)
+        context.log.error(f"dbt test error: {dbt_test_result.stdout}{dbt_test_result.stderr}")
         raise Exception("dbt test failed.")
-    print("dbt test output:", dbt_test_result.stdout)
-
-    print("dbt transformations completed successfully.")
-
-@op
-def run_yolo_enrichment_op(_trigger):
-    project_root = get_project_root()
-    script_path = project_root / "src" / "run_yolo_enrichment.py"
-    
-    print(f"Executing script: {script_path}")
-    result = subprocess.run([sys.executable, str(script_path)], capture_output=True, text=True)
-    
-    if result.returncode != 0:
-        print("Error output:", result.stderr)
-        raise Exception(f"YOLO enrichment script failed with return code {result.returncode}")
-        
-    print("Script output:", result.stdout)
-    print("YOLO enrichment completed successfully.")
-
-@job
-def telegram_analytics_job():
-    scraped = scrape_telegram_data_op()
-    
-    loaded = load_raw_to_postgres_op(scraped)
-    run_dbt_transformations_op(loaded)
-    
-    run_yolo_enrichment_op(scraped)
-
-
-
-# Define schedule (e.g., every day at 1am)
-telegram_schedule = ScheduleDefinition(
-    job=telegram_analytics_job,
-    cron_schedule="0 1 * * *",  # runs at 1:00 AM every day
+    context.log.info(f"dbt test output: {dbt_test_result.stdout}")
+
+    return MaterializeResult(metadata={
+        "full_refresh": config.full_refresh,
+        "dbt_run_seconds": instrumentation.DBT_RUN_SECONDS.value(command="run"),
+        "model_seconds": MetadataValue.json(model_seconds),
+        "slowest_model": next(iter(model_seconds), ""),
+    })
+
+# --- Jobs and schedules ---
+
+# Partitioned and unpartitioned assets can't share a job, so ingestion and dbt run separately
+telegram_ingest_job = define_asset_job(
+    "telegram_ingest_job",
+    selection=AssetSelection.assets(raw_telegram_files, raw_telegram_messages, raw_image_detections),
+    partitions_def=date_channel_partitions,
+)
+# Text extraction is unpartitioned, so it runs right before dbt rather than per partition
+dbt_transform_job = define_asset_job(
+    "dbt_transform_job", selection=AssetSelection.assets(raw_product_mentions, dbt_models)
+)
+
+# Partition dates are UTC days (scrape_channel_day pages by UTC midnight). 4:00 AM in Addis Ababa is
+# 01:00 UTC, so the previous UTC day has ended an hour before its partitions are requested.
+@schedule(job=telegram_ingest_job, cron_schedule="0 4 * * *", execution_timezone="Africa/Addis_Ababa")
+def telegram_ingest_schedule(context):
+    """Every day at 4:00 AM, ingests the previous UTC day for every channel (one run per channel)."""
+    day = (context.scheduled_execution_time.astimezone(timezone.utc).date() - timedelta(days=1)).isoformat()
+    return [
+        RunRequest(run_key=f"{day}|{channel}", partition_key=MultiPartitionKey({"date": day, "channel": channel}))
+        for channel in channel_partitions.get_partition_keys()
+    ]
+
+# dbt runs once the day's partitions have had time to land
+dbt_transform_schedule = ScheduleDefinition(
+    job=dbt_transform_job,
+    cron_schedule="0 6 * * *",
     execution_timezone="Africa/Addis_Ababa"
 )
 
 # Dagster discovers this
 defs = Definitions(
-    jobs=[telegram_analytics_job],
-    schedules=[telegram_schedule]
-)
\ No newline at end of file
+    assets=[raw_telegram_files, raw_telegram_messages, raw_image_detections, raw_product_mentions, dbt_models],
+    jobs=[telegram_ingest_job, dbt_transform_job],
+    schedules=[telegram_ingest_schedule, dbt_transform_schedule],
+    resources={
+        "postgres": PostgresResource(),
+        "yolo": YoloModelResource(),
+    },
+)
@@ -0,0 +1,132 @@
+# src/parquet_lake.py
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+JSONL_LAKE_PATH = PROJECT_ROOT / "data" / "raw" / "telegram_messages"
+# Hive-style layout: data/parquet/telegram_messages/post_date=YYYY-MM-DD/channel=<channel>/messages.parquet
+PARQUET_LAKE_PATH = Path(os.getenv("PARQUET_LAKE_PATH", str(PROJECT_ROOT / "data" / "parquet" / "telegram_messages")))
+PARQUET_COMPRESSION = os.getenv("PARQUET_COMPRESSION", "zstd")
+
+MESSAGE_SCHEMA = pa.schema([
+    ("message_id", pa.int64()),
+    ("channel_id", pa.int64()),
+    ("date", pa.timestamp("us", tz="UTC")),
+    ("views", pa.int32()),
+    ("forwards", pa.int32()),
+    ("text", pa.string()),
+    ("has_photo", pa.bool_()),
+    ("raw_json", pa.string()),   # the original JSONL line, unchanged
+])
+PARTITIONING = ds.partitioning(pa.schema([("post_date", pa.string()), ("channel", pa.string())]), flavor="hive")
+
+
+def _parse_date(value):
+    """Telethon dates are written by json.dumps(default=str), e.g. '2025-07-05 10:12:00+00:00'."""
+    return datetime.fromisoformat(value) if value else None
+
+
+def jsonl_to_table(jsonl_path: Path) -> pa.Table:
+    """Parses one JSONL partition into a typed Arrow table. Malformed lines are skipped."""
+    columns = {name: [] for name in MESSAGE_SCHEMA.names}
+    with jsonl_path.open('r', encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip("\r\n")
+            try:
+                data = json.loads(line)
+            except json.JSONDecodeError:
+                data = None
+            if not isinstance(data, dict):
+                print(f"Skipping malformed line in {jsonl_path.name}: {line[:200]}")
+                continue
+            peer = data.get("peer_id")
+            columns["message_id"].append(data.get("id"))
+            columns["channel_id"].append(peer.get("channel_id") if isinstance(peer, dict) else None)
+            columns["date"].append(_parse_date(data.get("date")))
+            columns["views"].append(data.get("views"))
+            columns["forwards"].append(data.get("forwards"))
+            columns["text"].append(data.get("message"))
+            columns["has_photo"].append(data.get("photo") is not None)
+            columns["raw_json"].append(line)
+    return pa.Table.from_pydict(columns, schema=MESSAGE_SCHEMA)
+
+
+def compact_partition(date_folder: Path, output_path: Path = PARQUET_LAKE_PATH, force: bool = False) -> int:
+    """
+    Converts every <channel>.jsonl in a date folder to Parquet. A channel file is skipped when its
+    Parquet file is newer than the JSONL. Returns the number of rows written.
+    """
+    rows_written = 0
+    for jsonl_path in sorted(date_folder.glob("*.jsonl")):
+        parquet_dir = output_path / f"post_date={date_folder.name}" / f"channel={jsonl_path.stem}"
+        parquet_path = parquet_dir / "messages.parquet"
+        if not force and parquet_path.exists() and parquet_path.stat().st_mtime >= jsonl_path.stat().st_mtime:
+            continue
+
+        table = jsonl_to_table(jsonl_path).sort_by("message_id")
+        parquet_dir.mkdir(parents=True, exist_ok=True)
+        # Write then rename, so readers never open a half-written file (dataset discovery skips dot-files)
+        tmp_path = parquet_dir / ".messages.parquet.tmp"
+        pq.write_table(table, tmp_path, compression=PARQUET_COMPRESSION)
+        os.replace(tmp_path, parquet_path)
+        rows_written += table.num_rows
+    return rows_written
+
+
+def compact_data_lake(dates=None, force: bool = False):
+    """Compacts all date partitions (or only `dates`) of the JSONL lake into Parquet."""
+    start_time = time.perf_counter()
+    total_rows = 0
+    for date_folder in sorted(JSONL_LAKE_PATH.iterdir()):
+        if not date_folder.is_dir() or (dates and date_folder.name not in dates):
+            continue
+        rows = compact_partition(date_folder, force=force)
+        if rows:
+            print(f"Compacted {date_folder.name}: {rows} rows.")
+        total_rows += rows
+    elapsed = time.perf_counter() - start_time
+    print(f"Wrote {total_rows} rows to {PARQUET_LAKE_PATH} in {elapsed:.2f}s.")
+    return total_rows
+
+
+def read_messages(columns=None, start_date: str = None, end_date: str = None, channels=None,
+                  lake_path: Path = PARQUET_LAKE_PATH) -> pa.Table:
+    """
+    Reads messages from the Parquet lake.
+    `columns` limits which columns are decoded (e.g. ['message_id', 'views']); `start_date` / `end_date`
+    ('YYYY-MM-DD', inclusive) and `channels` are pushed down to the post_date/channel partitions, so
+    files outside the range are never opened. The partition keys can be requested as the
+    'post_date' and 'channel' columns.
+    """
+    dataset = ds.dataset(str(lake_path), format="parquet", partitioning=PARTITIONING)
+
+    predicate = None
+    partition_date = ds.field("post_date")
+    for condition in (
+        partition_date >= start_date if start_date else None,
+        partition_date <= end_date if end_date else None,
+        ds.field("channel").isin(list(channels)) if channels else None,
+    ):
+        if condition is not None:
+            predicate = condition if predicate is None else predicate & condition
+    return dataset.to_table(columns=columns, filter=predicate)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compact the raw JSONL data lake into Parquet.")
+    parser.add_argument("--date", action="append", help="Only compact this YYYY-MM-DD partition (repeatable).")
+    parser.add_argument("--force", action="store_true", help="Rewrite Parquet files even if they are up to date.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    compact_data_lake(dates=args.date, force=args.force)
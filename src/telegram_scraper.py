@@ -1,22 +1,77 @@
 import os
+import argparse
 import asyncio
 import json
 import logging
-from datetime import datetime
+import shutil
+import time
+from collections import OrderedDict
+from datetime import date, datetime, time as dt_time, timedelta, timezone
 from pathlib import Path
 from urllib.parse import urlparse
 
 from dotenv import load_dotenv
 from telethon import TelegramClient
-from telethon.tl.types import Message
+from telethon.errors import FloodWaitError
+from telethon.tl.types import Message, PhotoSizeEmpty, PhotoStrippedSize
 
-# Load environment variables once
-os.environ.clear()
+from src import instrumentation
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the standard library encoder
+    orjson = None
+
+# Load environment variables once; values in .env win over the inherited environment.
+# (The environment is not cleared: the scraper also runs in-process inside Dagster.)
 load_dotenv(override=True)
 
 TELEGRAM_APP_ID = os.environ.get('telegram_app_id')
 TELEGRAM_API_HASH = os.environ.get("telegram_api_hash")
 
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Scraping settings (can be overridden from the command line)
+CHANNELS_FILE = os.environ.get("TELEGRAM_CHANNELS_FILE", os.path.join(PROJECT_ROOT, "config", "channels.txt"))
+SCRAPER_STATE_FILE = os.environ.get("TELEGRAM_SCRAPER_STATE_FILE", os.path.join(PROJECT_ROOT, "data", "state", "scraper_state.json"))
+MAX_CONCURRENT_CHANNELS = int(os.environ.get("TELEGRAM_MAX_CONCURRENT_CHANNELS", "4"))
+CHUNK_SIZE = int(os.environ.get("TELEGRAM_CHUNK_SIZE", "100"))
+# How many of the latest messages to fetch for a channel that has never been scraped
+INITIAL_LIMIT = int(os.environ.get("TELEGRAM_INITIAL_LIMIT", "200"))
+# Telethon sleeps through FloodWaits shorter than this itself; longer ones are handled in fetch_chunk
+FLOOD_SLEEP_THRESHOLD = int(os.environ.get("TELEGRAM_FLOOD_SLEEP_THRESHOLD", "60"))
+# JSONL writer limits: open partition files kept at once, and lines buffered per partition before a write
+WRITER_MAX_OPEN_FILES = int(os.environ.get("TELEGRAM_WRITER_MAX_OPEN_FILES", "64"))
+WRITER_BUFFER_LINES = int(os.environ.get("TELEGRAM_WRITER_BUFFER_LINES", "500"))
+# Media download stage: parallel downloads, queue bound, optional size cap (bytes, 0 = no cap)
+DOWNLOAD_WORKERS = int(os.environ.get("TELEGRAM_DOWNLOAD_WORKERS", "4"))
+DOWNLOAD_QUEUE_SIZE = int(os.environ.get("TELEGRAM_DOWNLOAD_QUEUE_SIZE", "200"))
+DOWNLOAD_MAX_BYTES = int(os.environ.get("TELEGRAM_DOWNLOAD_MAX_BYTES", "0"))
+# Thumbnail-only mode downloads this photo size type ('m' is 320px on the long side)
+THUMBNAIL_SIZE_TYPE = os.environ.get("TELEGRAM_THUMBNAIL_SIZE_TYPE", "m")
+PHOTO_INDEX_FILE = os.environ.get("TELEGRAM_PHOTO_INDEX_FILE", os.path.join(PROJECT_ROOT, "data", "state", "photo_index.json"))
+# One <channel>.json per scraped channel with its numeric id, username and title (loaded into raw_telegram.channels)
+CHANNEL_INFO_PATH = os.environ.get("TELEGRAM_CHANNEL_INFO_PATH", os.path.join(PROJECT_ROOT, "data", "raw", "channels"))
+
+# Metrics (see src/instrumentation.py)
+MESSAGES_SCRAPED = instrumentation.counter(
+    "telegram_messages_scraped_total", "Messages written to the data lake.", ("channel",)
+)
+SCRAPE_SECONDS = instrumentation.histogram(
+    "telegram_scrape_seconds", "Wall time of one scrape of a channel (or channel/day partition).", ("channel",)
+)
+FLOOD_WAIT_SECONDS = instrumentation.counter(
+    "telegram_flood_wait_seconds_total", "Seconds spent sleeping through FloodWait errors."
+)
+MEDIA_DOWNLOADS = instrumentation.counter(
+    "telegram_media_photos_total", "Photos handled by the media stage, by outcome.", ("outcome",)
+)
+MEDIA_BYTES_DOWNLOADED = instrumentation.counter(
+    "telegram_media_bytes_downloaded_total", "Bytes of photos downloaded from Telegram."
+)
+MEDIA_DOWNLOAD_SECONDS = instrumentation.histogram(
+    "telegram_media_download_seconds", "Time spent downloading one photo."
+)
+
 # --- 2. Helper Functions ---
 
 def get_channel_identifier(channel_url: str) -> str:
@@ -25,107 +80,597 @@ def get_channel_identifier(channel_url: str) -> str:
         return urlparse(channel_url).path.lstrip('/')
     return channel_url.lstrip('@')
 
-def get_data_lake_paths(base_path: Path, channel_identifier: str, msg_date: datetime):
+def load_channels(channels_file: str = CHANNELS_FILE) -> list:
+    """Reads the channels to scrape from a text file with one channel per line ('#' starts a comment)."""
+    with open(channels_file, 'r', encoding='utf-8') as f:
+        lines = (line.split('#', 1)[0].strip() for line in f)
+        return [line for line in lines if line]
+
+def load_scraper_state(state_file: str = SCRAPER_STATE_FILE) -> dict:
+    """
+    Loads per-channel scraping state:
+    {channel: {"last_message_id": int, "backfill_offset_id": int, "backfill_complete": bool}}
     """
-    Generates the partitioned directory structure for storing raw data.
-    Example: data/raw/telegram_messages/YYYY-MM-DD/channel_name.json
+    if not os.path.exists(state_file):
+        return {}
+    with open(state_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_scraper_state(state: dict, state_file: str = SCRAPER_STATE_FILE):
+    """Writes the state to a temp file and renames it, so a crash never leaves a half-written state file."""
+    os.makedirs(os.path.dirname(state_file), exist_ok=True)
+    tmp_file = f"{state_file}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_file, state_file)
+
+def save_channel_info(entity, channel_identifier: str, channel_info_path: str = CHANNEL_INFO_PATH):
+    """
+    Records the channel's id (the peer_id.channel_id of its messages), username and title, so the
+    API can look channels up by their real name. Written to a temp file and renamed, since
+    partition runs of the same channel may write it concurrently.
+    """
+    os.makedirs(channel_info_path, exist_ok=True)
+    record = {
+        "channel_id": entity.id,
+        "username": getattr(entity, "username", None),
+        "title": getattr(entity, "title", None),
+        "scraped_at": datetime.now(timezone.utc).isoformat(),
+    }
+    file_path = os.path.join(channel_info_path, f"{channel_identifier.replace('/', '_')}.json")
+    tmp_file = f"{file_path}.{os.getpid()}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(record, f, ensure_ascii=False)
+    os.replace(tmp_file, file_path)
+
+def encode_json_line(record: dict) -> str:
     """
-    date_str = msg_date.strftime("%Y-%m-%d")
-    
-    # Path for JSON data
-    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    json_path = os.path.join(project_root, 'data', 'raw', 'telegram_messages' , date_str)
+    Serializes a message dict as one JSON line, using orjson when installed.
+    Both paths write compact, non-ASCII-escaped UTF-8 and pass datetimes and bytes to `str`,
+    so a line is the same whichever encoder produced it.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(
+                record, default=str, option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+            ).decode('utf-8') + '\n'
+        except TypeError:
+            pass  # e.g. integers wider than 64 bits
+    return json.dumps(record, default=str, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+def _truncate_partial_line(path: str):
+    """Cuts a file back to its last newline, dropping a line left half-written by a crash."""
+    with open(path, 'rb+') as f:
+        data = f.read()
+        f.truncate(data.rfind(b'\n') + 1)
+
+class JsonlPartitionWriter:
+    """
+    Writes messages to data/raw/telegram_messages/YYYY-MM-DD/<channel>.jsonl partitions.
+
+    Lines are buffered per partition and written through one open handle per (date, channel);
+    the least recently used handle is closed once more than `max_open_files` are open. All writes
+    go to a '<channel>.jsonl.tmp' file next to the partition, which `commit()` renames over the
+    real file. The loader only globs '*.jsonl', so it never sees a half-written partition. The
+    partition's existing lines are copied into the temp file once, the first time this writer
+    touches it; after a commit the published file is renamed back to the temp name and appended
+    to, so repeated commits cost only the new lines. With `overwrite`, partitions start empty
+    instead, so a re-scraped partition replaces the old file rather than being appended to it.
+    """
+
+    def __init__(self, base_path: str, max_open_files: int = WRITER_MAX_OPEN_FILES,
+                 buffer_lines: int = WRITER_BUFFER_LINES, overwrite: bool = False):
+        self.base_path = base_path
+        self.overwrite = overwrite
+        self.max_open_files = max_open_files
+        self.buffer_lines = buffer_lines
+        self._open_files = OrderedDict()  # (date_str, channel) -> file handle, in LRU order
+        self._buffers = {}                # (date_str, channel) -> pending lines, for every uncommitted partition
+        self._seeded = set()              # partitions whose temp file this writer has opened since their last commit
+        self._published = set()           # partitions this writer has already committed at least once
+
+    def _paths(self, partition):
+        date_str, channel = partition
+        final_path = os.path.join(self.base_path, 'raw', 'telegram_messages', date_str, f'{channel}.jsonl')
+        return final_path, f'{final_path}.tmp'
+
+    def _handle(self, partition):
+        handle = self._open_files.get(partition)
+        if handle is not None:
+            self._open_files.move_to_end(partition)
+            return handle
 
-    os.makedirs(os.path.dirname(json_path), exist_ok=True)
+        final_path, tmp_path = self._paths(partition)
+        if partition in self._seeded:
+            # Reopened after an LRU close: keep appending to the same temp file
+            handle = open(tmp_path, 'a', encoding='utf-8')
+        elif partition in self._published and os.path.exists(final_path):
+            # Already seeded and published by this writer: take the file back instead of copying it
+            os.replace(final_path, tmp_path)
+            handle = open(tmp_path, 'a', encoding='utf-8')
+        else:
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            if os.path.exists(final_path) and not self.overwrite:
+                shutil.copyfile(final_path, tmp_path)
+                handle = open(tmp_path, 'a', encoding='utf-8')
+            elif os.path.exists(tmp_path) and not self.overwrite:
+                # A run died between taking a published file back and re-committing it, so the temp
+                # file holds the partition's only copy; keep its complete lines (the loader dedupes
+                # any messages that get scraped again)
+                _truncate_partial_line(tmp_path)
+                handle = open(tmp_path, 'a', encoding='utf-8')
+            else:
+                handle = open(tmp_path, 'w', encoding='utf-8')
+        self._seeded.add(partition)
 
-    json_file = os.path.join(json_path, f'{channel_identifier}.jsonl')
-    os.makedirs(os.path.dirname(json_file), exist_ok=True)
-    #json_file = json_path / f"{channel_identifier}.jsonl" # Using .jsonl for line-delimited JSON
+        self._open_files[partition] = handle
+        while len(self._open_files) > self.max_open_files:
+            _, idle_handle = self._open_files.popitem(last=False)
+            idle_handle.close()
+        return handle
 
-    # Path for images
-    image_path = os.path.join(base_path, 'raw', 'images', date_str, channel_identifier)
-    os.makedirs(os.path.dirname(image_path), exist_ok=True)
+    def _flush_buffer(self, partition):
+        lines = self._buffers.get(partition)
+        if lines:
+            self._handle(partition).writelines(lines)
+            lines.clear()
 
-    return json_file, image_path
+    def write(self, date_str: str, channel: str, record: dict):
+        partition = (date_str, channel)
+        lines = self._buffers.setdefault(partition, [])
+        lines.append(encode_json_line(record))
+        if len(lines) >= self.buffer_lines:
+            self._flush_buffer(partition)
+
+    def commit(self, channel: str = None):
+        """Flushes and atomically publishes every pending partition (only `channel`'s if given)."""
+        for partition in [p for p in self._buffers if channel is None or p[1] == channel]:
+            self._flush_buffer(partition)
+            handle = self._open_files.pop(partition, None)
+            if handle is None:
+                handle = self._handle(partition)
+                self._open_files.pop(partition)
+            handle.flush()
+            os.fsync(handle.fileno())
+            handle.close()
+            final_path, tmp_path = self._paths(partition)
+            os.replace(tmp_path, final_path)
+            self._seeded.discard(partition)
+            self._published.add(partition)
+            del self._buffers[partition]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.commit()
+
+def _photo_size_bytes(size) -> int:
+    """Byte size of a Telethon PhotoSize variant (progressive sizes list their steps; the last is complete)."""
+    if hasattr(size, 'sizes'):
+        return max(size.sizes)
+    if hasattr(size, 'size'):
+        return size.size
+    return len(getattr(size, 'bytes', b''))
+
+def pick_photo_size(photo, thumbnail_only: bool = False):
+    """
+    Chooses which size of a photo to download. Returns (size, expected_bytes);
+    size is passed to download_media as `thumb` (None means the full-size photo).
+    """
+    sizes = [s for s in photo.sizes if not isinstance(s, (PhotoSizeEmpty, PhotoStrippedSize))]
+    if not sizes:
+        return None, 0
+    largest = max(sizes, key=_photo_size_bytes)
+    if thumbnail_only:
+        thumb = next((s for s in sizes if getattr(s, 'type', None) == THUMBNAIL_SIZE_TYPE), None)
+        thumb = thumb or min(sizes, key=_photo_size_bytes)
+        return thumb, _photo_size_bytes(thumb)
+    return None, _photo_size_bytes(largest)
+
+class MediaDownloader:
+    """
+    Downloads message photos in the background so message iteration never waits on image I/O.
+
+    Photos are queued on a bounded asyncio queue and drained by `workers` download tasks.
+    A photo is skipped when the target file already exists with the expected size, and
+    deduplicated by Telegram photo id: a photo reposted in another message or channel is
+    copied from the first local copy instead of being downloaded again. The photo id index
+    is persisted so dedup also works across runs.
+    """
+
+    def __init__(self, client: TelegramClient, base_data_path: str, workers: int = DOWNLOAD_WORKERS,
+                 queue_size: int = DOWNLOAD_QUEUE_SIZE, max_bytes: int = DOWNLOAD_MAX_BYTES,
+                 thumbnail_only: bool = False, index_file: str = PHOTO_INDEX_FILE):
+        self.client = client
+        self.base_data_path = base_data_path
+        self.workers = workers
+        self.max_bytes = max_bytes
+        self.thumbnail_only = thumbnail_only
+        self.index_file = index_file
+        self._queue = asyncio.Queue(maxsize=queue_size)
+        self._tasks = []
+        self._in_flight = {}  # photo id -> future resolved with the downloaded path
+        self._pending = {}  # channel -> photos queued or downloading
+        self._channel_idle = {}  # channel -> Event set while it has no pending photos
+        self._photo_index = {}  # "<photo id>:<full|thumb>" -> path relative to base_data_path
+        self.metrics = {
+            "downloaded": 0, "bytes_downloaded": 0, "skipped_existing": 0,
+            "deduplicated": 0, "skipped_too_large": 0, "failed": 0, "download_seconds": 0.0,
+        }
+
+    async def __aenter__(self):
+        if os.path.exists(self.index_file):
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                self._photo_index = json.load(f)
+        self._started_at = time.perf_counter()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
+        tmp_file = f"{self.index_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self._photo_index, f)
+        os.replace(tmp_file, self.index_file)
+        self.print_metrics()
+
+    async def enqueue(self, message: Message, photo_path: str, channel: str = None):
+        """Queues a message's photo; waits if the queue is full so memory stays bounded."""
+        # Counted before the (possibly blocking) put, so drain(channel) can't miss it
+        self._pending[channel] = self._pending.get(channel, 0) + 1
+        self._channel_idle.setdefault(channel, asyncio.Event()).clear()
+        await self._queue.put((message, photo_path, channel))
+
+    async def drain(self, channel: str = None):
+        """
+        Waits until every photo queued for `channel` has been handled, or every queued photo
+        when no channel is given. Channels scraped concurrently don't wait for each other.
+        """
+        if channel is None:
+            await self._queue.join()
+        elif self._pending.get(channel):
+            await self._channel_idle[channel].wait()
+
+    def _photo_done(self, channel: str):
+        self._pending[channel] -= 1
+        if not self._pending[channel]:
+            self._channel_idle[channel].set()
+
+    def _index_key(self, photo_id: int) -> str:
+        return f"{photo_id}:{'thumb' if self.thumbnail_only else 'full'}"
+
+    async def _worker(self):
+        while True:
+            message, photo_path, channel = await self._queue.get()
+            try:
+                await self._download(message, photo_path)
+            except Exception as e:
+                self.metrics["failed"] += 1
+                MEDIA_DOWNLOADS.inc(outcome="failed")
+                print(f"Failed to download photo from message {message.id}. Error: {e}")
+            finally:
+                self._photo_done(channel)
+                self._queue.task_done()
+
+    async def _download(self, message: Message, photo_path: str):
+        photo = message.photo
+        thumb, expected_bytes = pick_photo_size(photo, self.thumbnail_only)
+        if self.max_bytes and expected_bytes > self.max_bytes:
+            self.metrics["skipped_too_large"] += 1
+            MEDIA_DOWNLOADS.inc(outcome="skipped_too_large")
+            return
+        if os.path.exists(photo_path) and (not expected_bytes or os.path.getsize(photo_path) == expected_bytes):
+            self.metrics["skipped_existing"] += 1
+            MEDIA_DOWNLOADS.inc(outcome="skipped_existing")
+            return
+
+        # Same photo already downloaded (or being downloaded) for another message: copy it locally
+        key = self._index_key(photo.id)
+        if key in self._in_flight:
+            source_path = await self._in_flight[key]
+        else:
+            known = self._photo_index.get(key)
+            source_path = os.path.join(self.base_data_path, known) if known else None
+        if source_path and os.path.exists(source_path):
+            if os.path.abspath(source_path) != os.path.abspath(photo_path):
+                shutil.copyfile(source_path, photo_path)
+            self.metrics["deduplicated"] += 1
+            MEDIA_DOWNLOADS.inc(outcome="deduplicated")
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        start_time = time.perf_counter()
+        try:
+            await self.client.download_media(photo, file=photo_path, thumb=thumb)
+            self.metrics["downloaded"] += 1
+            MEDIA_DOWNLOADS.inc(outcome="downloaded")
+            photo_bytes = os.path.getsize(photo_path)
+            self.metrics["bytes_downloaded"] += photo_bytes
+            MEDIA_BYTES_DOWNLOADED.inc(photo_bytes)
+            self._photo_index[key] = os.path.relpath(photo_path, self.base_data_path)
+            future.set_result(photo_path)
+        except Exception:
+            future.set_result(None)
+            raise
+        finally:
+            download_seconds = time.perf_counter() - start_time
+            self.metrics["download_seconds"] += download_seconds
+            MEDIA_DOWNLOAD_SECONDS.observe(download_seconds)
+            del self._in_flight[key]
+
+    def print_metrics(self):
+        m = self.metrics
+        elapsed = time.perf_counter() - self._started_at
+        mb = m["bytes_downloaded"] / (1024 * 1024)
+        print(
+            f"Media downloads: {m['downloaded']} downloaded ({mb:.1f} MiB, {mb / elapsed if elapsed > 0 else 0:.2f} MiB/s), "
+            f"{m['skipped_existing']} already on disk, {m['deduplicated']} deduplicated, "
+            f"{m['skipped_too_large']} over the size cap, {m['failed']} failed. "
+            f"Time spent in downloads: {m['download_seconds']:.1f}s across {self.workers} workers."
+        )
 
 # --- 3. Core Scraping Logic ---
 
-async def scrape_channel(client: TelegramClient, channel_url: str, base_data_path: Path):
+async def fetch_chunk(client: TelegramClient, entity, **kwargs) -> list:
+    """Fetches one page of messages, waiting out any FloodWait longer than Telethon's own threshold."""
+    while True:
+        try:
+            return await client.get_messages(entity, **kwargs)
+        except FloodWaitError as e:
+            print(f"Hit FloodWait; sleeping {e.seconds}s before retrying.")
+            FLOOD_WAIT_SECONDS.inc(e.seconds + 1)
+            await asyncio.sleep(e.seconds + 1)
+
+# Image directories already created during this run, so os.makedirs runs once per partition
+_created_image_dirs = set()
+
+async def save_message(downloader: MediaDownloader, writer: JsonlPartitionWriter, message: Message,
+                       channel_identifier: str, base_data_path: Path) -> bool:
+    """Saves one message to the data lake and queues its photo for download. Returns True if the message was written."""
+    # Partitions are laid out as data/raw/{telegram_messages,images}/YYYY-MM-DD/<channel>
+    date_str = message.date.strftime("%Y-%m-%d")
+    written = False
+
+    # a) Store raw, unaltered data as JSON, preserving the original structure 
+    try:
+        # Convert the Telethon message object to a dictionary and buffer it as a JSON line
+        writer.write(date_str, channel_identifier, message.to_dict())
+        written = True
+        MESSAGES_SCRAPED.inc(channel=channel_identifier)
+    except Exception as e:
+        print(f"Failed to write message {message.id} for {channel_identifier} on {date_str}. Error: {e}")
+
+    # b) Collect images for object detection 
+    if message.photo:
+        try:
+            image_path = os.path.join(base_data_path, 'raw', 'images', date_str, channel_identifier)
+            if image_path not in _created_image_dirs:
+                os.makedirs(image_path, exist_ok=True)
+                _created_image_dirs.add(image_path)
+            new_filename = f"{message.id}.jpg"
+            # Construct the full path for the new file
+            photo_path = os.path.join(image_path, new_filename)
+            # Hand the download to the media stage; it saves the photo to the specified path
+            await downloader.enqueue(message, photo_path, channel_identifier)
+        except Exception as e:
+            print(f"Failed to queue photo from message {message.id}. Error: {e}")
+
+    return written
+
+async def scrape_channel(client: TelegramClient, writer: JsonlPartitionWriter, downloader: MediaDownloader,
+                         channel_url: str, base_data_path: Path, state: dict,
+                         backfill: bool = False, chunk_size: int = CHUNK_SIZE):
     """
     Scrapes a single Telegram channel, saving messages to the data lake and downloading images.
+    Only messages newer than the channel's stored high-water mark are fetched. With `backfill`,
+    older history is then paged through in chunks; progress is saved after every chunk so an
+    interrupted backfill resumes where it stopped.
     """
     channel_identifier = get_channel_identifier(channel_url)
     print(f"Starting to scrape channel: {channel_identifier}")
+    start_time = time.perf_counter()
 
     try:
         entity = await client.get_entity(channel_identifier)
     except Exception as e:
         print(f"Could not get entity for '{channel_identifier}'. Error: {e}")
         return
+    save_channel_info(entity, channel_identifier)
 
+    channel_state = state.setdefault(channel_identifier, {})
+    last_message_id = channel_state.get("last_message_id", 0)
     messages_scraped_count = 0
-    async for message in client.iter_messages(entity, limit=200): # Limit can be adjusted
-        if not isinstance(message, Message):
-            continue
-
-        # Get paths for storing data in the data lake
-        json_file, image_path = get_data_lake_paths(base_data_path, channel_identifier, message.date)
-        
-        # a) Store raw, unaltered data as JSON, preserving the original structure 
-        try:
-            with open(json_file, 'a', encoding='utf-8') as f:
-                # Convert the Telethon message object to a dictionary and write as a JSON line
-                message_dict = message.to_dict()
-                f.write(json.dumps(message_dict, default=str) + '\n')
-            messages_scraped_count += 1
-        except Exception as e:
-            print(f"Failed to write message {message.id} to {json_file}. Error: {e}")
 
-        # b) Collect images for object detection 
-        if message.photo:
-            try:
-                new_filename = f"{message.id}.jpg"
-                # Construct the full path for the new file
-                photo_path = os.path.join(image_path, new_filename)
-                # Download the media and save it to the specified path
-                await client.download_media(message.photo, file=photo_path)
-                print(f"Saved image from message {message.id} to {photo_path}")
-            except Exception as e:
-                print(f"Failed to download photo from message {message.id}. Error: {e}")
+    # a) New messages, newest first, down to the high-water mark (or INITIAL_LIMIT on a first run).
+    # The mark is only moved once the whole gap is fetched, so an interrupted run leaves no holes.
+    newest_id = last_message_id
+    oldest_id = None
+    offset_id = 0
+    remaining = None if last_message_id else INITIAL_LIMIT
+    while remaining is None or remaining > 0:
+        limit = chunk_size if remaining is None else min(chunk_size, remaining)
+        messages = await fetch_chunk(client, entity, limit=limit, offset_id=offset_id, min_id=last_message_id)
+        if not messages:
+            break
+        for message in messages:
+            if isinstance(message, Message) and await save_message(downloader, writer, message, channel_identifier, base_data_path):
+                messages_scraped_count += 1
+        newest_id = max(newest_id, max(m.id for m in messages))
+        offset_id = min(m.id for m in messages)
+        oldest_id = offset_id if oldest_id is None else min(oldest_id, offset_id)
+        if remaining is not None:
+            remaining -= len(messages)
+        if len(messages) < limit:
+            break
+
+    # Publish the channel's partitions (and let its photos finish) before recording progress,
+    # so state never runs ahead of the data. The state is shared with the other channels' tasks,
+    # which may save it while this one waits, so it is only updated once the data is published.
+    await downloader.drain(channel_identifier)
+    writer.commit(channel_identifier)
+    channel_state["last_message_id"] = newest_id
+    if oldest_id is not None and "backfill_offset_id" not in channel_state:
+        # History older than the first scraped message is what a backfill has to fetch
+        channel_state["backfill_offset_id"] = oldest_id
+    save_scraper_state(state)
+
+    # b) Older history, oldest-known message backwards, one resumable chunk at a time
+    if backfill and not channel_state.get("backfill_complete"):
+        offset_id = channel_state.get("backfill_offset_id", 0)
+        while True:
+            messages = await fetch_chunk(client, entity, limit=chunk_size, offset_id=offset_id)
+            for message in messages:
+                if isinstance(message, Message) and await save_message(downloader, writer, message, channel_identifier, base_data_path):
+                    messages_scraped_count += 1
+            await downloader.drain(channel_identifier)
+            writer.commit(channel_identifier)
+            if messages:
+                offset_id = min(m.id for m in messages)
+                channel_state["backfill_offset_id"] = offset_id
+                channel_state["last_message_id"] = max(channel_state["last_message_id"], max(m.id for m in messages))
+            if len(messages) < chunk_size:
+                channel_state["backfill_complete"] = True
+            save_scraper_state(state)
+            if channel_state.get("backfill_complete"):
+                print(f"Backfill of {channel_identifier} is complete.")
+                break
+
+    elapsed = time.perf_counter() - start_time
+    SCRAPE_SECONDS.observe(elapsed, channel=channel_identifier)
+    print(f"Finished scraping {channel_identifier}. Scraped {messages_scraped_count} messages "
+          f"in {elapsed:.1f}s ({instrumentation.rate(messages_scraped_count, elapsed):.1f} msgs/sec).")
+
+async def scrape_channel_day(client: TelegramClient, writer: JsonlPartitionWriter, downloader: MediaDownloader,
+                             channel_url: str, base_data_path: Path, day: date,
+                             chunk_size: int = CHUNK_SIZE, min_id: int = 0) -> int:
+    """
+    Scrapes every message a channel posted on `day` (UTC) into that day's partition, paging
+    backwards from midnight of the next day. Only messages newer than `min_id` are fetched.
+    Used to (re)build a single date/channel partition; the incremental state file is left
+    untouched. Returns the number of messages written.
+    """
+    channel_identifier = get_channel_identifier(channel_url)
+    start_time = time.perf_counter()
+    entity = await client.get_entity(channel_identifier)
+    save_channel_info(entity, channel_identifier)
+    day_start = datetime.combine(day, dt_time.min, tzinfo=timezone.utc)
+    day_end = day_start + timedelta(days=1)
 
-    print(f"Finished scraping {channel_identifier}. Scraped {messages_scraped_count} messages.")
+    messages_scraped_count = 0
+    offset_id = 0
+    while True:
+        # The first page starts at the end of the day; later pages continue below the oldest message seen
+        page_kwargs = {"offset_id": offset_id} if offset_id else {"offset_date": day_end}
+        messages = await fetch_chunk(client, entity, limit=chunk_size, min_id=min_id, **page_kwargs)
+        in_day = [m for m in messages if isinstance(m, Message) and m.date >= day_start]
+        for message in in_day:
+            if await save_message(downloader, writer, message, channel_identifier, base_data_path):
+                messages_scraped_count += 1
+        if len(messages) < chunk_size or any(m.date < day_start for m in messages):
+            break
+        offset_id = min(m.id for m in messages)
+
+    await downloader.drain(channel_identifier)
+    writer.commit(channel_identifier)
+    elapsed = time.perf_counter() - start_time
+    SCRAPE_SECONDS.observe(elapsed, channel=channel_identifier)
+    print(f"Scraped {messages_scraped_count} messages from {channel_identifier} for {day.isoformat()} "
+          f"in {elapsed:.1f}s ({instrumentation.rate(messages_scraped_count, elapsed):.1f} msgs/sec).")
+    return messages_scraped_count
 
 
 # --- 4. Main Execution ---
 
-async def main():
+async def main(channels_file: str = CHANNELS_FILE, backfill: bool = False,
+               concurrency: int = MAX_CONCURRENT_CHANNELS, chunk_size: int = CHUNK_SIZE,
+               download_workers: int = DOWNLOAD_WORKERS, max_download_bytes: int = DOWNLOAD_MAX_BYTES,
+               thumbnail_only: bool = False):
     """
     Main function to initialize the client and orchestrate the scraping of all channels.
+    At most `concurrency` channels are scraped at the same time.
     """
     # Define the absolute path to the project's root directory
     # This makes the script runnable from anywhere
-    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    data_lake_base_path = os.path.join(project_root, 'data')
-    #data_lake_base_path = project_root / "data"
+    data_lake_base_path = os.path.join(PROJECT_ROOT, 'data')
 
     print(f"Data lake will be populated at: {data_lake_base_path}")
 
-    # List of channels to scrape
-    channels_to_scrape = [
-        "https://t.me/lobelia4cosmetics",
-        "https://t.me/tikvahpharma",
-    ]
-
-    async with TelegramClient('scraping_session', TELEGRAM_APP_ID, TELEGRAM_API_HASH) as client:
-        print("Telegram client started.")
-        tasks = []
-        for channel in channels_to_scrape:
-            # Create a scraping task for each channel
-            task = scrape_channel(client, channel, data_lake_base_path)
-            tasks.append(task)
-        
-        # Run all scraping tasks concurrently
-        await asyncio.gather(*tasks)
+    # Channels to scrape come from the channels file (config/channels.txt by default)
+    channels_to_scrape = load_channels(channels_file)
+    state = load_scraper_state()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def scrape_with_limit(channel):
+        async with semaphore:
+            try:
+                await scrape_channel(client, writer, downloader, channel, data_lake_base_path, state,
+                                     backfill=backfill, chunk_size=chunk_size)
+            except Exception as e:
+                # One failing channel shouldn't stop the others; its saved state lets the next run resume
+                print(f"Scraping {channel} failed. Error: {e}")
+
+    # Any partitions still pending (e.g. from a channel that failed) are published on exit
+    with JsonlPartitionWriter(data_lake_base_path) as writer:
+        async with TelegramClient('scraping_session', TELEGRAM_APP_ID, TELEGRAM_API_HASH) as client:
+            client.flood_sleep_threshold = FLOOD_SLEEP_THRESHOLD
+            print(f"Telegram client started. Scraping {len(channels_to_scrape)} channels, {concurrency} at a time.")
+            # Photos download in the background; leaving the block waits for the queue to drain
+            async with MediaDownloader(
+                client, data_lake_base_path, workers=download_workers,
+                max_bytes=max_download_bytes, thumbnail_only=thumbnail_only
+            ) as downloader:
+                # Run all scraping tasks concurrently, bounded by the semaphore
+                await asyncio.gather(*(scrape_with_limit(channel) for channel in channels_to_scrape))
+
+async def scrape_partition(channel: str, day: date, chunk_size: int = CHUNK_SIZE,
+                           download_workers: int = DOWNLOAD_WORKERS, max_download_bytes: int = DOWNLOAD_MAX_BYTES,
+                           thumbnail_only: bool = False, full_rescrape: bool = False) -> dict:
+    """
+    Fills the data/raw partitions of one channel for one day. Messages the incremental scraper
+    has already saved (up to the channel's last_message_id in the state file) are skipped and
+    the rest are appended to the day's JSONL file; with `full_rescrape` the whole day is fetched
+    again and the file is replaced. Returns the message count, throughput and download metrics.
+    """
+    start_time = time.perf_counter()
+    data_lake_base_path = os.path.join(PROJECT_ROOT, 'data')
+    min_id = 0 if full_rescrape else load_scraper_state().get(channel, {}).get("last_message_id", 0)
+    with JsonlPartitionWriter(data_lake_base_path, overwrite=full_rescrape) as writer:
+        async with TelegramClient('scraping_session', TELEGRAM_APP_ID, TELEGRAM_API_HASH) as client:
+            client.flood_sleep_threshold = FLOOD_SLEEP_THRESHOLD
+            async with MediaDownloader(
+                client, data_lake_base_path, workers=download_workers,
+                max_bytes=max_download_bytes, thumbnail_only=thumbnail_only
+            ) as downloader:
+                messages = await scrape_channel_day(client, writer, downloader, channel, data_lake_base_path, day,
+                                                    chunk_size=chunk_size, min_id=min_id)
+    elapsed = time.perf_counter() - start_time
+    return {
+        "messages": messages,
+        "min_id": min_id,
+        "messages_per_sec": instrumentation.rate(messages, elapsed),
+        "elapsed_seconds": elapsed,
+        **downloader.metrics,
+    }
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Scrape Telegram channels into the raw data lake.")
+    parser.add_argument("--channels-file", default=CHANNELS_FILE, help="File listing the channels to scrape, one per line.")
+    parser.add_argument("--backfill", action="store_true",
+                        help="After fetching new messages, page backwards through each channel's full history (resumable).")
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENT_CHANNELS, help="Channels scraped at the same time.")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Messages requested per API call.")
+    parser.add_argument("--download-workers", type=int, default=DOWNLOAD_WORKERS, help="Parallel photo downloads.")
+    parser.add_argument("--max-download-bytes", type=int, default=DOWNLOAD_MAX_BYTES,
+                        help="Skip photos larger than this many bytes (0 = no limit).")
+    parser.add_argument("--thumbnail-only", action="store_true",
+                        help=f"Download the '{THUMBNAIL_SIZE_TYPE}' thumbnail of each photo instead of the full size.")
+    return parser.parse_args()
 
 if __name__ == "__main__":
     # Ensure credentials are set
@@ -133,5 +678,15 @@ if __name__ == "__main__":
         print("FATAL ERROR: 'telegram_app_id' and 'telegram_api_hash' not found in environment variables.")
         print("Please create a .env file and add your Telegram credentials.")
     else:
+        args = parse_args()
         # Run the main asynchronous function
-        asyncio.run(main())
\ No newline at end of file
+        asyncio.run(main(
+            channels_file=args.channels_file,
+            backfill=args.backfill,
+            concurrency=args.concurrency,
+            chunk_size=args.chunk_size,
+            download_workers=args.download_workers,
+            max_download_bytes=args.max_download_bytes,
+            thumbnail_only=args.thumbnail_only,
+        ))
+        instrumentation.write_textfile("telegram_scraper")
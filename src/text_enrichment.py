@@ -0,0 +1,417 @@
+# src/text_enrichment.py
+"""
+Extracts structured facts from message text: product mentions (from the dictionary in
+config/products.txt, matched with an Aho-Corasick automaton), prices in ETB/birr and
+Ethiopian phone numbers. Results are bulk-loaded into raw_enrichment.product_mentions and
+raw_enrichment.message_phone_numbers, which the fct_product_mentions and agg_channel_contacts
+dbt models read.
+
+The stage is incremental on (channel_id, message_id): raw_enrichment.text_enriched_messages
+records every processed message with the loaded_at it was read at, so a run only picks up
+messages that are new (including backfilled older ones) or were re-loaded since. Its processed_at
+tells the dbt models which messages to rebuild, including ones that no longer mention anything.
+
+    python -m src.text_enrichment
+"""
+import argparse
+import csv
+import io
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal, InvalidOperation
+
+import psycopg2
+from dotenv import load_dotenv
+
+from src import instrumentation
+
+load_dotenv()
+# Database connection details from .env file
+DB_NAME = os.getenv("POSTGRES_DB")
+DB_USER = os.getenv("POSTGRES_USER")
+DB_PASSWORD = os.getenv("POSTGRES_PASSWORD")
+DB_HOST = "localhost"  # 'localhost' Or "db"if running this script inside a Docker container
+DB_PORT = "5432"
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PRODUCTS_FILE = os.getenv("TEXT_PRODUCTS_FILE", os.path.join(PROJECT_ROOT, "config", "products.txt"))
+# Messages per batch sent to a worker process (and per Postgres transaction)
+TEXT_BATCH_SIZE = int(os.getenv("TEXT_BATCH_SIZE", "20000"))
+TEXT_WORKERS = int(os.getenv("TEXT_WORKERS", str(os.cpu_count() or 1)))
+
+# Metrics (see src/instrumentation.py)
+MESSAGES_PROCESSED = instrumentation.counter("text_messages_processed_total", "Messages run through text extraction.")
+PRODUCT_MENTIONS = instrumentation.counter("text_product_mentions_total", "Product mentions extracted.")
+PRICES_FOUND = instrumentation.counter("text_prices_total", "Product mentions with a price.")
+PHONE_NUMBERS = instrumentation.counter("text_phone_numbers_total", "Phone numbers extracted.")
+BATCH_SECONDS = instrumentation.histogram("text_batch_seconds", "Time to extract one batch in a worker.")
+
+# --- Extraction ---
+
+# "1,200" or "350" (at most 7 digits, so phone numbers aren't read as prices), optional cents
+_AMOUNT = r"(?:\d{1,3}(?:,\d{3})+|\d{1,7})(?:\.\d{1,2})?"
+_CURRENCY = r"(?:etb|birr|br\.?|ብር)"
+# "350 ETB", "350birr", "1,200 ብር", "ETB 350", "Br. 350", and "ዋጋ 350" / "Price: 350" without a currency
+PRICE_PATTERN = re.compile(
+    rf"(?<![\w.,])(?P<suffixed>{_AMOUNT})\s*{_CURRENCY}(?!\w)"
+    rf"|(?<!\w){_CURRENCY}\s*[:፡]?\s*(?P<prefixed>{_AMOUNT})(?!,?\d)"
+    rf"|(?:ዋጋ|price)\s*[:፡-]?\s*(?P<labelled>{_AMOUNT})(?!,?\d)",
+    re.IGNORECASE,
+)
+# +251 9xx xxx xxx, 2519..., 09xx xxx xxx, 07..., and landlines like 011 xxx xxxx
+PHONE_PATTERN = re.compile(r"(?<![\w+])(?:(?:\+|00)?251[\s-]?|0)(?P<national>[1-9](?:[\s-]?\d){8})(?!\d)")
+# Fixed-line area codes; mobile numbers start with 9 (Ethio telecom) or 7 (Safaricom)
+LANDLINE_AREA_CODES = ("11", "22", "25", "33", "34", "46", "47", "57", "58")
+
+def load_product_dictionary(products_file: str = PRODUCTS_FILE) -> dict:
+    """Reads `Canonical name: alias, alias` lines ('#' starts a comment). Returns {lowercase alias: canonical name}."""
+    aliases = {}
+    with open(products_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            name, _, alias_list = line.partition(':')
+            name = name.strip()
+            for alias in [name, *alias_list.split(',')]:
+                alias = " ".join(alias.lower().split())
+                if alias:
+                    aliases[alias] = name
+    return aliases
+
+def build_automaton(aliases: dict):
+    """Compiles the aliases into one Aho-Corasick automaton, so each message is scanned once for all of them."""
+    import ahocorasick
+
+    automaton = ahocorasick.Automaton()
+    for alias, name in aliases.items():
+        automaton.add_word(alias, (len(alias), name))
+    automaton.make_automaton()
+    return automaton
+
+def _is_word_boundary(text: str, index: int) -> bool:
+    return index < 0 or index >= len(text) or not text[index].isalnum()
+
+def find_products(automaton, text: str) -> list:
+    """
+    Returns (start, end, canonical_name, matched_text) for whole-word alias matches in `text`,
+    in order. Overlapping matches keep the longest, so "vitamin c" wins over "vitamin".
+    """
+    lowered = text.lower()
+    matches = []
+    for end_index, (length, name) in automaton.iter(lowered):
+        start = end_index - length + 1
+        if _is_word_boundary(lowered, start - 1) and _is_word_boundary(lowered, end_index + 1):
+            matches.append((start, end_index + 1, name))
+    matches.sort(key=lambda m: (m[0], -(m[1] - m[0])))
+    selected = []
+    for start, end, name in matches:
+        if not selected or start >= selected[-1][1]:
+            selected.append((start, end, name))
+    return [(start, end, name, text[start:end]) for start, end, name in selected]
+
+def find_prices(text: str) -> list:
+    """Returns (start, amount) for every price in `text`, amounts as Decimal ETB."""
+    prices = []
+    for match in PRICE_PATTERN.finditer(text):
+        raw = match.group("suffixed") or match.group("prefixed") or match.group("labelled")
+        try:
+            amount = Decimal(raw.replace(",", ""))
+        except InvalidOperation:
+            continue
+        if amount > 0:
+            prices.append((match.start(), amount))
+    return prices
+
+def find_phone_numbers(text: str) -> list:
+    """Returns the distinct Ethiopian phone numbers in `text`, normalized to +251XXXXXXXXX."""
+    numbers = []
+    for match in PHONE_PATTERN.finditer(text):
+        national = re.sub(r"\D", "", match.group("national"))
+        if national[0] in "79" or national[:2] in LANDLINE_AREA_CODES:
+            number = "+251" + national
+            if number not in numbers:
+                numbers.append(number)
+    return numbers
+
+def extract_message(automaton, text: str) -> tuple:
+    """
+    Returns (mentions, phone_numbers) for one message, where mentions are
+    (canonical_name, matched_text, price) with one entry per distinct product. A price belongs to
+    the closest product mentioned before it (or the first product if it comes before all of them).
+    """
+    products = find_products(automaton, text)
+    phone_numbers = find_phone_numbers(text)
+    if not products:
+        return [], phone_numbers
+
+    product_prices = {}
+    for price_start, amount in find_prices(text):
+        owner = products[0][2]
+        for start, _, name, _ in products:
+            if start > price_start:
+                break
+            owner = name
+        product_prices.setdefault(owner, amount)
+
+    mentions, seen = [], set()
+    for _, _, name, matched_text in products:
+        if name not in seen:
+            seen.add(name)
+            mentions.append((name, matched_text, product_prices.get(name)))
+    return mentions, phone_numbers
+
+# --- Worker process ---
+
+# Built once per worker process by the pool initializer
+_worker_automaton = None
+
+def _init_worker(products_file: str):
+    global _worker_automaton
+    _worker_automaton = build_automaton(load_product_dictionary(products_file))
+
+def extract_batch(messages: list, automaton=None) -> tuple:
+    """
+    Extracts a batch of (channel_id, message_id, text, post_date, loaded_at) messages.
+    Returns (mention_rows, phone_rows, seconds) where mention rows are
+    (channel_id, message_id, mention_index, product_name, matched_text, price_etb, post_date)
+    and phone rows are (channel_id, message_id, phone_number, post_date).
+    """
+    automaton = automaton or _worker_automaton
+    start_time = time.perf_counter()
+    mention_rows, phone_rows = [], []
+    for channel_id, message_id, text, post_date, _ in messages:
+        if not text:
+            continue
+        mentions, phone_numbers = extract_message(automaton, text)
+        for mention_index, (name, matched_text, price) in enumerate(mentions):
+            mention_rows.append((channel_id, message_id, mention_index, name, matched_text, price, post_date))
+        for number in phone_numbers:
+            phone_rows.append((channel_id, message_id, number, post_date))
+    return mention_rows, phone_rows, time.perf_counter() - start_time
+
+def run_extraction(batches, workers: int = TEXT_WORKERS, products_file: str = PRODUCTS_FILE):
+    """
+    Extracts message batches on `workers` processes, yielding (batch, mention_rows, phone_rows) in
+    input order. At most two batches per worker are in flight, so memory stays bounded however
+    many messages the source yields.
+    """
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(products_file,)) as executor:
+        pending = deque()
+        for batch in batches:
+            pending.append((batch, executor.submit(extract_batch, batch)))
+            if len(pending) >= workers * 2:
+                yield _collect(*pending.popleft())
+        while pending:
+            yield _collect(*pending.popleft())
+
+def _collect(batch: list, future) -> tuple:
+    mention_rows, phone_rows, seconds = future.result()
+    MESSAGES_PROCESSED.inc(len(batch))
+    PRODUCT_MENTIONS.inc(len(mention_rows))
+    PRICES_FOUND.inc(sum(1 for row in mention_rows if row[5] is not None))
+    PHONE_NUMBERS.inc(len(phone_rows))
+    BATCH_SECONDS.observe(seconds)
+    return batch, mention_rows, phone_rows
+
+# --- Postgres ---
+
+COPY_MENTIONS_SQL = """
+    COPY raw_enrichment.product_mentions (
+        channel_id, message_id, mention_index, product_name, matched_text, price_etb, post_date
+    ) FROM STDIN WITH (FORMAT csv)
+"""
+COPY_PHONE_NUMBERS_SQL = """
+    COPY raw_enrichment.message_phone_numbers (channel_id, message_id, phone_number, post_date)
+    FROM STDIN WITH (FORMAT csv)
+"""
+COPY_PROCESSED_SQL = "COPY processed_stage (channel_id, message_id, post_date, source_loaded_at) FROM STDIN WITH (FORMAT csv)"
+
+# Messages that are new or were re-loaded (loaded_at moved) since they were last processed
+NEW_MESSAGES_SQL = """
+    SELECT
+        m.channel_id,
+        m.message_id,
+        m.raw_message_data ->> 'message',
+        m.raw_message_data ->> 'date',
+        m.loaded_at
+    FROM raw_telegram.messages m
+    LEFT JOIN raw_enrichment.text_enriched_messages p
+        ON p.channel_id = m.channel_id AND p.message_id = m.message_id
+    WHERE m.channel_id IS NOT NULL
+      AND (p.message_id IS NULL OR m.loaded_at > p.source_loaded_at)
+"""
+
+def create_text_tables(conn):
+    """Creates the raw_enrichment tables for text extraction, if they don't exist."""
+    with conn.cursor() as cur:
+        cur.execute("CREATE SCHEMA IF NOT EXISTS raw_enrichment;")
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS raw_enrichment.product_mentions (
+                channel_id BIGINT NOT NULL,
+                message_id BIGINT NOT NULL,
+                mention_index SMALLINT NOT NULL,     -- position of the product within the message
+                product_name TEXT NOT NULL,          -- canonical name from the product dictionary
+                matched_text TEXT NOT NULL,          -- the alias as written in the message
+                price_etb NUMERIC(12, 2),
+                post_date TIMESTAMP WITH TIME ZONE,
+                extracted_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT timezone('utc', now()),
+                PRIMARY KEY (channel_id, message_id, mention_index)
+            );
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS raw_enrichment.message_phone_numbers (
+                channel_id BIGINT NOT NULL,
+                message_id BIGINT NOT NULL,
+                phone_number TEXT NOT NULL,          -- normalized to +251XXXXXXXXX
+                post_date TIMESTAMP WITH TIME ZONE,
+                extracted_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT timezone('utc', now()),
+                PRIMARY KEY (channel_id, message_id, phone_number)
+            );
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS raw_enrichment.text_enriched_messages (
+                channel_id BIGINT NOT NULL,
+                message_id BIGINT NOT NULL,
+                source_loaded_at TIMESTAMP WITH TIME ZONE NOT NULL,   -- raw_telegram.messages.loaded_at when read
+                post_date TIMESTAMP WITH TIME ZONE,
+                -- When the message's extractions were last replaced; the dbt models rebuild messages by this,
+                -- including ones that no longer have any mention
+                processed_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT timezone('utc', now()),
+                PRIMARY KEY (channel_id, message_id)
+            );
+        """)
+        # Tables created before post_date/processed_at existed. ALTER TABLE takes an exclusive lock
+        # even when the columns exist, so only run it when needed.
+        cur.execute("""
+            SELECT count(*) FROM information_schema.columns
+            WHERE table_schema = 'raw_enrichment' AND table_name = 'text_enriched_messages'
+              AND column_name IN ('post_date', 'processed_at');
+        """)
+        if cur.fetchone()[0] < 2:
+            cur.execute("""
+                ALTER TABLE raw_enrichment.text_enriched_messages
+                    ADD COLUMN IF NOT EXISTS post_date TIMESTAMP WITH TIME ZONE,
+                    ADD COLUMN IF NOT EXISTS processed_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT timezone('utc', now());
+            """)
+        cur.execute("CREATE INDEX IF NOT EXISTS text_enriched_messages_processed_at_idx ON raw_enrichment.text_enriched_messages (processed_at);")
+        cur.execute("CREATE INDEX IF NOT EXISTS product_mentions_extracted_at_idx ON raw_enrichment.product_mentions (extracted_at);")
+        cur.execute("CREATE INDEX IF NOT EXISTS message_phone_numbers_extracted_at_idx ON raw_enrichment.message_phone_numbers (extracted_at);")
+    conn.commit()
+    print("Schema 'raw_enrichment' and tables 'product_mentions', 'message_phone_numbers', 'text_enriched_messages' are ready.")
+
+def _csv_buffer(rows) -> io.StringIO:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    return buffer
+
+def store_batch(conn, batch: list, mention_rows: list, phone_rows: list):
+    """
+    Replaces the extractions of the batch's messages and marks them processed, in one
+    transaction, so an interrupted run resumes after the last stored batch.
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS processed_stage (
+                channel_id BIGINT, message_id BIGINT, post_date TIMESTAMPTZ, source_loaded_at TIMESTAMPTZ
+            ) ON COMMIT DELETE ROWS;
+        """)
+        cur.copy_expert(COPY_PROCESSED_SQL, _csv_buffer((m[0], m[1], m[3], m[4]) for m in batch))
+        for table in ("product_mentions", "message_phone_numbers"):
+            cur.execute(f"""
+                DELETE FROM raw_enrichment.{table} t
+                USING processed_stage s
+                WHERE t.channel_id = s.channel_id AND t.message_id = s.message_id;
+            """)
+        if mention_rows:
+            cur.copy_expert(COPY_MENTIONS_SQL, _csv_buffer(mention_rows))
+        if phone_rows:
+            cur.copy_expert(COPY_PHONE_NUMBERS_SQL, _csv_buffer(phone_rows))
+        cur.execute("""
+            INSERT INTO raw_enrichment.text_enriched_messages (channel_id, message_id, post_date, source_loaded_at)
+            SELECT channel_id, message_id, post_date, source_loaded_at FROM processed_stage
+            ON CONFLICT (channel_id, message_id) DO UPDATE
+                SET source_loaded_at = EXCLUDED.source_loaded_at,
+                    post_date = EXCLUDED.post_date,
+                    processed_at = timezone('utc', now());
+        """)
+    conn.commit()
+
+def _fetch_batches(cursor, batch_size: int):
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield rows
+
+def enrich_text(pg_conn, source_conn, batch_size: int = TEXT_BATCH_SIZE, workers: int = TEXT_WORKERS,
+                products_file: str = PRODUCTS_FILE, full_refresh: bool = False) -> dict:
+    """
+    Extracts products, prices and phone numbers from every message that is new or re-loaded since
+    it was last processed, and stores them batch by batch on `pg_conn`. Messages are read through a
+    server-side cursor on `source_conn`, a second connection, so the source query stays open while
+    batches are committed. Returns counts for the run.
+    """
+    create_text_tables(pg_conn)
+    if full_refresh:
+        with pg_conn.cursor() as cur:
+            cur.execute("TRUNCATE raw_enrichment.product_mentions, raw_enrichment.message_phone_numbers, raw_enrichment.text_enriched_messages;")
+        pg_conn.commit()
+
+    messages = mentions = phone_numbers = 0
+    start_time = time.perf_counter()
+    try:
+        with source_conn.cursor(name="text_enrichment_source") as source:
+            source.itersize = batch_size
+            source.execute(NEW_MESSAGES_SQL)
+            for batch, mention_rows, phone_rows in run_extraction(
+                _fetch_batches(source, batch_size), workers=workers, products_file=products_file
+            ):
+                store_batch(pg_conn, batch, mention_rows, phone_rows)
+                messages += len(batch)
+                mentions += len(mention_rows)
+                phone_numbers += len(phone_rows)
+                print(f"Processed {messages} messages: {mentions} product mentions, {phone_numbers} phone numbers.")
+    finally:
+        # Ends the read-only transaction the server-side cursor ran in
+        source_conn.rollback()
+
+    elapsed = time.perf_counter() - start_time
+    messages_per_sec = instrumentation.rate(messages, elapsed)
+    print(f"Text enrichment finished: {messages} messages in {elapsed:.2f}s ({messages_per_sec:.0f} messages/sec).")
+    return {
+        "messages": messages,
+        "product_mentions": mentions,
+        "phone_numbers": phone_numbers,
+        "messages_per_sec": messages_per_sec,
+    }
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Extract products, prices and phone numbers from message text.")
+    parser.add_argument("--batch-size", type=int, default=TEXT_BATCH_SIZE, help="Messages per worker batch and transaction.")
+    parser.add_argument("--workers", type=int, default=TEXT_WORKERS, help="Number of extraction worker processes.")
+    parser.add_argument("--products-file", default=PRODUCTS_FILE, help="Product dictionary (see config/products.txt).")
+    parser.add_argument("--full-refresh", action="store_true",
+                        help="Clear earlier extractions and process every message again.")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    connections = []
+    try:
+        for _ in range(2):
+            connections.append(psycopg2.connect(
+                dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD, host=DB_HOST, port=DB_PORT
+            ))
+        enrich_text(*connections, batch_size=args.batch_size, workers=args.workers,
+                    products_file=args.products_file, full_refresh=args.full_refresh)
+    except psycopg2.OperationalError as e:
+        print(f"Could not connect to the database. Is it running? Error: {e}")
+    finally:
+        for conn in connections:
+            conn.close()
+        instrumentation.write_textfile("text_enrichment")
@@ -1,95 +1,736 @@
 # src/yolo_enrichment.py
+import argparse
 import csv
+import hashlib
+import io
+import json
 import os
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from pathlib import Path
-from ultralytics import YOLO
+import psycopg2
+from dotenv import load_dotenv
 
-def enrich_images_with_yolo():
+from src import detectors, image_dedup, instrumentation
+
+load_dotenv()
+# Database connection details from .env file
+DB_NAME = os.getenv("POSTGRES_DB")
+DB_USER = os.getenv("POSTGRES_USER")
+DB_PASSWORD = os.getenv("POSTGRES_PASSWORD")
+DB_HOST = "localhost"  # 'localhost' Or "db"if running this script inside a Docker container
+DB_PORT = "5432"
+
+# Inference engine defaults (can be overridden from the command line)
+YOLO_MODEL_PATH = os.getenv("YOLO_MODEL_PATH", "yolov8n.pt")
+# torch, onnx or onnx-int8 (see src/detectors.py)
+YOLO_BACKEND = os.getenv("YOLO_BACKEND", "torch")
+YOLO_BATCH_SIZE = int(os.getenv("YOLO_BATCH_SIZE", "16"))
+YOLO_IMAGE_SIZE = int(os.getenv("YOLO_IMAGE_SIZE", "640"))
+YOLO_WORKERS = int(os.getenv("YOLO_WORKERS", str(max(1, (os.cpu_count() or 1) // 2))))
+YOLO_LOADER_THREADS = int(os.getenv("YOLO_LOADER_THREADS", "4"))
+# Max Hamming distance (of 64 dHash bits) at which an image counts as a repost of one already
+# inferred and reuses its detections; a negative value turns deduplication off
+YOLO_DEDUP_DISTANCE = int(os.getenv("YOLO_DEDUP_DISTANCE", "4"))
+
+CSV_HEADER = ['image_path', 'message_id', 'channel_id', 'detected_object_class_id', 'detected_object_name', 'confidence_score', 'bounding_box_xyxy']
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DETECTION_INDEX_PATH = os.getenv(
+    "YOLO_DETECTION_INDEX_PATH", os.path.join(PROJECT_ROOT, "data", "enrichment", "yolo_detection_index.sqlite")
+)
+
+def find_image_files(image_data_path: str) -> list:
+    """Returns every image under the data lake's images folder, in a stable order."""
+    image_files = []
+    for root, _, files in os.walk(image_data_path):
+        for file in files:
+            if file.lower().endswith(IMAGE_EXTENSIONS):
+                image_files.append(os.path.join(root, file))
+    return sorted(image_files)
+
+def parse_image_path(image_path: str):
+    """
+    Extracts message_id and channel_id from an image path.
+    Assumes path format: .../data/raw/images/YYYY-MM-DD/channel_id/message_id.jpg
+    """
+    p = Path(image_path)
+    return p.stem, p.parent.name  # e.g. ('18523', 'lobelia4cosmetics')
+
+# Metrics (see src/instrumentation.py); recorded in the main process from the workers' results
+IMAGES_INFERRED = instrumentation.counter("yolo_images_inferred_total", "Images run through the detector.")
+DETECTIONS = instrumentation.counter("yolo_detections_total", "Objects detected.")
+IMAGES_DEDUPLICATED = instrumentation.counter(
+    "yolo_images_deduplicated_total", "Images that reused the detections of a near-duplicate instead of inference."
+)
+IMAGE_LATENCY = instrumentation.histogram(
+    "yolo_image_latency_seconds", "Per-image decode plus inference time.",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+
+def _record_detection_metrics(latencies: list, rows: list):
+    IMAGES_INFERRED.inc(len(latencies))
+    DETECTIONS.inc(len(rows))
+    for latency in latencies:
+        IMAGE_LATENCY.observe(latency)
+
+# --- Worker process ---
+
+# Loaded once per worker process by the pool initializer
+_worker_model = None
+_worker_image_size = YOLO_IMAGE_SIZE
+
+def _init_worker(model_path: str, backend: str, image_size: int, threads: int):
+    global _worker_model, _worker_image_size
+    # Split the CPU cores between worker processes instead of letting each one grab them all
+    _worker_model = load_model(model_path, backend, threads)
+    _worker_image_size = image_size
+
+def _load_image(image_path: str, image_size: int):
+    """
+    Decodes an image and shrinks it so its longer side is `image_size`.
+    Returns (image, scale, decode_seconds); scale maps boxes back to original pixels.
+    """
+    import cv2
+
+    start_time = time.perf_counter()
+    image = cv2.imread(image_path)
+    if image is None:
+        return None, 1.0, time.perf_counter() - start_time
+    height, width = image.shape[:2]
+    scale = image_size / max(height, width)
+    if scale < 1.0:
+        image = cv2.resize(image, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+    else:
+        scale = 1.0
+    return image, scale, time.perf_counter() - start_time
+
+def _prefetched_batches(image_paths: list, batch_size: int, image_size: int, loader_threads: int):
+    """
+    Yields batches of decoded images while the thread pool decodes the next ones,
+    so image I/O overlaps with inference. At most two batches are in flight.
+    """
+    with ThreadPoolExecutor(max_workers=loader_threads) as loader:
+        pending = deque()
+        paths = iter(image_paths)
+        for path in paths:
+            pending.append((path, loader.submit(_load_image, path, image_size)))
+            if len(pending) >= batch_size * 2:
+                break
+
+        while pending:
+            batch = []
+            while pending and len(batch) < batch_size:
+                path, future = pending.popleft()
+                batch.append((path, *future.result()))
+                next_path = next(paths, None)
+                if next_path is not None:
+                    pending.append((next_path, loader.submit(_load_image, next_path, image_size)))
+            yield batch
+
+def load_model(model_path: str = YOLO_MODEL_PATH, backend: str = YOLO_BACKEND, threads: int = 0):
+    """Loads the YOLO model on a detector backend (its library is imported lazily so this module imports without it)."""
+    return detectors.load_detector(model_path, backend, threads)
+
+def detect_images(model, image_paths: list, batch_size: int = YOLO_BATCH_SIZE, image_size: int = YOLO_IMAGE_SIZE,
+                  loader_threads: int = YOLO_LOADER_THREADS):
+    """
+    Runs detection over `image_paths` in batches on an already loaded model.
+    Returns (csv_rows, per_image_latencies_in_seconds, processed_image_paths).
+    """
+    rows = []
+    latencies = []
+    processed = []
+    for batch in _prefetched_batches(image_paths, batch_size, image_size, loader_threads):
+        readable = [item for item in batch if item[1] is not None]
+        for path, image, _, _ in batch:
+            if image is None:
+                print(f"Warning: Could not decode image, skipping: {path}")
+        if not readable:
+            continue
+
+        start_time = time.perf_counter()
+        results = model.detect([image for _, image, _, _ in readable], image_size)
+        inference_per_image = (time.perf_counter() - start_time) / len(readable)
+
+        for (path, _, scale, decode_seconds), (class_ids, confidences, boxes) in zip(readable, results):
+            latencies.append(decode_seconds + inference_per_image)
+            processed.append(path)
+            if not class_ids:
+                continue
+            message_id, channel_id = parse_image_path(path)
+            for class_id, confidence, box in zip(class_ids, confidences, boxes):
+                rows.append([
+                    path,
+                    message_id,
+                    channel_id,
+                    class_id,
+                    model.names[class_id],
+                    confidence,
+                    [coordinate / scale for coordinate in box]  # [x1, y1, x2, y2]
+                ])
+    return rows, latencies, processed
+
+def _detect_shard(image_paths: list, batch_size: int, loader_threads: int):
+    """Runs detection over a shard of images on the worker's model (see detect_images)."""
+    return detect_images(_worker_model, image_paths, batch_size, _worker_image_size, loader_threads)
+
+# --- Detection index ---
+
+def file_content_hash(file_path: str) -> str:
+    """Returns the SHA-256 hex digest of a file."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def open_detection_index(index_path: str = DETECTION_INDEX_PATH):
+    """
+    Opens (and creates if needed) the SQLite side store that remembers which images
+    have been through detection. Images with zero detections are recorded too,
+    so they are not re-inferred on the next run.
+    """
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    # Partitioned Dagster runs share the index, so wait on a busy database instead of failing
+    conn = sqlite3.connect(index_path, timeout=60)
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS images (
+            image_path TEXT PRIMARY KEY,   -- relative to data/raw/images
+            content_hash TEXT NOT NULL,
+            file_size INTEGER NOT NULL,
+            file_mtime REAL NOT NULL,
+            detection_count INTEGER NOT NULL,
+            processed_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE TABLE IF NOT EXISTS detections (
+            image_path TEXT NOT NULL REFERENCES images (image_path),
+            message_id TEXT,
+            channel_id TEXT,
+            detected_object_class_id INTEGER,
+            detected_object_name TEXT,
+            confidence_score REAL,
+            bounding_box_xyxy TEXT
+        );
+        CREATE INDEX IF NOT EXISTS detections_image_path_idx ON detections (image_path);
+    """)
+    # Perceptual-hash columns for near-duplicate reuse, added to indexes created before them.
+    # source_image_path is set when an image's detections were copied from another image.
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(images)")}
+    for column, column_type in (("dhash", "INTEGER"), ("width", "INTEGER"), ("height", "INTEGER"),
+                                ("source_image_path", "TEXT")):
+        if column not in existing:
+            conn.execute(f"ALTER TABLE images ADD COLUMN {column} {column_type}")
+    conn.commit()
+    return conn
+
+def select_images_to_process(conn, image_files: list, image_data_path: str, scope: str = ""):
+    """
+    Compares images on disk with the index. Returns ({absolute_path: content_hash} for
+    images that are new or changed, [relative paths dropped from the index]).
+    Size and mtime are checked first; the content hash is only computed when they differ.
+    Index entries whose file is gone are dropped. With `scope` (a relative directory such as
+    'YYYY-MM-DD/channel'), only index entries under it are compared against `image_files`.
+    """
+    scope_pattern = f"{scope.rstrip('/')}/%" if scope else "%"
+    indexed = {
+        row[0]: row[1:]
+        for row in conn.execute(
+            "SELECT image_path, content_hash, file_size, file_mtime FROM images WHERE image_path LIKE ?",
+            (scope_pattern,)
+        )
+    }
+    to_process = {}
+    seen = set()
+    for image_path in image_files:
+        rel_path = Path(os.path.relpath(image_path, image_data_path)).as_posix()
+        seen.add(rel_path)
+        stat = os.stat(image_path)
+        entry = indexed.get(rel_path)
+        if entry is not None and entry[1] == stat.st_size and entry[2] == stat.st_mtime:
+            continue
+        content_hash = file_content_hash(image_path)
+        if entry is not None and entry[0] == content_hash:
+            conn.execute(
+                "UPDATE images SET file_size = ?, file_mtime = ? WHERE image_path = ?",
+                (stat.st_size, stat.st_mtime, rel_path)
+            )
+            continue
+        to_process[image_path] = content_hash
+
+    removed = [path for path in indexed if path not in seen]
+    if removed:
+        conn.executemany("DELETE FROM detections WHERE image_path = ?", [(p,) for p in removed])
+        conn.executemany("DELETE FROM images WHERE image_path = ?", [(p,) for p in removed])
+        print(f"Dropped {len(removed)} images from the detection index that are no longer on disk.")
+    conn.commit()
+    return to_process, removed
+
+def record_detections(conn, image_data_path: str, processed: list, rows: list, content_hashes: dict,
+                      image_hashes: dict = None, sources: dict = None):
+    """
+    Replaces the index entries of freshly processed images with their new detections.
+    `image_hashes` ({path: (dhash, width, height)}) and `sources` ({path: relative path of the
+    image whose detections were reused}) are stored for near-duplicate lookup.
+    """
+    image_hashes = image_hashes or {}
+    sources = sources or {}
+    counts = {path: 0 for path in processed}
+    for row in rows:
+        counts[row[0]] += 1
+
+    def rel(path):
+        return Path(os.path.relpath(path, image_data_path)).as_posix()
+
+    with conn:
+        conn.executemany("DELETE FROM detections WHERE image_path = ?", [(rel(p),) for p in processed])
+        conn.executemany(
+            """
+            INSERT OR REPLACE INTO images (image_path, content_hash, file_size, file_mtime, detection_count,
+                                           dhash, width, height, source_image_path, processed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            """,
+            [
+                (
+                    rel(p), content_hashes[p], os.stat(p).st_size, os.stat(p).st_mtime, counts[p],
+                    *_hash_columns(image_hashes.get(p)), sources.get(p)
+                )
+                for p in processed
+            ]
+        )
+        conn.executemany(
+            "INSERT INTO detections VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(rel(row[0]), *row[1:6], str(row[6])) for row in rows]
+        )
+
+# --- Near-duplicate reuse ---
+
+def _hash_columns(image_hash):
+    if image_hash is None:
+        return None, None, None
+    value, width, height = image_hash
+    return image_dedup.to_signed(value), width, height
+
+def load_hash_tree(conn) -> image_dedup.BKTree:
+    """BK-tree of the inferred images in the index (copies are left out, so matches never chain)."""
+    tree = image_dedup.BKTree()
+    for image_path, value in conn.execute(
+        "SELECT image_path, dhash FROM images WHERE dhash IS NOT NULL AND source_image_path IS NULL"
+    ):
+        tree.add(image_dedup.to_unsigned(value), image_path)
+    return tree
+
+def plan_deduplication(conn, image_paths: list, image_data_path: str, max_distance: int = YOLO_DEDUP_DISTANCE,
+                       threads: int = YOLO_LOADER_THREADS):
+    """
+    Hashes `image_paths` and splits them into images that need inference and near-duplicates of an
+    image that is already in the index or is itself about to be inferred. Returns
+    (to_infer, {duplicate_path: source relative path}, {path: (dhash, width, height)}).
+    """
+    image_hashes = image_dedup.compute_hashes(image_paths, threads)
+    if max_distance < 0:
+        return list(image_paths), {}, image_hashes
+
+    tree = load_hash_tree(conn)
+    to_infer = []
+    duplicates = {}
+    for image_path in image_paths:
+        image_hash = image_hashes.get(image_path)
+        match = tree.nearest(image_hash[0], max_distance) if image_hash is not None else None
+        if match is not None:
+            duplicates[image_path] = match[1]
+            continue
+        to_infer.append(image_path)
+        if image_hash is not None:
+            # Later copies in the same run match this image once its detections are recorded
+            tree.add(image_hash[0], Path(os.path.relpath(image_path, image_data_path)).as_posix())
+    return to_infer, duplicates, image_hashes
+
+def reuse_detections(conn, duplicates: dict, image_hashes: dict):
+    """
+    Builds detection rows for near-duplicates from the index entries of their sources, with
+    each duplicate's own message_id and channel, and boxes scaled to its size. Returns
+    (rows, reused image paths, image paths whose source is missing from the index).
+    """
+    rows = []
+    reused = []
+    missing = []
+    for image_path, source in duplicates.items():
+        source_entry = conn.execute("SELECT width, height FROM images WHERE image_path = ?", (source,)).fetchone()
+        if source_entry is None:
+            missing.append(image_path)
+            continue
+        message_id, channel_id = parse_image_path(image_path)
+        _, width, height = image_hashes[image_path]
+        for class_id, class_name, confidence, box in conn.execute(
+            """
+            SELECT detected_object_class_id, detected_object_name, confidence_score, bounding_box_xyxy
+            FROM detections WHERE image_path = ? ORDER BY rowid
+            """,
+            (source,)
+        ):
+            box = json.loads(box)
+            if source_entry[0] and source_entry[1]:
+                box = image_dedup.scale_box(box, source_entry, (width, height))
+            rows.append([image_path, message_id, channel_id, class_id, class_name, confidence, box])
+        reused.append(image_path)
+    IMAGES_DEDUPLICATED.inc(len(reused))
+    return rows, reused, missing
+
+def write_detections_csv(conn, image_data_path: str, output_csv_path: str) -> int:
+    """Rewrites the seed CSV from the index, merging old and new detections. Returns the row count."""
+    row_count = 0
+    with open(output_csv_path, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(CSV_HEADER)
+        cursor = conn.execute("""
+            SELECT image_path, message_id, channel_id, detected_object_class_id,
+                   detected_object_name, confidence_score, bounding_box_xyxy
+            FROM detections
+            ORDER BY image_path, rowid
+        """)
+        for row in cursor:
+            writer.writerow([os.path.join(image_data_path, *row[0].split('/')), *row[1:]])
+            row_count += 1
+    return row_count
+
+# --- Postgres sink ---
+
+COPY_DETECTIONS_SQL = """
+    COPY raw_enrichment.image_detections (
+        image_path, detection_index, message_id, channel_username, post_date,
+        detected_object_class_id, detected_object_name, confidence_score,
+        box_x1, box_y1, box_x2, box_y2
+    ) FROM STDIN WITH (FORMAT csv)
+"""
+
+def create_detections_table(conn):
+    """Creates the schema and table that hold image detections, if they don't exist."""
+    with conn.cursor() as cur:
+        cur.execute("CREATE SCHEMA IF NOT EXISTS raw_enrichment;")
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS raw_enrichment.image_detections (
+                image_path TEXT NOT NULL,            -- relative to data/raw/images
+                detection_index SMALLINT NOT NULL,   -- position of the box within the image
+                message_id BIGINT NOT NULL,
+                channel_username TEXT NOT NULL,
+                post_date DATE,                      -- the image's date folder
+                detected_object_class_id INTEGER NOT NULL,
+                detected_object_name TEXT NOT NULL,
+                confidence_score REAL NOT NULL,
+                box_x1 REAL NOT NULL,
+                box_y1 REAL NOT NULL,
+                box_x2 REAL NOT NULL,
+                box_y2 REAL NOT NULL,
+                detected_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT timezone('utc', now()),
+                PRIMARY KEY (image_path, detection_index)
+            );
+        """)
+        # Tables created before post_date existed: add it and fill it from the path. ALTER TABLE
+        # takes an exclusive lock even when the column exists, so only run it when needed.
+        cur.execute("""
+            SELECT count(*) FROM information_schema.columns
+            WHERE table_schema = 'raw_enrichment' AND table_name = 'image_detections' AND column_name = 'post_date';
+        """)
+        if cur.fetchone()[0] == 0:
+            cur.execute("ALTER TABLE raw_enrichment.image_detections ADD COLUMN IF NOT EXISTS post_date DATE;")
+            cur.execute("UPDATE raw_enrichment.image_detections SET post_date = CAST(split_part(image_path, '/', 1) AS date);")
+        cur.execute("CREATE INDEX IF NOT EXISTS image_detections_message_id_idx ON raw_enrichment.image_detections (message_id);")
+        cur.execute("CREATE INDEX IF NOT EXISTS image_detections_channel_post_date_idx ON raw_enrichment.image_detections (channel_username, post_date);")
+        cur.execute("CREATE INDEX IF NOT EXISTS image_detections_detected_at_idx ON raw_enrichment.image_detections (detected_at);")
+    conn.commit()
+    print("Schema 'raw_enrichment' and table 'image_detections' are ready.")
+
+def copy_detections_to_postgres(conn, rel_paths: list, rows: list):
     """
-    Scans for images in the data lake, runs YOLOv8 object detection,
-    and saves the structured results to a CSV file for dbt to process.
+    Replaces the detections of `rel_paths` with `rows` in one transaction.
+    `rows` are (relative_image_path, message_id, channel_username, class_id, class_name,
+    confidence, [x1, y1, x2, y2]) and are bulk-loaded with COPY.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    box_counts = {}
+    for image_path, message_id, channel_username, class_id, class_name, confidence, box in rows:
+        detection_index = box_counts.get(image_path, 0)
+        box_counts[image_path] = detection_index + 1
+        # Paths start with the post date folder: YYYY-MM-DD/<channel>/<message_id>.jpg
+        post_date = image_path.split('/', 1)[0]
+        writer.writerow([
+            image_path, detection_index, message_id, channel_username, post_date, class_id, class_name, confidence, *box
+        ])
+    buffer.seek(0)
+
+    with conn.cursor() as cur:
+        if rel_paths:
+            cur.execute("DELETE FROM raw_enrichment.image_detections WHERE image_path = ANY(%s::text[]);", (list(rel_paths),))
+        if rows:
+            cur.copy_expert(COPY_DETECTIONS_SQL, buffer)
+    conn.commit()
+
+def backfill_postgres_from_index(conn, index):
+    """Copies everything in the detection index into an empty Postgres table (e.g. on first use of the sink)."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT EXISTS (SELECT 1 FROM raw_enrichment.image_detections);")
+        if cur.fetchone()[0]:
+            return
+    rows = [
+        (*row[:6], json.loads(row[6]))
+        for row in index.execute("""
+            SELECT image_path, message_id, channel_id, detected_object_class_id,
+                   detected_object_name, confidence_score, bounding_box_xyxy
+            FROM detections
+            ORDER BY image_path, rowid
+        """)
+    ]
+    if rows:
+        copy_detections_to_postgres(conn, [], rows)
+        print(f"Backfilled {len(rows)} detections from the detection index into Postgres.")
+
+# --- Main process ---
+
+def _percentile(sorted_values: list, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, round(pct / 100 * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+def run_detection(image_files: list, batch_size: int = YOLO_BATCH_SIZE, image_size: int = YOLO_IMAGE_SIZE,
+                  workers: int = YOLO_WORKERS, loader_threads: int = YOLO_LOADER_THREADS, backend: str = YOLO_BACKEND):
+    """
+    Runs detection over `image_files` and yields (csv_rows, processed_image_paths) per shard.
+    Images are split into shards that run on `workers` CPU processes, each of
+    which loads the model once and infers in batches of `batch_size`.
+    """
+    workers = max(1, min(workers, len(image_files) // batch_size + 1))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    # Export (or find the cached export) once here rather than racing to do it in every worker
+    model_path = detectors.resolve_model_path(YOLO_MODEL_PATH, backend)
+    # Several batches per shard keeps the model busy; several shards per worker keeps the load balanced
+    shard_size = batch_size * 4
+    shards = [image_files[i:i + shard_size] for i in range(0, len(image_files), shard_size)]
+    print(f"Running detection on {len(image_files)} images: {backend} backend, {workers} workers, "
+          f"batch size {batch_size}, image size {image_size}.")
+
+    latencies = []
+    start_time = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(model_path, backend, image_size, threads),
+    ) as executor:
+        futures = [executor.submit(_detect_shard, shard, batch_size, loader_threads) for shard in shards]
+        for future in as_completed(futures):
+            rows, shard_latencies, processed = future.result()
+            latencies.extend(shard_latencies)
+            _record_detection_metrics(shard_latencies, rows)
+            yield rows, processed
+
+    elapsed = time.perf_counter() - start_time
+    latencies.sort()
+    images_per_sec = instrumentation.rate(len(latencies), elapsed)
+    print(f"Successfully processed {len(latencies)} images in {elapsed:.2f}s ({images_per_sec:.1f} images/sec).")
+    print(f"Per-image latency: p50 {_percentile(latencies, 50) * 1000:.1f} ms, p95 {_percentile(latencies, 95) * 1000:.1f} ms.")
+
+def enrich_images_with_yolo(batch_size: int = YOLO_BATCH_SIZE, image_size: int = YOLO_IMAGE_SIZE,
+                            workers: int = YOLO_WORKERS, loader_threads: int = YOLO_LOADER_THREADS,
+                            full_refresh: bool = False, sink: str = "postgres",
+                            dedup_distance: int = YOLO_DEDUP_DISTANCE, backend: str = YOLO_BACKEND):
+    """
+    Scans for images in the data lake, runs YOLOv8 object detection on `backend`,
+    and saves the structured results to raw_enrichment.image_detections (sink="postgres")
+    and/or the dbt seed CSV (sink="csv").
+    Only images that are new or changed since the last run are inferred; results
+    are kept in a detection index and merged with earlier ones. Images within
+    `dedup_distance` dHash bits of an already detected image reuse its detections.
     """
     # Define project paths using os.path
-    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    image_data_path = os.path.join(project_root, "data", "raw", "images")
-    seeds_path = os.path.join(project_root, "telegram_analytics", "seeds")
+    image_data_path = os.path.join(PROJECT_ROOT, "data", "raw", "images")
+    seeds_path = os.path.join(PROJECT_ROOT, "telegram_analytics", "seeds")
     output_csv_path = os.path.join(seeds_path, "image_detections.csv")
 
     # Ensure the output directory for the seed file exists
     os.makedirs(seeds_path, exist_ok=True)
 
-    # Load the pre-trained YOLOv8 model.
-    try:
-        model = YOLO('yolov8n.pt')
-        print("YOLOv8 model loaded successfully.")
-    except Exception as e:
-        print(f"Failed to load YOLOv8 model. Have you run 'pip install ultralytics'? Error: {e}")
+    print(f"Processing images from: {image_data_path}")
+    image_files = find_image_files(image_data_path)
+    if not image_files:
+        print("Warning: No images found to process. Make sure your scraping task is saving images with message IDs.")
         return
 
-    # Prepare the CSV file to store detection results
+    def rel(path):
+        return Path(os.path.relpath(path, image_data_path)).as_posix()
+
+    pg_conn = None
+    index = open_detection_index()
+    try:
+        if sink in ("postgres", "both"):
+            pg_conn = psycopg2.connect(
+                dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD, host=DB_HOST, port=DB_PORT
+            )
+            create_detections_table(pg_conn)
+
+        if full_refresh:
+            with index:
+                index.execute("DELETE FROM detections")
+                index.execute("DELETE FROM images")
+            if pg_conn is not None:
+                with pg_conn.cursor() as cur:
+                    cur.execute("TRUNCATE raw_enrichment.image_detections;")
+                pg_conn.commit()
+        to_process, removed = select_images_to_process(index, image_files, image_data_path)
+        print(f"{len(to_process)} new or changed images out of {len(image_files)}.")
+
+        if pg_conn is not None:
+            backfill_postgres_from_index(pg_conn, index)
+            if removed:
+                copy_detections_to_postgres(pg_conn, removed, [])
+
+        if to_process:
+            to_infer, duplicates, image_hashes = plan_deduplication(
+                index, sorted(to_process), image_data_path, max_distance=dedup_distance, threads=loader_threads
+            )
+            if duplicates:
+                print(f"{len(duplicates)} images are near-duplicates of already detected images; reusing their detections.")
+
+            def store(rows, processed, sources=None):
+                # Postgres goes first: if it fails, the images are not marked done in the index.
+                if pg_conn is not None:
+                    copy_detections_to_postgres(
+                        pg_conn, [rel(p) for p in processed], [(rel(row[0]), *row[1:]) for row in rows]
+                    )
+                record_detections(index, image_data_path, processed, rows, to_process, image_hashes, sources)
+
+            def infer(image_paths):
+                if not image_paths:
+                    return
+                for rows, processed in run_detection(
+                    image_paths, batch_size=batch_size, image_size=image_size,
+                    workers=workers, loader_threads=loader_threads, backend=backend
+                ):
+                    # Each shard is committed as it finishes, so an interrupted run keeps its progress
+                    store(rows, processed)
+
+            try:
+                infer(to_infer)
+                # Copies are resolved once their sources (possibly inferred just now) are in the index
+                rows, reused, missing = reuse_detections(index, duplicates, image_hashes)
+                store(rows, reused, {p: duplicates[p] for p in reused})
+                infer(missing)
+            except Exception as e:
+                print(f"An error occurred during the enrichment process. Is the detector backend installed ('pip install ultralytics', plus onnxruntime for ONNX)? Error: {e}")
+                return
+
+        if pg_conn is not None:
+            print("Detection results saved to: raw_enrichment.image_detections")
+        if sink in ("csv", "both"):
+            row_count = write_detections_csv(index, image_data_path, output_csv_path)
+            print(f"Detection results ({row_count} rows) saved to: {output_csv_path}")
+    except psycopg2.OperationalError as e:
+        print(f"Could not connect to the database. Is it running? Error: {e}")
+    finally:
+        index.close()
+        if pg_conn is not None:
+            pg_conn.close()
+
+def enrich_partition(model, pg_conn, date_str: str, channel: str, batch_size: int = YOLO_BATCH_SIZE,
+                     image_size: int = YOLO_IMAGE_SIZE, loader_threads: int = YOLO_LOADER_THREADS,
+                     dedup_distance: int = YOLO_DEDUP_DISTANCE) -> dict:
+    """
+    Runs detection in-process on the new or changed images of one date/channel partition and
+    writes them to raw_enrichment.image_detections and the detection index. Near-duplicates of
+    images detected before (in any partition) reuse their detections. Detections of images
+    removed from the partition are dropped. Returns counts for the run.
+    """
+    image_data_path = os.path.join(PROJECT_ROOT, "data", "raw", "images")
+    image_files = find_image_files(os.path.join(image_data_path, date_str, channel))
+
+    def rel(path):
+        return Path(os.path.relpath(path, image_data_path)).as_posix()
+
+    index = open_detection_index()
     try:
-        with open(output_csv_path, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.writer(csvfile)
-            # Write the header row for the CSV (message_id is now included)
-            writer.writerow(['image_path', 'message_id', 'channel_id', 'detected_object_class_id', 'detected_object_name', 'confidence_score', 'bounding_box_xyxy'])
-
-            print(f"Processing images from: {image_data_path}")
-            
-            image_files = []
-            for root, _, files in os.walk(image_data_path):
-                for file in files:
-                    if file.lower().endswith(('.png', '.jpg', '.jpeg')):
-                        image_files.append(os.path.join(root, file))
-
-            if not image_files:
-                print("Warning: No images found to process. Make sure your scraping task is saving images with message IDs.")
+        create_detections_table(pg_conn)
+        to_process, removed = select_images_to_process(index, image_files, image_data_path, scope=f"{date_str}/{channel}")
+        if removed:
+            copy_detections_to_postgres(pg_conn, removed, [])
+        to_infer, duplicates, image_hashes = plan_deduplication(
+            index, sorted(to_process), image_data_path, max_distance=dedup_distance, threads=loader_threads
+        )
+
+        def store(rows, processed, sources=None):
+            copy_detections_to_postgres(
+                pg_conn, [rel(p) for p in processed], [(rel(row[0]), *row[1:]) for row in rows]
+            )
+            record_detections(index, image_data_path, processed, rows, to_process, image_hashes, sources)
+
+        inferred, latencies, detection_count = [], [], 0
+
+        def infer(image_paths):
+            nonlocal detection_count
+            if not image_paths:
                 return
+            rows, image_latencies, processed = detect_images(
+                model, image_paths, batch_size=batch_size, image_size=image_size, loader_threads=loader_threads
+            )
+            _record_detection_metrics(image_latencies, rows)
+            store(rows, processed)
+            inferred.extend(processed)
+            latencies.extend(image_latencies)
+            detection_count += len(rows)
+
+        start_time = time.perf_counter()
+        infer(to_infer)
+        # Copies are resolved once their sources (possibly inferred just now) are in the index
+        rows, reused, missing = reuse_detections(index, duplicates, image_hashes)
+        store(rows, reused, {p: duplicates[p] for p in reused})
+        detection_count += len(rows)
+        infer(missing)
+        elapsed = time.perf_counter() - start_time
+    finally:
+        index.close()
+
+    print(f"Partition {date_str}/{channel}: {len(inferred)} of {len(image_files)} images inferred, "
+          f"{len(reused)} reused from near-duplicates, {detection_count} detections.")
+    return {
+        "images": len(image_files),
+        "images_inferred": len(inferred),
+        "images_deduplicated": len(reused),
+        "images_removed": len(removed),
+        "detections": detection_count,
+        "images_per_sec": instrumentation.rate(len(inferred) + len(reused), elapsed),
+        "p95_latency_ms": _percentile(sorted(latencies), 95) * 1000,
+    }
 
-            # Run detection on all images
-            results = model(image_files, stream=True)
-
-            # Process results for each image
-            for result in results:
-                if result.boxes is None:
-                    continue
-
-                current_image_path = result.path
-                
-                # --- THIS IS THE MODIFIED PART ---
-                # Extract message_id and channel_id from the file path
-                # Assumes path format: .../data/raw/images/YYYY-MM-DD/channel_id/message_id.jpg
-                try:
-                    p = Path(current_image_path)
-                    message_id = p.stem  # e.g., '18523' from '18523.jpg'
-                    channel_id = p.parent.name # e.g., 'lobelia4cosmetics'
-                except Exception as e:
-                    print(f"Warning: Could not parse message_id/channel_id from path: {current_image_path}. Error: {e}")
-                    continue
-                # --- END OF MODIFIED PART ---
-
-                # Iterate through each detected object in the image
-                for box in result.boxes:
-                    class_id = int(box.cls[0])
-                    class_name = model.names[class_id]
-                    confidence = float(box.conf[0])
-                    bounding_box = box.xyxy[0].tolist() # [x1, y1, x2, y2]
-
-                    # Write the detection details as a new row in the CSV
-                    writer.writerow([
-                        current_image_path,
-                        message_id,
-                        channel_id,
-                        class_id,
-                        class_name,
-                        confidence,
-                        str(bounding_box) # Store bounding box as a string
-                    ])
-            
-            print(f"Successfully processed {len(image_files)} images.")
-            print(f"Detection results saved to: {output_csv_path}")
-
-    except Exception as e:
-        print(f"An error occurred during the enrichment process: {e}")
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run YOLOv8 object detection over scraped Telegram images.")
+    parser.add_argument("--batch-size", type=int, default=YOLO_BATCH_SIZE, help="Images per inference batch.")
+    parser.add_argument("--image-size", type=int, default=YOLO_IMAGE_SIZE, help="Inference image size in pixels.")
+    parser.add_argument("--backend", choices=detectors.BACKENDS, default=YOLO_BACKEND,
+                        help="Detector backend: PyTorch, or an ONNX export on onnxruntime (optionally INT8-quantized).")
+    parser.add_argument("--workers", type=int, default=YOLO_WORKERS, help="Number of inference worker processes.")
+    parser.add_argument("--loader-threads", type=int, default=YOLO_LOADER_THREADS,
+                        help="Threads per worker used to decode and resize upcoming images.")
+    parser.add_argument("--sink", choices=["postgres", "csv", "both"], default="postgres",
+                        help="Write detections to raw_enrichment.image_detections (default), the dbt seed CSV, or both.")
+    parser.add_argument("--dedup-distance", type=int, default=YOLO_DEDUP_DISTANCE,
+                        help="Max dHash Hamming distance for an image to reuse a near-duplicate's detections (-1 = off).")
+    parser.add_argument("--full-refresh", action="store_true",
+                        help="Clear the detection index and run detection on every image again.")
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    enrich_images_with_yolo()
+    args = parse_args()
+    enrich_images_with_yolo(
+        batch_size=args.batch_size,
+        image_size=args.image_size,
+        workers=args.workers,
+        loader_threads=args.loader_threads,
+        full_refresh=args.full_refresh,
+        sink=args.sink,
+        dedup_distance=args.dedup_distance,
+        backend=args.backend,
+    )
+    instrumentation.write_textfile("yolo_enrichment")
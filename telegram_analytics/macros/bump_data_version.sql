@@ -0,0 +1,20 @@
+{#
+    Bumps pipeline_meta.data_version at the end of every `dbt run` / `dbt build`.
+    The API polls this single row to drop cached responses when new data lands.
+#}
+{% macro bump_data_version() %}
+    {% if flags.WHICH in ('run', 'build') %}
+        CREATE SCHEMA IF NOT EXISTS pipeline_meta;
+        CREATE TABLE IF NOT EXISTS pipeline_meta.data_version (
+            id INTEGER PRIMARY KEY,
+            version BIGINT NOT NULL,
+            updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT timezone('utc', now())
+        );
+        INSERT INTO pipeline_meta.data_version (id, version) VALUES (1, 1)
+        ON CONFLICT (id) DO UPDATE
+            SET version = pipeline_meta.data_version.version + 1,
+                updated_at = timezone('utc', now());
+    {% else %}
+        SELECT 1;
+    {% endif %}
+{% endmacro %}
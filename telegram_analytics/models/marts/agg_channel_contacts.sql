@@ -0,0 +1,24 @@
+-- Phone numbers each channel posts for orders, extracted by src/text_enrichment.py.
+-- One row per (channel, number), so it is small enough to rebuild on every run.
+{{
+    config(
+        materialized='table',
+        indexes=[
+            {'columns': ['channel_id', 'phone_number'], 'unique': True},
+        ]
+    )
+}}
+
+SELECT
+    pn.channel_id,
+    dc.channel_name,
+    pn.phone_number,
+    COUNT(*) AS message_count,
+    MIN(pn.post_date) AS first_seen_at,
+    MAX(pn.post_date) AS last_seen_at
+FROM
+    {{ source('raw_enrichment', 'message_phone_numbers') }} AS pn
+LEFT JOIN
+    {{ ref('dim_channels') }} AS dc ON pn.channel_id = dc.channel_id
+GROUP BY
+    pn.channel_id, dc.channel_name, pn.phone_number
@@ -0,0 +1,38 @@
+-- Daily posting activity per channel, pre-aggregated for /api/channels/{channel}/activity and the
+-- batched /api/channels/activity. The API resolves channels in dim_channels and filters on channel_id;
+-- channel_name here is as of the day's last rebuild.
+-- Incremental: only the (channel, day) pairs touched by newly loaded messages are recomputed.
+{{
+    config(
+        materialized='incremental',
+        unique_key=['channel_id', 'post_date'],
+        incremental_strategy='delete+insert',
+        indexes=[
+            {'columns': ['channel_id', 'post_date'], 'unique': True},
+            {'columns': ['channel_name', 'post_date']},
+        ]
+    )
+}}
+
+SELECT
+    fm.channel_id,
+    dc.channel_name,
+    dd.full_date::date AS post_date,
+    COUNT(fm.message_id) AS message_count,
+    COALESCE(SUM(fm.view_count), 0) AS total_views,
+    MAX(fm.loaded_at) AS last_loaded_at
+FROM
+    {{ ref('fct_messages') }} AS fm
+JOIN
+    {{ ref('dim_channels') }} AS dc ON fm.channel_id = dc.channel_id
+JOIN
+    {{ ref('dim_dates') }} AS dd ON fm.date_dim_id = dd.date_dim_id
+{% if is_incremental() %}
+WHERE (fm.channel_id, fm.date_dim_id) IN (
+    SELECT DISTINCT channel_id, date_dim_id
+    FROM {{ ref('fct_messages') }}
+    WHERE loaded_at > (SELECT COALESCE(MAX(last_loaded_at), '1900-01-01'::timestamptz) FROM {{ this }})
+)
+{% endif %}
+GROUP BY
+    fm.channel_id, dc.channel_name, dd.full_date
@@ -0,0 +1,20 @@
+-- Detection counts per object class, pre-aggregated for /api/reports/top-visual-content.
+-- One row per class, so it is small enough to rebuild on every run.
+{{
+    config(
+        materialized='table',
+        indexes=[
+            {'columns': ['mention_count']},
+        ]
+    )
+}}
+
+SELECT
+    detected_object_name,
+    COUNT(*) AS mention_count,
+    COUNT(DISTINCT message_id) AS message_count,
+    AVG(confidence_score) AS avg_confidence_score
+FROM
+    {{ ref('fct_image_detections') }}
+GROUP BY
+    detected_object_name
@@ -0,0 +1,51 @@
+-- Mentions and quoted prices per product and day, pre-aggregated for /api/reports/top-products
+-- and /api/reports/price-trends. price_sum and priced_mention_count let the API roll days up into
+-- weeks or months with an exact average.
+-- Incremental: every day with a message re-extracted since the last run is rebuilt. The pre-hook
+-- deletes those days first, so products that lost all their mentions on a day drop out of it.
+-- Needs a full refresh once after upgrading from the last_extracted_at version.
+{{
+    config(
+        materialized='incremental',
+        unique_key=['product_name', 'post_date'],
+        incremental_strategy='delete+insert',
+        on_schema_change='sync_all_columns',
+        pre_hook="""
+            {% if is_incremental() %}
+            DELETE FROM {{ this }}
+            WHERE post_date IN (
+                SELECT DISTINCT post_date::date
+                FROM {{ source('raw_enrichment', 'text_enriched_messages') }}
+                WHERE processed_at > (SELECT COALESCE(MAX(last_processed_at), '1900-01-01'::timestamptz) FROM {{ this }})
+            )
+            {% endif %}
+        """,
+        indexes=[
+            {'columns': ['product_name', 'post_date'], 'unique': True},
+            {'columns': ['post_date']},
+        ]
+    )
+}}
+
+SELECT
+    product_name,
+    post_date::date AS post_date,
+    COUNT(*) AS mention_count,
+    COUNT(price_etb) AS priced_mention_count,
+    SUM(price_etb) AS price_sum,
+    MIN(price_etb) AS min_price_etb,
+    MAX(price_etb) AS max_price_etb,
+    MAX(processed_at) AS last_processed_at
+FROM
+    {{ ref('fct_product_mentions') }}
+WHERE
+    post_date IS NOT NULL
+{% if is_incremental() %}
+    AND post_date::date IN (
+        SELECT DISTINCT post_date::date
+        FROM {{ source('raw_enrichment', 'text_enriched_messages') }}
+        WHERE processed_at > (SELECT COALESCE(MAX(last_processed_at), '1900-01-01'::timestamptz) FROM {{ this }})
+    )
+{% endif %}
+GROUP BY
+    product_name, post_date::date
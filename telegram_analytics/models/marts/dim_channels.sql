@@ -1,9 +1,52 @@
+-- One row per channel. channel_name is the channel's Telegram username from raw_telegram.channels
+-- (written by the scraper), or a 'Channel <id>' placeholder until the channel's file is loaded.
+-- Incremental: channels seen in newly staged messages, or whose name changed, are (re)inserted.
+{{
+    config(
+        materialized='incremental',
+        unique_key='channel_id',
+        incremental_strategy='delete+insert',
+        on_schema_change='append_new_columns',
+        indexes=[
+            {'columns': ['channel_id'], 'unique': True},
+            {'columns': ['channel_name']},
+            {'columns': ['channel_username']},
+        ]
+    )
+}}
+
+WITH channel_info AS (
+    SELECT * FROM {{ source('raw_telegram', 'channels') }}
+),
+
+messages AS (
+    SELECT
+        channel_id,
+        MAX(loaded_at) AS last_loaded_at
+    FROM
+        {{ ref('stg_telegram_messages') }}
+    WHERE
+        channel_id IS NOT NULL
+    {% if is_incremental() %}
+        AND channel_id IN (
+            SELECT channel_id FROM {{ ref('stg_telegram_messages') }}
+            WHERE loaded_at > (SELECT COALESCE(MAX(last_loaded_at), '1900-01-01'::timestamptz) FROM {{ this }})
+            UNION
+            SELECT channel_id FROM channel_info
+            WHERE loaded_at > (SELECT COALESCE(MAX(last_loaded_at), '1900-01-01'::timestamptz) FROM {{ this }})
+        )
+    {% endif %}
+    GROUP BY
+        channel_id
+)
+
 SELECT
-    DISTINCT channel_id,
-    -- In a real project, you would join this with a table
-    -- containing channel names scraped separately.
-    'Channel ' || channel_id::text AS channel_name -- Placeholder name
+    m.channel_id,
+    COALESCE(ci.username, 'Channel ' || m.channel_id::text) AS channel_name,
+    ci.username AS channel_username,
+    ci.title AS channel_title,
+    GREATEST(m.last_loaded_at, ci.loaded_at) AS last_loaded_at
 FROM
-    {{ ref('stg_telegram_messages') }}
-WHERE
-    channel_id IS NOT NULL
\ No newline at end of file
+    messages AS m
+LEFT JOIN
+    channel_info AS ci ON ci.channel_id = m.channel_id
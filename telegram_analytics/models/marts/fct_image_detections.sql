@@ -1,25 +1,41 @@
 -- models/marts/fct_image_detections.sql
 
--- This model reads the data loaded by the 'dbt seed' command
--- and creates a final, clean fact table for image detections.
+-- This model reads the detections that src/yolo_enrichment.py bulk-loads into
+-- raw_enrichment.image_detections and creates a final, clean fact table for them.
+-- It is a view: the enrichment stage replaces an image's rows whenever it is re-detected,
+-- deduplicated or removed, and a view always shows the current rows. The source table is
+-- indexed on its key, message_id and (channel_username, post_date), which the API filters on.
+
+{{
+    config(
+        materialized='view'
+    )
+}}
 
 WITH source AS (
-    -- The ref() function points to the CSV seed file named 'image_detections.csv'
-    -- located in the 'seeds' directory.
-    SELECT * FROM {{ ref('image_detections') }}
+    SELECT * FROM {{ source('raw_enrichment', 'image_detections') }}
 )
 
 SELECT
-    -- Primary key for this table
-    image_path || '-' || detected_object_class_id || '-' || bounding_box_xyxy AS image_detection_id,
+    -- Primary key for this table: the image and the position of the box within it
+    image_path || '-' || detection_index AS image_detection_id,
 
     -- Foreign key to link back to the fct_messages table
-    message_id::bigint,
+    message_id,
+
+    -- Channel and post date from the image's data lake path: YYYY-MM-DD/<channel>/<message_id>.jpg
+    channel_username,
+    post_date,
 
     -- Details about the detection
+    detected_object_class_id,
     detected_object_name,
-    confidence_score::float,
-    bounding_box_xyxy
+    confidence_score,
+    box_x1,
+    box_y1,
+    box_x2,
+    box_y2,
+    detected_at
 
 FROM
     source
@@ -1,11 +1,32 @@
+-- Incremental on the staging model's loaded_at watermark; see stg_telegram_messages.
+{{
+    config(
+        materialized='incremental',
+        unique_key=['channel_id', 'message_id'],
+        incremental_strategy='delete+insert',
+        on_schema_change='append_new_columns',
+        indexes=[
+            {'columns': ['channel_id', 'message_id'], 'unique': True},
+            {'columns': ['message_id']},
+            {'columns': ['channel_id', 'date_dim_id']},
+            {'columns': ['loaded_at']},
+        ]
+    )
+}}
+
 SELECT
     msg.message_id,
     msg.channel_id,
     to_char(msg.post_date, 'YYYYMMDD')::integer AS date_dim_id,
     msg.view_count,
     LENGTH(msg.message_text) AS message_length,
-    msg.has_image
+    msg.has_image,
+    msg.loaded_at
 FROM
     {{ ref('stg_telegram_messages') }} msg
 JOIN
-    {{ ref('dim_channels') }} chans ON msg.channel_id = chans.channel_id
\ No newline at end of file
+    {{ ref('dim_channels') }} chans ON msg.channel_id = chans.channel_id
+
+{% if is_incremental() %}
+WHERE msg.loaded_at > (SELECT COALESCE(MAX(loaded_at), '1900-01-01'::timestamptz) FROM {{ this }})
+{% endif %}
@@ -0,0 +1,54 @@
+-- Products mentioned in message text, one row per distinct product per message, with the price
+-- quoted next to it (if any). Extracted by src/text_enrichment.py into raw_enrichment.product_mentions.
+-- Incremental on raw_enrichment.text_enriched_messages.processed_at: every message re-extracted since
+-- the last run has its rows deleted by the pre-hook and its current mentions inserted, so a message
+-- that no longer mentions any product loses its old rows too.
+-- Run `dbt run --full-refresh -s fct_product_mentions+` after `python -m src.text_enrichment --full-refresh`,
+-- and once after upgrading from the extracted_at-driven version (the pre-hook needs processed_at).
+{{
+    config(
+        materialized='incremental',
+        unique_key=['channel_id', 'message_id'],
+        incremental_strategy='delete+insert',
+        on_schema_change='append_new_columns',
+        pre_hook="""
+            {% if is_incremental() %}
+            DELETE FROM {{ this }} AS f
+            USING {{ source('raw_enrichment', 'text_enriched_messages') }} AS p
+            WHERE f.channel_id = p.channel_id
+              AND f.message_id = p.message_id
+              AND p.processed_at > (SELECT COALESCE(MAX(processed_at), '1900-01-01'::timestamptz) FROM {{ this }})
+            {% endif %}
+        """,
+        indexes=[
+            {'columns': ['channel_id', 'message_id', 'mention_index'], 'unique': True},
+            {'columns': ['product_name', 'date_dim_id']},
+            {'columns': ['processed_at']},
+        ]
+    )
+}}
+
+WITH processed AS (
+    SELECT channel_id, message_id, processed_at
+    FROM {{ source('raw_enrichment', 'text_enriched_messages') }}
+    {% if is_incremental() %}
+    WHERE processed_at > (SELECT COALESCE(MAX(processed_at), '1900-01-01'::timestamptz) FROM {{ this }})
+    {% endif %}
+)
+
+SELECT
+    pm.channel_id || '-' || pm.message_id || '-' || pm.mention_index AS product_mention_id,
+    pm.channel_id,
+    pm.message_id,
+    pm.mention_index,
+    to_char(pm.post_date, 'YYYYMMDD')::integer AS date_dim_id,
+    pm.post_date,
+    pm.product_name,
+    pm.matched_text,
+    pm.price_etb,
+    pm.extracted_at,
+    p.processed_at
+FROM
+    {{ source('raw_enrichment', 'product_mentions') }} AS pm
+JOIN
+    processed AS p ON p.channel_id = pm.channel_id AND p.message_id = pm.message_id
@@ -0,0 +1,35 @@
+-- Search table behind /api/search/messages.
+-- search_vector combines two configurations: 'english' (stemmed, for Latin-script text) and
+-- 'simple' (no stemming, so Amharic/Ge'ez words are indexed as written). It is backed by a GIN
+-- index; message_text also gets a pg_trgm GIN index for substring and fuzzy drug-name matching.
+-- Incremental on loaded_at, like stg_telegram_messages.
+{{
+    config(
+        materialized='incremental',
+        unique_key=['channel_id', 'message_id'],
+        incremental_strategy='delete+insert',
+        pre_hook="CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        post_hook="CREATE INDEX IF NOT EXISTS {{ this.name }}_text_trgm_idx ON {{ this }} USING gin (message_text gin_trgm_ops)",
+        indexes=[
+            {'columns': ['channel_id', 'message_id'], 'unique': True},
+            {'columns': ['search_vector'], 'type': 'gin'},
+        ]
+    )
+}}
+
+SELECT
+    message_id,
+    channel_id,
+    message_text,
+    view_count,
+    post_date,
+    setweight(to_tsvector('english', COALESCE(message_text, '')), 'A')
+        || setweight(to_tsvector('simple', COALESCE(message_text, '')), 'B') AS search_vector,
+    loaded_at
+FROM
+    {{ ref('stg_telegram_messages') }}
+WHERE
+    message_text IS NOT NULL AND message_text <> ''
+{% if is_incremental() %}
+    AND loaded_at > (SELECT COALESCE(MAX(loaded_at), '1900-01-01'::timestamptz) FROM {{ this }})
+{% endif %}
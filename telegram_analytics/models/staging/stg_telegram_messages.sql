@@ -1,10 +1,32 @@
+-- Incremental: each run only extracts rows loaded (or re-loaded by an upsert) since the last run.
+-- Run `dbt run --full-refresh` to rebuild from all of raw_telegram.messages.
+{{
+    config(
+        materialized='incremental',
+        unique_key=['channel_id', 'message_id'],
+        incremental_strategy='delete+insert',
+        on_schema_change='append_new_columns',
+        indexes=[
+            {'columns': ['channel_id', 'message_id'], 'unique': True},
+            {'columns': ['message_id']},
+            {'columns': ['loaded_at']},
+        ]
+    )
+}}
+
 SELECT
-    CAST((raw_message_data ->> 'id') AS BIGINT) AS message_id,
-    CAST((raw_message_data -> 'peer_id' ->> 'channel_id') AS BIGINT) AS channel_id,
+    -- Stored key columns generated from the JSON by src/load_raw_data.py
+    message_id,
+    channel_id,
     raw_message_data ->> 'message' AS message_text,
     CAST((raw_message_data ->> 'date') AS TIMESTAMPTZ) AS post_date,
     CAST((raw_message_data ->> 'views') AS INTEGER) AS view_count,
-    (raw_message_data -> 'photo') IS NOT NULL AS has_image
+    (raw_message_data -> 'photo') IS NOT NULL AS has_image,
+    loaded_at
 
 FROM
     {{ source('raw_telegram', 'messages') }}
+
+{% if is_incremental() %}
+WHERE loaded_at > (SELECT COALESCE(MAX(loaded_at), '1900-01-01'::timestamptz) FROM {{ this }})
+{% endif %}
@@ -0,0 +1,11 @@
+{% test assert_unique_combination(model, combination_of_columns) %}
+SELECT
+    {{ combination_of_columns | join(', ') }},
+    COUNT(*) AS row_count
+FROM
+    {{ model }}
+GROUP BY
+    {{ combination_of_columns | join(', ') }}
+HAVING
+    COUNT(*) > 1
+{% endtest %}
@@ -0,0 +1,59 @@
+"""Checks the SQL the Postgres query functions build (without a database) and the pagination cursors."""
+import asyncio
+import re
+
+import pytest
+
+from src.api import crud
+from src.api.schemas import SearchMode
+
+
+class RecordingSession:
+    """Stands in for an AsyncSession: records each statement and returns no rows."""
+
+    def __init__(self):
+        self.statements = []
+
+    async def execute(self, statement, params=None):
+        self.statements.append(str(statement))
+        return self
+
+    def fetchall(self):
+        return []
+
+
+def _parse(sql: str):
+    pglast = pytest.importorskip("pglast")
+    # pglast speaks Postgres' own syntax, so turn SQLAlchemy's :name binds into $n parameters
+    return pglast.parse_sql(re.sub(r"(?<![:\w]):\w+", "$1", sql))
+
+
+@pytest.mark.parametrize("mode", list(SearchMode))
+@pytest.mark.parametrize("with_cursor", [False, True])
+def test_search_sql_parses(mode, with_cursor):
+    session = RecordingSession()
+    cursor = crud.encode_cursor(repr(0.5), 1, 2) if with_cursor else None
+    asyncio.run(crud.search_messages_by_keyword(session, "paracetamol 500mg", mode=mode, cursor=cursor))
+    assert session.statements
+    for sql in session.statements:
+        _parse(sql)
+
+
+def test_cursor_round_trip():
+    cursor = crud.encode_cursor(repr(0.1 + 0.2), -100123, 42)
+    assert crud.decode_cursor(cursor, float, int, int) == (0.1 + 0.2, -100123, 42)
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!",
+    crud.encode_cursor("0.5"),
+    crud.encode_cursor("0.5", 1, 2, 3),
+    crud.encode_cursor("high", 1, 2),
+    crud.encode_cursor("0.5", "one", 2),
+    crud.encode_cursor("nan", 1, 2),
+    "//79",
+])
+def test_invalid_cursor_is_rejected_without_echoing_it(cursor):
+    with pytest.raises(ValueError) as excinfo:
+        crud.decode_cursor(cursor, float, int, int)
+    assert str(excinfo.value) == "Invalid cursor"
@@ -0,0 +1,43 @@
+"""Tests for the NumPy non-max suppression used by the ONNX detector backends."""
+import numpy as np
+
+from src.detectors import non_max_suppression
+
+
+def _prediction(boxes, scores):
+    """Builds a raw YOLOv8 output: rows cx, cy, w, h then one score row per class, one column per anchor."""
+    return np.concatenate([np.asarray(boxes, dtype=np.float32).T, np.asarray(scores, dtype=np.float32).T])
+
+
+def test_overlapping_boxes_of_one_class_keep_the_most_confident():
+    prediction = _prediction(
+        [[50, 50, 20, 20], [51, 51, 20, 20], [150, 150, 20, 20]],
+        [[0.6, 0.0], [0.9, 0.0], [0.0, 0.8]],
+    )
+    class_ids, confidences, boxes = non_max_suppression(prediction)
+    assert class_ids.tolist() == [0, 1]
+    np.testing.assert_allclose(confidences, [0.9, 0.8])
+    np.testing.assert_allclose(boxes, [[41, 41, 61, 61], [140, 140, 160, 160]])
+
+
+def test_overlapping_boxes_of_different_classes_are_both_kept():
+    prediction = _prediction([[50, 50, 20, 20], [50, 50, 20, 20]], [[0.9, 0.0], [0.0, 0.7]])
+    class_ids, _, _ = non_max_suppression(prediction)
+    assert class_ids.tolist() == [0, 1]
+
+
+def test_low_confidence_boxes_are_dropped_and_max_detections_applies():
+    prediction = _prediction(
+        [[10 + 40 * i, 10, 10, 10] for i in range(5)],
+        [[0.9 - 0.1 * i] for i in range(4)] + [[0.1]],
+    )
+    class_ids, confidences, _ = non_max_suppression(prediction, max_detections=3)
+    assert class_ids.tolist() == [0, 0, 0]
+    np.testing.assert_allclose(confidences, [0.9, 0.8, 0.7])
+    assert len(non_max_suppression(prediction)[0]) == 4
+
+
+def test_no_candidates():
+    class_ids, confidences, boxes = non_max_suppression(_prediction([[10, 10, 5, 5]], [[0.1]]))
+    assert class_ids.size == confidences.size == 0
+    assert boxes.shape == (0, 4)
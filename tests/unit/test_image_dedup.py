@@ -0,0 +1,35 @@
+from src.image_dedup import BKTree
+
+
+def test_nearest_on_empty_tree():
+    assert BKTree().nearest(0b1010, 4) is None
+
+
+def test_nearest_returns_the_closest_item_within_the_distance():
+    tree = BKTree()
+    tree.add(0b0000_0000, "a")
+    tree.add(0b0000_1111, "b")
+    tree.add(0b1111_1111, "c")
+    assert len(tree) == 3
+    assert tree.nearest(0b0000_0111, 2) == (1, "b")
+    assert tree.nearest(0b0000_0001, 8) == (1, "a")
+    assert tree.nearest(0b1111_0000, 3) is None
+
+
+def test_nearest_exact_match():
+    tree = BKTree()
+    for value in range(64):
+        tree.add(value, value)
+    assert tree.nearest(42, 5) == (0, 42)
+
+
+def test_nearest_matches_a_linear_scan():
+    values = [(i * 0x9E3779B97F4A7C15) & ((1 << 64) - 1) for i in range(200)]
+    tree = BKTree()
+    for value in values:
+        tree.add(value, value)
+    for query in values[:20]:
+        query ^= 0b1011
+        expected = min(bin(query ^ value).count("1") for value in values)
+        found = tree.nearest(query, 10)
+        assert found is not None and found[0] == expected
@@ -0,0 +1,70 @@
+from decimal import Decimal
+
+import pytest
+
+from src import text_enrichment
+
+ALIASES = {
+    "paracetamol": "Paracetamol",
+    "panadol": "Paracetamol",
+    "vitamin": "Vitamin",
+    "vitamin c": "Vitamin C",
+}
+
+
+@pytest.fixture(scope="module")
+def automaton():
+    return text_enrichment.build_automaton(ALIASES)
+
+
+@pytest.mark.parametrize("text, amount", [
+    ("350 ETB", Decimal("350")),
+    ("1,200 birr", Decimal("1200")),
+    ("ETB 99.50", Decimal("99.50")),
+    ("Br. 450", Decimal("450")),
+    ("ዋጋ 250", Decimal("250")),
+    ("Price: 75", Decimal("75")),
+    ("800ብር", Decimal("800")),
+])
+def test_find_prices(text, amount):
+    assert [price for _, price in text_enrichment.find_prices(text)] == [amount]
+
+
+def test_find_prices_ignores_plain_numbers_and_phone_numbers():
+    assert text_enrichment.find_prices("Call 0911234567, 2 boxes left") == []
+    assert text_enrichment.find_prices("0 birr") == []
+
+
+def test_find_phone_numbers_normalizes_and_dedupes():
+    text = "Call +251 911 234 567 or 0911-234-567, landline 011 123 4567, Safaricom 0712345678"
+    assert text_enrichment.find_phone_numbers(text) == ["+251911234567", "+251111234567", "+251712345678"]
+
+
+def test_find_phone_numbers_rejects_unknown_prefixes_and_long_digit_runs():
+    assert text_enrichment.find_phone_numbers("0811234567") == []
+    assert text_enrichment.find_phone_numbers("09112345678") == []
+
+
+def test_extract_message_assigns_prices_to_the_preceding_product(automaton):
+    mentions, phones = text_enrichment.extract_message(
+        automaton, "Panadol 120 ETB, Vitamin C 300 birr. Call 0911234567"
+    )
+    assert mentions == [
+        ("Paracetamol", "Panadol", Decimal("120")),
+        ("Vitamin C", "Vitamin C", Decimal("300")),
+    ]
+    assert phones == ["+251911234567"]
+
+
+def test_extract_message_matches_whole_words_only(automaton):
+    mentions, _ = text_enrichment.extract_message(automaton, "multivitamins and paracetamol")
+    assert mentions == [("Paracetamol", "paracetamol", None)]
+
+
+def test_extract_message_keeps_one_mention_per_product(automaton):
+    mentions, _ = text_enrichment.extract_message(automaton, "ETB 50 paracetamol, more paracetamol 60 ETB")
+    assert mentions == [("Paracetamol", "paracetamol", Decimal("50"))]
+
+
+def test_extract_message_without_products_still_returns_phone_numbers(automaton):
+    assert text_enrichment.extract_message(automaton, "Open 24/7, +251911234567") == ([], ["+251911234567"])